@@ -0,0 +1,161 @@
+"""
+Check the vectorized interval algebra of `custom_calculations.intervals` against straightforward reference
+implementations, on random intervals, and time both.
+
+The references loop over the intervals one by one in pure Python. Every operation is run on random, partly overlapping
+and touching intervals with random gaps and durations (on a coarse time grid, so edge cases such as touching intervals
+and equal boundaries are frequent); the command prints the time of both implementations, and exits with status 1
+when any result differs, so it can be used as a check in CI.
+
+    python benchmarks/check_intervals.py
+    python benchmarks/check_intervals.py --size 5000000 --repeat 3
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from custom_calculations import intervals  # noqa: E402
+
+GRID = 60 * 10**9  # one minute
+
+
+def reference_merge(starts, ends):
+    merged = []
+    for start, end in sorted(zip(starts.tolist(), ends.tolist())):
+        if end <= start:
+            continue
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def reference_intersection(a, b):
+    result = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        start, end = max(a[i][0], b[j][0]), min(a[i][1], b[j][1])
+        if start < end:
+            if result and result[-1][1] == start:
+                result[-1][1] = end
+            else:
+                result.append([start, end])
+        if a[i][1] < b[j][1]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+def reference_difference(a, b):
+    result = []
+    j = 0
+    for start, end in a:
+        while j < len(b) and b[j][1] <= start:
+            j += 1
+        k = j
+        while k < len(b) and b[k][0] < end:
+            if b[k][0] > start:
+                result.append([start, b[k][0]])
+            start = max(start, b[k][1])
+            k += 1
+        if start < end:
+            result.append([start, end])
+    return result
+
+
+def reference_merge_gaps(ranges, max_gap):
+    result = []
+    for start, end in ranges:
+        if result and start - result[-1][1] <= max_gap:
+            result[-1][1] = end
+        else:
+            result.append([start, end])
+    return result
+
+
+def random_intervals(rng, size):
+    """
+    Random intervals on a one-minute grid: unsorted, with about a quarter of them overlapping or touching another.
+    """
+    gaps = rng.integers(-5, 20, size) * GRID
+    durations = rng.integers(0, 30, size) * GRID
+    starts = np.cumsum(gaps + durations) - durations
+    order = rng.permutation(size)
+    return starts[order], (starts + durations)[order]
+
+
+def as_list(starts, ends):
+    return [[start, end] for start, end in zip(starts.tolist(), ends.tolist())]
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def cases(rng, size):
+    """
+    (name, vectorized call, reference call) for every operation.
+    """
+    a_starts, a_ends = intervals.merge(*random_intervals(rng, size))
+    b_starts, b_ends = intervals.merge(*random_intervals(rng, size))
+    a, b = as_list(a_starts, a_ends), as_list(b_starts, b_ends)
+    raw_starts, raw_ends = random_intervals(rng, size)
+    window_start, window_end = int(a_starts[len(a) // 4]) + GRID // 2, int(a_ends[3 * len(a) // 4])
+    max_gap = 5 * GRID
+    return [
+        ("merge", lambda: intervals.merge(raw_starts, raw_ends), lambda: reference_merge(raw_starts, raw_ends)),
+        ("union", lambda: intervals.union(a_starts, a_ends, b_starts, b_ends), lambda: reference_merge(
+            np.array([r[0] for r in a + b], dtype=np.int64), np.array([r[1] for r in a + b], dtype=np.int64))),
+        ("intersection", lambda: intervals.intersection(a_starts, a_ends, b_starts, b_ends),
+         lambda: reference_intersection(a, b)),
+        ("difference", lambda: intervals.difference(a_starts, a_ends, b_starts, b_ends),
+         lambda: reference_difference(a, b)),
+        ("complement", lambda: intervals.complement(a_starts, a_ends, window_start, window_end),
+         lambda: reference_difference([[window_start, window_end]], a)),
+        ("merge_gaps", lambda: intervals.merge_gaps(a_starts, a_ends, max_gap),
+         lambda: reference_merge_gaps(a, max_gap)),
+        ("filter_duration", lambda: intervals.filter_duration(a_starts, a_ends, 10 * GRID, 60 * GRID),
+         lambda: [r for r in a if 10 * GRID <= r[1] - r[0] <= 60 * GRID]),
+        ("extend", lambda: intervals.extend(a_starts, a_ends, before=GRID, after=-3 * GRID),
+         lambda: reference_merge(a_starts - GRID, a_ends - 3 * GRID)),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=1_000_000, help="number of intervals per input")
+    parser.add_argument("--repeat", type=int, default=1, help="number of random inputs to check")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random inputs")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    failed = []
+    for _ in range(args.repeat):
+        for name, vectorized, reference in cases(rng, args.size):
+            (starts, ends), vectorized_time = timed(vectorized)
+            expected, reference_time = timed(reference)
+            ok = as_list(starts, ends) == expected
+            if not ok:
+                failed.append(name)
+            print(
+                f"{name:<16} {len(starts):>9} intervals  {vectorized_time:>8.3f} s"
+                f"  (reference {reference_time:>8.3f} s, {reference_time / max(vectorized_time, 1e-9):>6.0f}x)"
+                f"  {'ok' if ok else 'MISMATCH'}"
+            )
+
+    if failed:
+        print(f"\nResults differ from the reference for: {', '.join(sorted(set(failed)))}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+"""
+Offline stand-in for the parts of the `trendminer` SDK used by the example scripts, to run them without a TrendMiner
+appliance (e.g., in benchmarks).
+
+All signals are deterministic functions of time, so any interval can be requested and the same timestamp always has
+the same value. Analog tags follow a sum of sine waves with a bit of pseudo-random noise; digital tags alternate
+between two states in blocks of which the length follows from `events_per_day`. No data exists after `now` (the
+indexing horizon of all tags). Every API call sleeps for `latency` seconds (plus `point_latency` per returned data
+point), and is counted in `client.calls`.
+
+    import fake_trendminer
+    fake_trendminer.install(now="2026-01-01", latency=0.05)  # makes `import trendminer` return this module
+    client = TrendMinerClient.from_token(token="...", tz="Europe/Brussels")
+"""
+import enum
+import sys
+import threading
+import time
+import types
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+# Signal definitions of the tags used in the example scripts; other tags get the default analog signal
+TAGS = {
+    "[CS]BA:CONC.1": {"type": "analog", "mean": 40.0, "amplitude": 15.0, "noise": 2.0},
+    "[CS]BA:LEVEL.1": {"type": "analog", "mean": 10.0, "amplitude": 12.0, "noise": 0.5},
+    "[CS]BA:ACTIVE.1": {"type": "digital", "states": ("Inactive", "Active")},
+    "TM_day_Europe_Brussels": {"type": "day"},
+    "TM5-HEX-TI0620": {"type": "analog", "mean": 75.0, "amplitude": 10.0, "noise": 0.3},
+    "TM5-HEX-PI06201": {"type": "analog", "mean": 5.0, "amplitude": 2.0, "noise": 0.2},
+    "TM5-HEX-QI0620": {"type": "analog", "mean": 975.0, "amplitude": 5.0, "noise": 0.5},
+    "TM5-HEX-FI0620": {"type": "analog", "mean": 0.01, "amplitude": 0.004, "noise": 0.0005},
+}
+DEFAULT_TAG = {"type": "analog", "mean": 50.0, "amplitude": 20.0, "noise": 1.0}
+
+# Settings of the fake appliance, changed with `install`
+SETTINGS = {
+    "now": pd.Timestamp("2026-01-01", tz="UTC"),
+    "history": pd.Timedelta("2200D"),
+    "latency": 0.0,
+    "point_latency": 0.0,
+    "events_per_day": 24.0,
+}
+
+_calls = Counter()
+_calls_lock = threading.Lock()
+
+
+def _pseudo_random(x):
+    """
+    Deterministic values in [0, 1) for an array of numbers.
+    """
+    return np.modf(np.abs(np.sin(x * 12.9898 + 78.233) * 43758.5453))[0]
+
+
+def _api_call(name, points=0):
+    with _calls_lock:
+        _calls[name] += 1
+    delay = SETTINGS["latency"] + SETTINGS["point_latency"] * points
+    if delay > 0:
+        time.sleep(delay)
+
+
+class TagCalculationOptions(enum.Enum):
+    MEAN = "MEAN"
+    MINIMUM = "MIN"
+    MAXIMUM = "MAX"
+    RANGE = "RANGE"
+    START = "START"
+    END = "END"
+    DELTA = "DELTA"
+    INTEGRAL = "INTEGRAL"
+    STDEV = "STDEV"
+
+
+SearchCalculationOptions = TagCalculationOptions
+
+
+class ValueBasedSearchOperators(enum.Enum):
+    LESS_THAN = "<"
+    LESS_THAN_OR_EQUAL = "<="
+    GREATER_THAN = ">"
+    GREATER_THAN_OR_EQUAL = ">="
+    EQUAL = "="
+    NOT_EQUAL = "!="
+    IN_SET = "IN"
+    NOT_IN_SET = "NOT IN"
+
+
+class Interval(dict):
+    """
+    Time interval, of which calculation results can be stored by key.
+    """
+
+    def __init__(self, start, end):
+        super().__init__()
+        self.start = start
+        self.end = end
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+    def __repr__(self):
+        return f"Interval({self.start}, {self.end})"
+
+
+class IntervalFactory:
+    def __init__(self, client):
+        self.client = client
+
+    def __call__(self, start, end):
+        return Interval(self.client.time.datetime(start), self.client.time.datetime(end))
+
+    def range(self, freq, start, end, normalize=False):
+        """
+        Consecutive intervals of frequency `freq` between `start` and `end`.
+        """
+        boundaries = pd.date_range(
+            self.client.time.datetime(start),
+            self.client.time.datetime(end),
+            freq=freq,
+            normalize=normalize,
+        )
+        return [Interval(interval_start, interval_end) for interval_start, interval_end in zip(boundaries[:-1],
+                                                                                                boundaries[1:])]
+
+
+class TimeClient:
+    def __init__(self, client):
+        self.client = client
+        self.interval = IntervalFactory(client)
+
+    def now(self):
+        return SETTINGS["now"].tz_convert(self.client.tz)
+
+    def datetime(self, timestamp):
+        timestamp = pd.Timestamp(timestamp)
+        if timestamp.tz is None:
+            return timestamp.tz_localize(self.client.tz)
+        return timestamp.tz_convert(self.client.tz)
+
+    @staticmethod
+    def timedelta(duration):
+        return pd.Timedelta(duration)
+
+
+class Tag:
+    """
+    Tag of which the data is generated from its signal definition.
+    """
+
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+        self.identifier = f"fake-{name}"
+        self.definition = TAGS.get(name, DEFAULT_TAG)
+        self.phase = float(_pseudo_random(np.array([sum(map(ord, name))]))[0]) * 2 * np.pi
+
+    def _index(self, start, end, resolution):
+        """
+        Grid of timestamps at `resolution` in [start, end], limited to the available history.
+        """
+        step = pd.Timedelta(resolution).value
+        now = SETTINGS["now"].value
+        first = max(pd.Timestamp(start).value, now - SETTINGS["history"].value)
+        last = min(pd.Timestamp(end).value, now)
+        if last < first:
+            return np.empty(0, dtype=np.int64)
+        first = -(-first // step) * step
+        return first + step * np.arange((last - first) // step + 1, dtype=np.int64)
+
+    def _values(self, timestamps):
+        definition = self.definition
+        days = timestamps / 86_400e9
+        if definition["type"] == "analog":
+            return (
+                definition["mean"]
+                + definition["amplitude"] * (0.8 * np.sin(2 * np.pi * days + self.phase)
+                                             + 0.2 * np.sin(2 * np.pi * days * 3.7 + 2 * self.phase))
+                + definition["noise"] * (_pseudo_random(np.floor(days * 1440)) - 0.5)
+            )
+        if definition["type"] == "digital":
+            # Blocks of which the first part (between 20% and 80% of the block) is in the second state
+            blocks = days * SETTINGS["events_per_day"]
+            block = np.floor(blocks)
+            duty = 0.2 + 0.6 * _pseudo_random(block + self.phase)
+            return np.where(blocks - block < duty, definition["states"][1], definition["states"][0]).astype(object)
+        return (
+            pd.DatetimeIndex(timestamps.astype("datetime64[ns]"), tz="UTC")
+            .tz_convert("Europe/Brussels")
+            .day_name()
+            .to_numpy(dtype=object)
+        )
+
+    def _series(self, timestamps):
+        index = pd.DatetimeIndex(timestamps.astype("datetime64[ns]"), tz="UTC").tz_convert(self.client.tz)
+        return pd.Series(index=index, data=self._values(timestamps), name=self.name)
+
+    def get_data(self, interval, resolution="1m"):
+        timestamps = self._index(interval.start, interval.end, resolution)
+        _api_call("tag.get_data", len(timestamps))
+        return self._series(timestamps)
+
+    def get_plot_data(self, interval, n_intervals=300):
+        # The first and last point of every plot interval
+        timestamps = self._index(interval.start, interval.end, self.client.resolution)
+        if len(timestamps) > 0:
+            positions = np.linspace(0, len(timestamps) - 1, 2 * n_intervals).round().astype(int)
+            timestamps = np.unique(timestamps[positions])
+        _api_call("tag.get_plot_data", len(timestamps))
+        return self._series(timestamps)
+
+    def _calculate(self, interval, operation):
+        data = self._series(self._index(interval.start, interval.end, self.client.resolution))
+        if data.empty or not pd.api.types.is_numeric_dtype(data.dtype):
+            return None
+        values = data.to_numpy(dtype=float)
+        operation = TagCalculationOptions(operation)
+        if operation is TagCalculationOptions.INTEGRAL:
+            # Integral with time expressed in days
+            seconds = (data.index - data.index[0]).total_seconds().to_numpy()
+            return float(np.sum((values[1:] + values[:-1]) / 2 * np.diff(seconds)) / 86_400)
+        return float({
+            TagCalculationOptions.MEAN: np.mean,
+            TagCalculationOptions.MINIMUM: np.min,
+            TagCalculationOptions.MAXIMUM: np.max,
+            TagCalculationOptions.RANGE: np.ptp,
+            TagCalculationOptions.START: lambda x: x[0],
+            TagCalculationOptions.END: lambda x: x[-1],
+            TagCalculationOptions.DELTA: lambda x: x[-1] - x[0],
+            TagCalculationOptions.STDEV: np.std,
+        }[operation](values))
+
+    def calculate(self, intervals, operation, key, inplace=False):
+        _api_call("tag.calculate")
+        if not inplace:
+            intervals = [Interval(interval.start, interval.end) for interval in intervals]
+        for interval in intervals:
+            interval[key] = self._calculate(interval, operation)
+        return intervals
+
+
+class TagClient:
+    def __init__(self, client):
+        self.client = client
+
+    def get_by_name(self, name):
+        _api_call("tag.get_by_name")
+        return Tag(self.client, name)
+
+
+class ValueBasedSearch:
+    """
+    Value-based search evaluated on the data of the query tags at the client resolution.
+    """
+
+    def __init__(self, client, queries, duration=None, calculations=None):
+        self.client = client
+        self.queries = queries
+        self.duration = pd.Timedelta(duration) if duration is not None else pd.Timedelta(0)
+        self.calculations = calculations or {}
+
+    @staticmethod
+    def _evaluate(values, operator, reference):
+        operator = ValueBasedSearchOperators(operator)
+        if operator is ValueBasedSearchOperators.IN_SET:
+            return np.isin(values, list(reference))
+        if operator is ValueBasedSearchOperators.NOT_IN_SET:
+            return ~np.isin(values, list(reference))
+        return {
+            ValueBasedSearchOperators.LESS_THAN: np.less,
+            ValueBasedSearchOperators.LESS_THAN_OR_EQUAL: np.less_equal,
+            ValueBasedSearchOperators.GREATER_THAN: np.greater,
+            ValueBasedSearchOperators.GREATER_THAN_OR_EQUAL: np.greater_equal,
+            ValueBasedSearchOperators.EQUAL: np.equal,
+            ValueBasedSearchOperators.NOT_EQUAL: np.not_equal,
+        }[operator](values, reference)
+
+    def get_results(self, interval):
+        tags = [query[0] for query in self.queries]
+        timestamps = tags[0]._index(interval.start, interval.end, self.client.resolution)
+        match = np.ones(len(timestamps), dtype=bool)
+        for tag, operator, reference in self.queries:
+            match &= self._evaluate(tag._values(timestamps), operator, reference)
+
+        # Runs of matching points; a run ends at the first point that does not match (or at the last point)
+        edges = np.diff(np.concatenate([[0], match.astype(np.int8), [0]]))
+        starts = timestamps[np.flatnonzero(edges == 1)]
+        stops = np.flatnonzero(edges == -1)
+        ends = timestamps[np.minimum(stops, len(timestamps) - 1)]
+        keep = (ends - starts) >= self.duration.value
+
+        results = [
+            Interval(start, end) for start, end in zip(
+                pd.DatetimeIndex(starts[keep].astype("datetime64[ns]"), tz="UTC").tz_convert(self.client.tz),
+                pd.DatetimeIndex(ends[keep].astype("datetime64[ns]"), tz="UTC").tz_convert(self.client.tz),
+            )
+        ]
+        for key, (tag, operation) in self.calculations.items():
+            for result in results:
+                result[key] = tag._calculate(result, operation)
+        _api_call("search.get_results", len(timestamps))
+        return results
+
+
+class SearchClient:
+    def __init__(self, client):
+        self.client = client
+
+    def value(self, queries, duration=None, calculations=None):
+        return ValueBasedSearch(self.client, queries, duration=duration, calculations=calculations)
+
+
+class TrendMinerClient:
+    """
+    Fake client with the same interface as `trendminer.TrendMinerClient`, as far as it is used by the scripts.
+    """
+
+    def __init__(self, tz="UTC"):
+        self.tz = tz
+        self.resolution = pd.Timedelta("1m")
+        self.time = TimeClient(self)
+        self.tag = TagClient(self)
+        self.search = SearchClient(self)
+        self.calls = _calls
+
+    @classmethod
+    def from_token(cls, token=None, tz="UTC", **kwargs):
+        _api_call("from_token")
+        return cls(tz=tz)
+
+
+def install(**settings):
+    """
+    Update the fake appliance `SETTINGS`, reset the call counts, and register this module as the `trendminer`
+    package (and its `trendminer.sdk.tag` and `trendminer.sdk.search` modules).
+    """
+    for key, value in settings.items():
+        if key not in SETTINGS:
+            raise ValueError(f"Unknown setting '{key}'")
+        if key == "now":
+            value = pd.Timestamp(value, tz="UTC") if pd.Timestamp(value).tz is None else pd.Timestamp(value)
+        elif key == "history":
+            value = pd.Timedelta(value)
+        SETTINGS[key] = value
+    _calls.clear()
+
+    module = sys.modules[__name__]
+    sdk = types.ModuleType("trendminer.sdk")
+    sdk.tag = types.ModuleType("trendminer.sdk.tag")
+    sdk.tag.TagCalculationOptions = TagCalculationOptions
+    sdk.search = types.ModuleType("trendminer.sdk.search")
+    sdk.search.ValueBasedSearchOperators = ValueBasedSearchOperators
+    sdk.search.SearchCalculationOptions = SearchCalculationOptions
+    module.sdk = sdk
+    sys.modules.update({
+        "trendminer": module,
+        "trendminer.sdk": sdk,
+        "trendminer.sdk.tag": sdk.tag,
+        "trendminer.sdk.search": sdk.search,
+    })
+    return _calls
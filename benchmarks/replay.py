@@ -0,0 +1,676 @@
+"""
+Record the TrendMiner SDK responses of an example script run to a local fixture, and replay the script against the
+fixture offline, to compare performance and check that a change does not alter the output.
+
+`record` runs the script unchanged, with `trendminer.TrendMinerClient.from_token` patched to return a recording proxy:
+every `tag.get_by_name`, `tag.get_data`, `tag.get_plot_data`, `tag.calculate` and search `get_results` response (and
+the `time.now` and `time.interval.range` results, which the appliance decides as well) is stored under a key of the
+method and its arguments (the tag or search definition, and interval boundaries in epoch nanoseconds). The fixture is
+a directory with the call index as JSON, the timestamps and values as compressed arrays, and the output of the run.
+
+`replay` runs the script against a replay client serving the recorded responses, optionally sleeping for a fixed
+`--latency` per call (or the recorded wall time of each call with `--latency recorded`), and checks that the output is
+identical, byte for byte, to the recorded output. A request that was not recorded fails the run, as does any
+difference in the output; the command then exits with status 1, so it can be used as a regression test.
+
+    ACCESS_TOKEN=... python benchmarks/replay.py record kwh_totalizer --fixture fixtures/kwh_totalizer_30d \\
+        --start 2026-09-01T00:00:00Z --end 2026-10-01T00:00:00Z
+    python benchmarks/replay.py replay kwh_totalizer --fixture fixtures/kwh_totalizer_30d --latency recorded
+
+Every run happens in a fresh subprocess with its own temporary directory, so file-backed caches start cold. Pass
+`--fake` to `record` to record against the offline stand-in (`fake_trendminer`) instead of a TrendMiner appliance.
+"""
+import argparse
+import datetime
+import enum
+import filecmp
+import hashlib
+import json
+import os
+import runpy
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIR = os.path.dirname(BENCHMARK_DIR)
+
+INDEX_FILE = "calls.json"
+ARRAYS_FILE = "arrays.npz"
+OUTPUT_FILE = "output.csv"
+FORMAT_VERSION = 1
+
+
+class NotRecordedError(LookupError):
+    """
+    A request of the replayed script that is not in the fixture.
+    """
+
+
+def _tag_key(tag):
+    # Same as `custom_calculations.horizon.tag_key`, which is not imported here so the caches of the script start cold
+    return str(getattr(tag, "identifier", None) or tag.name)
+
+
+def _canonical(value):
+    """
+    JSON-serializable form of a request argument, equal for equal requests in the recording and the replayed run.
+    """
+    if isinstance(value, enum.Enum):
+        return value.name
+    if isinstance(value, (datetime.datetime, np.datetime64)):
+        return pd.Timestamp(value).value
+    if isinstance(value, (datetime.timedelta, np.timedelta64)):
+        return pd.Timedelta(value).value
+    if hasattr(value, "start") and hasattr(value, "end"):
+        return [_canonical(value.start), _canonical(value.end)]
+    if hasattr(value, "get_data"):
+        return {"tag": _tag_key(value)}
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, dict):
+        return {str(key): _canonical(item) for key, item in sorted(value.items(), key=lambda pair: str(pair[0]))}
+    if isinstance(value, (list, tuple, set, frozenset)):
+        items = sorted(value, key=str) if isinstance(value, (set, frozenset)) else value
+        return [_canonical(item) for item in items]
+    if (value is None) or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+def request_key(method, *args, **kwargs):
+    """
+    Key of a request: a hash of the method and its canonical arguments.
+    """
+    request = [method, _canonical(list(args)), _canonical(kwargs)]
+    return hashlib.sha1(json.dumps(request, sort_keys=True).encode()).hexdigest()
+
+
+def _search_definition(queries, duration=None, calculations=None, **kwargs):
+    return {"queries": queries, "duration": duration, "calculations": calculations, **kwargs}
+
+
+class _Arrays:
+    """
+    Named arrays of a fixture.
+    """
+
+    def __init__(self, arrays=None):
+        self.arrays = dict(arrays or {})
+
+    def add(self, array):
+        name = f"a{len(self.arrays)}"
+        self.arrays[name] = array
+        return name
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+
+def _json_value(value):
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, (datetime.datetime, np.datetime64)):
+        return {"timestamp": pd.Timestamp(value).value}
+    return value
+
+
+def _python_value(value):
+    return pd.Timestamp(value["timestamp"], tz="UTC") if isinstance(value, dict) else value
+
+
+def _encode_index(index, arrays):
+    index = pd.DatetimeIndex(index)
+    return {
+        "index": arrays.add(index.as_unit("ns").asi8),
+        "tz": None if index.tz is None else str(index.tz),
+        "unit": index.unit,
+        "index_name": index.name,
+    }
+
+
+def _decode_index(encoded, arrays):
+    index = pd.DatetimeIndex(arrays[encoded["index"]].astype("datetime64[ns]"), name=encoded["index_name"])
+    if encoded["tz"] is not None:
+        index = index.tz_localize("UTC").tz_convert(encoded["tz"])
+    return index.as_unit(encoded["unit"])
+
+
+def _encode_values(values, arrays):
+    """
+    Numeric values as an array; other values (e.g., the states of a digital tag) as codes into a list of categories.
+    """
+    if values.dtype.kind in "biuf":
+        return {"values": arrays.add(values.to_numpy())}
+    codes, categories = pd.factorize(values, use_na_sentinel=True)
+    missing = values[pd.isna(values)]
+    return {
+        "codes": arrays.add(codes.astype(np.int32)),
+        "categories": [_json_value(category) for category in categories],
+        "missing": "NaN" if (len(missing) > 0) and isinstance(missing.iloc[0], float) else None,
+    }
+
+
+def _decode_values(encoded, arrays):
+    if "values" in encoded:
+        return arrays[encoded["values"]]
+    categories = np.array([_python_value(category) for category in encoded["categories"]] + [None], dtype=object)
+    codes = arrays[encoded["codes"]]
+    values = categories[codes]  # code -1 is the missing value at the end
+    if encoded["missing"] == "NaN":
+        values[codes == -1] = np.nan
+    return values
+
+
+def _encode_intervals(intervals, arrays):
+    if len(intervals) == 0:
+        return {"type": "intervals", "starts": None, "columns": {}}
+    columns = {}
+    for interval in intervals:
+        for key in interval.keys():
+            columns.setdefault(key, None)
+    return {
+        "type": "intervals",
+        "starts": _encode_index([interval.start for interval in intervals], arrays),
+        "ends": _encode_index([interval.end for interval in intervals], arrays),
+        "columns": {
+            key: [_json_value(interval.get(key)) for interval in intervals] for key in columns
+        },
+        "missing": [
+            key for key in columns if any(key not in interval for interval in intervals)
+        ],
+    }
+
+
+def encode(response, arrays):
+    """
+    JSON-serializable description of an SDK response, with its bulk data added to `arrays`.
+    """
+    if response is None:
+        return {"type": "none"}
+    if isinstance(response, pd.Series):
+        return {
+            "type": "series",
+            "name": _json_value(response.name),
+            "dtype": str(response.dtype),
+            **_encode_index(response.index, arrays),
+            **_encode_values(response, arrays),
+        }
+    if isinstance(response, pd.Timestamp):
+        return {"type": "timestamp", "value": response.value, "tz": None if response.tz is None else str(response.tz),
+                "unit": response.unit}
+    if isinstance(response, list) and all(hasattr(item, "start") and hasattr(item, "end") for item in response):
+        return _encode_intervals(response, arrays)
+    raise TypeError(f"Cannot record a response of type {type(response).__name__}")
+
+
+def _decode_timestamp(encoded):
+    timestamp = pd.Timestamp(encoded["value"], tz="UTC" if encoded["tz"] is not None else None)
+    if encoded["tz"] is not None:
+        timestamp = timestamp.tz_convert(encoded["tz"])
+    return timestamp.as_unit(encoded["unit"])
+
+
+def decode_intervals(encoded, arrays, interval_class, intervals=None):
+    """
+    Recorded intervals, as new `interval_class(start, end)` objects or, when given, by storing the recorded values in
+    `intervals` (for in-place calculations).
+    """
+    if encoded["starts"] is None:
+        return intervals if intervals is not None else []
+    if intervals is None:
+        starts, ends = _decode_index(encoded["starts"], arrays), _decode_index(encoded["ends"], arrays)
+        intervals = [interval_class(start, end) for start, end in zip(starts, ends)]
+    for key, values in encoded["columns"].items():
+        missing = key in encoded["missing"]
+        for interval, value in zip(intervals, values):
+            if not (missing and value is None):
+                interval[key] = _python_value(value)
+    return intervals
+
+
+def decode(encoded, arrays, interval_class):
+    """
+    A fresh copy of the recorded response (see `encode`).
+    """
+    if encoded["type"] == "none":
+        return None
+    if encoded["type"] == "series":
+        return pd.Series(
+            _decode_values(encoded, arrays),
+            index=_decode_index(encoded, arrays),
+            name=_python_value(encoded["name"]),
+            dtype=encoded["dtype"],
+        )
+    if encoded["type"] == "timestamp":
+        return _decode_timestamp(encoded)
+    return decode_intervals(encoded, arrays, interval_class)
+
+
+class Recorder:
+    """
+    Responses of the SDK calls of a run, by request key.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.arrays = _Arrays()
+        self.calls = {}
+        self.counts = Counter()
+        self.tags = {}
+        self.settings = {}
+        self.now = None
+
+    def record(self, method, key, response, seconds):
+        with self.lock:
+            self.counts[method.split(":")[0]] += 1
+            if key not in self.calls:  # repeated requests are served the first response
+                self.calls[key] = {"method": method, "seconds": seconds, "response": encode(response, self.arrays)}
+
+    def call(self, method, function, *args, **kwargs):
+        start = time.perf_counter()
+        response = function(*args, **kwargs)
+        self.record(method, request_key(method, *args, **kwargs), response, time.perf_counter() - start)
+        return response
+
+    def save(self, directory, metadata):
+        os.makedirs(directory, exist_ok=True)
+        np.savez_compressed(os.path.join(directory, ARRAYS_FILE), **self.arrays.arrays)
+        with open(os.path.join(directory, INDEX_FILE), "w") as file:
+            json.dump({
+                "version": FORMAT_VERSION,
+                **metadata,
+                "settings": self.settings,
+                "now": self.now,
+                "tags": self.tags,
+                "calls": self.calls,
+            }, file, indent=1)
+
+
+def _wrap(obj, names, wrapper):
+    for name in names:
+        method = getattr(obj, name, None)
+        if callable(method):
+            object.__setattr__(obj, name, wrapper(name, method))
+    return obj
+
+
+class _RecordingTagClient:
+    def __init__(self, tag_client, recorder):
+        self._tag_client = tag_client
+        self._recorder = recorder
+
+    def get_by_name(self, name, *args, **kwargs):
+        tag = self._tag_client.get_by_name(name, *args, **kwargs)
+        with self._recorder.lock:
+            self._recorder.counts["tag.get_by_name"] += 1
+            self._recorder.tags[request_key("tag.get_by_name", name, *args, **kwargs)] = {
+                "name": str(getattr(tag, "name", name)),
+                "identifier": _tag_key(tag),
+            }
+        key = _tag_key(tag)
+
+        def wrapper(method_name, method):
+            def wrapped(*method_args, **method_kwargs):
+                return self._recorder.call(f"tag.{method_name}:{key}", method, *method_args, **method_kwargs)
+            return wrapped
+        return _wrap(tag, ["get_data", "get_plot_data", "calculate"], wrapper)
+
+    def __getattr__(self, name):
+        return getattr(self._tag_client, name)
+
+
+class _RecordingSearchClient:
+    def __init__(self, search_client, recorder):
+        self._search_client = search_client
+        self._recorder = recorder
+
+    def __getattr__(self, name):
+        attribute = getattr(self._search_client, name)
+        if not callable(attribute):
+            return attribute
+
+        def create(*args, **kwargs):
+            search = attribute(*args, **kwargs)
+            definition = request_key(f"search.{name}", _search_definition(*args, **kwargs))
+
+            def wrapper(method_name, method):
+                def wrapped(*method_args, **method_kwargs):
+                    method_key = f"search.{method_name}:{definition}"
+                    return self._recorder.call(method_key, method, *method_args, **method_kwargs)
+                return wrapped
+            return _wrap(search, ["get_results"], wrapper)
+        return create
+
+
+class _RecordingIntervalFactory:
+    def __init__(self, factory, recorder):
+        self._factory = factory
+        self._recorder = recorder
+
+    def __call__(self, *args, **kwargs):
+        return self._factory(*args, **kwargs)
+
+    def range(self, *args, **kwargs):
+        return self._recorder.call("time.interval.range", self._factory.range, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._factory, name)
+
+
+class _RecordingTimeClient:
+    def __init__(self, time_client, recorder):
+        self._time_client = time_client
+        self._recorder = recorder
+        self.interval = _RecordingIntervalFactory(time_client.interval, recorder)
+
+    def now(self):
+        now = self._time_client.now()
+        with self._recorder.lock:
+            if self._recorder.now is None:  # the replayed run sees the time of the first call throughout
+                self._recorder.now = encode(pd.Timestamp(now), self._recorder.arrays)
+        return now
+
+    def __getattr__(self, name):
+        return getattr(self._time_client, name)
+
+
+class RecordingClient:
+    """
+    Wrapper around a `TrendMinerClient` recording the responses of its API calls in `recorder`. All other attributes
+    are those of the wrapped client.
+    """
+
+    def __init__(self, client, recorder):
+        self._client = client
+        self.recorder = recorder
+        recorder.settings = {"tz": str(client.tz), "resolution": pd.Timedelta(client.resolution).value}
+        self.tag = _RecordingTagClient(client.tag, recorder)
+        self.search = _RecordingSearchClient(client.search, recorder)
+        self.time = _RecordingTimeClient(client.time, recorder)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+class Fixture:
+    """
+    Recorded responses, loaded from a fixture directory.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, INDEX_FILE)) as file:
+            self.index = json.load(file)
+        if self.index.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported fixture version {self.index.get('version')} in {directory}")
+        with np.load(os.path.join(directory, ARRAYS_FILE)) as arrays:
+            self.arrays = _Arrays({name: arrays[name] for name in arrays.files})
+
+    @property
+    def output_file(self):
+        return os.path.join(self.directory, OUTPUT_FILE)
+
+    def response(self, method, *args, **kwargs):
+        """
+        The recorded response to a request and the recorded wall time of the call.
+        """
+        entry = self.index["calls"].get(request_key(method, *args, **kwargs))
+        if entry is None:
+            raise NotRecordedError(f"No recorded response to {method.split(':')[0]} with arguments {_canonical(args)}"
+                                   f" {_canonical(kwargs)}")
+        return entry["response"], entry["seconds"]
+
+
+def install_replay(fixture, latency=None):
+    """
+    Register a replay client serving the responses in `fixture` as the `trendminer` package (see
+    `fake_trendminer.install`). `latency` is the time to sleep per call in seconds, or "recorded" for the recorded wall
+    time of every call. Returns the counts of the replayed calls per method.
+    """
+    import fake_trendminer
+
+    calls = Counter()
+    calls_lock = threading.Lock()
+    Interval = fake_trendminer.Interval
+
+    def replay(method, *args, _into=None, **kwargs):
+        encoded, seconds = fixture.response(method, *args, **kwargs)
+        with calls_lock:
+            calls[method.split(":")[0]] += 1
+        delay = seconds if latency == "recorded" else (latency or 0)
+        if delay > 0:
+            time.sleep(delay)
+        if _into is not None:
+            return decode_intervals(encoded, fixture.arrays, Interval, intervals=_into)
+        return decode(encoded, fixture.arrays, Interval)
+
+    class ReplayTag:
+        def __init__(self, name, identifier):
+            self.name = name
+            self.identifier = identifier
+
+        def get_data(self, *args, **kwargs):
+            return replay(f"tag.get_data:{self.identifier}", *args, **kwargs)
+
+        def get_plot_data(self, *args, **kwargs):
+            return replay(f"tag.get_plot_data:{self.identifier}", *args, **kwargs)
+
+        def calculate(self, *args, **kwargs):
+            # Signature calculate(intervals, operation, key, inplace=False)
+            intervals = kwargs["intervals"] if "intervals" in kwargs else args[0]
+            inplace = kwargs["inplace"] if "inplace" in kwargs else (len(args) > 3) and args[3]
+            return replay(f"tag.calculate:{self.identifier}", *args, _into=intervals if inplace else None, **kwargs)
+
+    class ReplayTagClient:
+        def get_by_name(self, name, *args, **kwargs):
+            tag = fixture.index["tags"].get(request_key("tag.get_by_name", name, *args, **kwargs))
+            if tag is None:
+                raise NotRecordedError(f"Tag '{name}' was not requested in the recorded run")
+            with calls_lock:
+                calls["tag.get_by_name"] += 1
+            return ReplayTag(tag["name"], tag["identifier"])
+
+    class ReplaySearch:
+        def __init__(self, definition):
+            self.definition = definition
+
+        def get_results(self, *args, **kwargs):
+            return replay(f"search.get_results:{self.definition}", *args, **kwargs)
+
+    class ReplaySearchClient:
+        def __getattr__(self, name):
+            def create(*args, **kwargs):
+                return ReplaySearch(request_key(f"search.{name}", _search_definition(*args, **kwargs)))
+            return create
+
+    class ReplayIntervalFactory(fake_trendminer.IntervalFactory):
+        def range(self, *args, **kwargs):
+            return replay("time.interval.range", *args, **kwargs)
+
+    class ReplayTimeClient(fake_trendminer.TimeClient):
+        def __init__(self, client):
+            super().__init__(client)
+            self.interval = ReplayIntervalFactory(client)
+
+        def now(self):
+            if fixture.index["now"] is None:
+                raise NotRecordedError("The current time was not requested in the recorded run")
+            return _decode_timestamp(fixture.index["now"])
+
+    class TrendMinerClient:
+        """
+        Replay client with the same interface as `trendminer.TrendMinerClient`, as far as it is used by the scripts.
+        """
+
+        def __init__(self, tz="UTC"):
+            self.tz = tz
+            self.resolution = pd.Timedelta(fixture.index["settings"]["resolution"])
+            self.time = ReplayTimeClient(self)
+            self.tag = ReplayTagClient()
+            self.search = ReplaySearchClient()
+            self.calls = calls
+
+        @classmethod
+        def from_token(cls, token=None, tz="UTC", **kwargs):
+            return cls(tz=tz)
+
+    fake_trendminer.install()
+    module = types.ModuleType("trendminer")
+    module.TrendMinerClient = TrendMinerClient
+    module.sdk = fake_trendminer.sdk
+    sys.modules["trendminer"] = module
+    return calls
+
+
+def find_script(script):
+    """
+    Path of an example script, given by path or by name (the file name without extension).
+    """
+    if os.path.exists(script):
+        return os.path.abspath(script)
+    from run_benchmarks import find_scripts
+
+    scripts = find_scripts()
+    if script not in scripts:
+        raise SystemExit(f"Unknown script '{script}'")
+    return scripts[script]
+
+
+def _run_script(path, start, end, token):
+    """
+    Run the script at `path` for the index interval [start, end) in a fresh working directory, in this process.
+    Returns the output file, the wall time and the error of the run, if any.
+    """
+    workdir = tempfile.mkdtemp(prefix="replay_")
+    output_file = os.path.join(workdir, OUTPUT_FILE)
+    os.environ.update({
+        "ACCESS_TOKEN": token,
+        "START_TIMESTAMP": start,
+        "END_TIMESTAMP": end,
+        "OUTPUT_FILE": output_file,
+    })
+    os.chdir(workdir)
+    error = None
+    wall_start = time.perf_counter()
+    try:
+        runpy.run_path(path, run_name="__main__")
+    except SystemExit:
+        pass  # scripts may quit early when there is nothing to output
+    except Exception as exception:
+        error = f"{type(exception).__name__}: {exception}"
+    return output_file, time.perf_counter() - wall_start, error
+
+
+def record_single(args):
+    """
+    Record a run of the script in this process. Meant to be called in a fresh process (see `run`).
+    """
+    sys.path[:0] = [REPOSITORY_DIR, BENCHMARK_DIR]
+    fixture = os.path.abspath(args.fixture)
+    path = find_script(args.script)
+    if args.fake:
+        import fake_trendminer
+
+        fake_trendminer.install(now=args.now)
+    import trendminer
+
+    recorder = Recorder()
+    from_token = trendminer.TrendMinerClient.from_token
+
+    def recording_from_token(*from_token_args, **from_token_kwargs):
+        return RecordingClient(from_token(*from_token_args, **from_token_kwargs), recorder)
+
+    trendminer.TrendMinerClient.from_token = recording_from_token
+    output_file, wall_time, error = _run_script(path, args.start, args.end, os.environ.get("ACCESS_TOKEN", "fake"))
+    if error is not None:
+        return {"wall_time": wall_time, "error": error}
+    recorder.save(fixture, {"script": os.path.relpath(path, REPOSITORY_DIR), "start": args.start, "end": args.end})
+    target = os.path.join(fixture, OUTPUT_FILE)
+    if os.path.exists(output_file):
+        shutil.copyfile(output_file, target)
+    elif os.path.exists(target):
+        os.remove(target)
+    return {"wall_time": wall_time, "calls": dict(recorder.counts), "error": None}
+
+
+def replay_single(args):
+    """
+    Replay a run of the script in this process, and compare its output to the recorded output. Meant to be called in
+    a fresh process (see `run`).
+    """
+    sys.path[:0] = [REPOSITORY_DIR, BENCHMARK_DIR]
+    fixture = Fixture(os.path.abspath(args.fixture))
+    latency = args.latency if args.latency in (None, "recorded") else float(args.latency)
+    calls = install_replay(fixture, latency=latency)
+    path = find_script(args.script) if args.script else os.path.join(REPOSITORY_DIR, fixture.index["script"])
+    output_file, wall_time, error = _run_script(path, fixture.index["start"], fixture.index["end"], "replay")
+    if error is not None:
+        return {"wall_time": wall_time, "calls": dict(calls), "error": error}
+    if os.path.exists(fixture.output_file) != os.path.exists(output_file):
+        identical = False
+    else:
+        identical = (not os.path.exists(output_file)) or filecmp.cmp(output_file, fixture.output_file, shallow=False)
+    return {"wall_time": wall_time, "calls": dict(calls), "identical": identical,
+            "error": None if identical else "output differs from the recorded output"}
+
+
+def run(args):
+    """
+    Run `record` or `replay` in a fresh subprocess, with its own temporary directory and per-user cache directory for
+    file-backed caches.
+    """
+    command = [sys.executable, os.path.abspath(__file__)] + sys.argv[1:] + ["--single"]
+    with tempfile.TemporaryDirectory() as tmp:
+        environment = dict(os.environ, TMPDIR=tmp, XDG_CACHE_HOME=tmp)  # the per-user caches start cold
+        completed = subprocess.run(command, capture_output=True, text=True, env=environment)
+    if completed.returncode != 0:
+        return {"error": completed.stderr.strip().splitlines()[-1]}
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    record = commands.add_parser("record", help="record the SDK responses of a script run")
+    record.add_argument("script", help="path or name of the script")
+    record.add_argument("--fixture", required=True, help="directory to store the fixture in")
+    record.add_argument("--start", required=True, help="start of the index interval")
+    record.add_argument("--end", required=True, help="end of the index interval")
+    record.add_argument("--fake", action="store_true", help="record against the offline stand-in")
+    record.add_argument("--now", default="2026-01-01", help="indexing horizon of the offline stand-in")
+    replay = commands.add_parser("replay", help="replay a script run and compare its output to the recording")
+    replay.add_argument("script", nargs="?", help="path or name of the script (default: the recorded script)")
+    replay.add_argument("--fixture", required=True, help="directory of the fixture")
+    replay.add_argument("--latency", help="time to sleep per call [s], or 'recorded' for the recorded wall time")
+    replay.add_argument("--repeat", type=int, default=1, help="number of replays")
+    for command in (record, replay):
+        command.add_argument("--single", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        result = record_single(args) if args.command == "record" else replay_single(args)
+        print(json.dumps(result))
+        return
+
+    failed = False
+    for _ in range(1 if args.command == "record" else args.repeat):
+        result = run(args)
+        calls = " ".join(f"{method}={count}" for method, count in sorted(result.get("calls", {}).items()))
+        status = result["error"] or ("identical output" if args.command == "replay" else f"recorded to {args.fixture}")
+        print(f"{args.command}: {result.get('wall_time', float('nan')):.3f} s  {calls}  {status}")
+        failed |= result["error"] is not None
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
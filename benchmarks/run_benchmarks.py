@@ -0,0 +1,186 @@
+"""
+Benchmark the example scripts against the offline TrendMiner stand-in (`fake_trendminer`), for index intervals from
+one hour up to five years, ending at the indexing horizon.
+
+Every run happens in a fresh subprocess with its own temporary directory (so file-backed caches start cold), and
+reports the wall time of the script, the number of API calls per method, and the peak memory of the process.
+
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --scripts event_counter kwh_totalizer --lengths 1h 30D --latency 0.05
+    python benchmarks/run_benchmarks.py --json results.json
+
+Compare the JSON output of two revisions to spot scaling regressions.
+"""
+import argparse
+import json
+import os
+import resource
+import runpy
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIR = os.path.dirname(BENCHMARK_DIR)
+SCRIPTS_DIR = os.path.join(REPOSITORY_DIR, "custom_calculations_scripts")
+
+DEFAULT_LENGTHS = ["1h", "1D", "7D", "30D", "365D", "1826D"]
+DEFAULT_NOW = "2026-01-01"
+
+
+def find_scripts():
+    """
+    All example scripts by name (the file name without extension).
+    """
+    scripts = {}
+    for directory, _, files in sorted(os.walk(SCRIPTS_DIR)):
+        for file in sorted(files):
+            if file.endswith(".py"):
+                scripts[file[:-3]] = os.path.join(directory, file)
+    return scripts
+
+
+def run_single(path, length, now, latency, point_latency, events_per_day, trace):
+    """
+    Run the script at `path` for an index interval of `length` ending at `now`, in this process, and return its
+    measurements. Meant to be called in a fresh process (see `run`).
+    """
+    sys.path[:0] = [REPOSITORY_DIR, BENCHMARK_DIR]
+    import fake_trendminer
+
+    calls = fake_trendminer.install(
+        now=now,
+        latency=latency,
+        point_latency=point_latency,
+        events_per_day=events_per_day,
+    )
+    end = pd.Timestamp(now, tz="UTC")
+    start = end - pd.Timedelta(length)
+    workdir = tempfile.mkdtemp(prefix="benchmark_")
+    output_file = os.path.join(workdir, "output.csv")
+    os.environ.update({
+        "ACCESS_TOKEN": "fake",
+        "START_TIMESTAMP": start.isoformat(),
+        "END_TIMESTAMP": end.isoformat(),
+        "OUTPUT_FILE": output_file,
+    })
+    os.chdir(workdir)
+
+    # Import the heavy dependencies of the scripts up front, so their import time is not part of the measurement
+    for module in ["numpy", "scipy.integrate", "CoolProp.CoolProp"]:
+        try:
+            __import__(module)
+        except ImportError:
+            pass
+
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if trace:
+        tracemalloc.start()
+    error = None
+    wall_start = time.perf_counter()
+    try:
+        runpy.run_path(path, run_name="__main__")
+    except SystemExit:
+        pass  # scripts may quit early when there is nothing to output
+    except Exception as exception:
+        error = f"{type(exception).__name__}: {exception}"
+    wall_time = time.perf_counter() - wall_start
+
+    result = {
+        "wall_time": wall_time,
+        "calls": dict(calls),
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "rss_increase_mb": (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline_rss) / 1024,
+        "output_rows": sum(1 for _ in open(output_file)) - 1 if os.path.exists(output_file) else 0,
+        "error": error,
+    }
+    if trace:
+        result["peak_traced_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    return result
+
+
+def run(name, path, length, args):
+    """
+    Run one benchmark in a fresh subprocess, with its own temporary directory for file-backed caches.
+    """
+    command = [
+        sys.executable, os.path.abspath(__file__), "--single", path, length,
+        "--now", args.now,
+        "--latency", str(args.latency),
+        "--point-latency", str(args.point_latency),
+        "--events-per-day", str(args.events_per_day),
+    ] + (["--tracemalloc"] if args.tracemalloc else [])
+    with tempfile.TemporaryDirectory() as tmp:
+        environment = dict(os.environ, TMPDIR=tmp, XDG_CACHE_HOME=tmp)  # the per-user caches start cold
+        completed = subprocess.run(command, capture_output=True, text=True, env=environment)
+    if completed.returncode != 0:
+        return {"script": name, "length": length, "error": completed.stderr.strip().splitlines()[-1]}
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    return {"script": name, "length": length, **result}
+
+
+def print_header():
+    print(f"{'script':<45} {'length':>7} {'wall [s]':>9} {'calls':>6} {'peak [MB]':>10} {'rows':>8}  calls per method")
+
+
+def print_row(result):
+    if result.get("wall_time") is None:
+        print(f"{result['script']:<45} {result['length']:>7}  ERROR {result['error']}")
+        return
+    calls = result["calls"]
+    method_calls = ", ".join(f"{method}={count}" for method, count in sorted(calls.items()))
+    print(
+        f"{result['script']:<45} {result['length']:>7} {result['wall_time']:>9.3f} {sum(calls.values()):>6} "
+        f"{result['peak_rss_mb']:>10.1f} {result['output_rows']:>8}  {method_calls}"
+        + (f"  ERROR {result['error']}" if result["error"] else "")
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scripts", nargs="*", help="names of the scripts to run (default: all)")
+    parser.add_argument("--lengths", nargs="*", default=DEFAULT_LENGTHS, help="index interval lengths")
+    parser.add_argument("--now", default=DEFAULT_NOW, help="indexing horizon of the fake appliance (UTC)")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds of latency per API call")
+    parser.add_argument("--point-latency", type=float, default=0.0, help="seconds of latency per data point")
+    parser.add_argument("--events-per-day", type=float, default=24.0, help="density of digital tag events")
+    parser.add_argument("--tracemalloc", action="store_true", help="also report the peak traced memory (slower)")
+    parser.add_argument("--json", help="file to write the results to")
+    parser.add_argument("--single", nargs=2, metavar=("PATH", "LENGTH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        result = run_single(
+            *args.single,
+            now=args.now,
+            latency=args.latency,
+            point_latency=args.point_latency,
+            events_per_day=args.events_per_day,
+            trace=args.tracemalloc,
+        )
+        print(json.dumps(result))
+        return
+
+    scripts = find_scripts()
+    unknown = set(args.scripts or []) - set(scripts)
+    if unknown:
+        parser.error(f"unknown scripts: {', '.join(sorted(unknown))}")
+
+    print_header()
+    results = []
+    for name in (args.scripts or scripts):
+        for length in args.lengths:
+            results.append(run(name, scripts[name], length, args))
+            print_row(results[-1])
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Measure the cold start of every example script on the trivial path without any data, and check it against a budget.
+
+Every script is run in a fresh interpreter (with `-X importtime`) against the offline TrendMiner stand-in, for an index
+interval before the start of its history, so only the imports and the setup of the script are measured. The report
+lists the total wall time of the process and the modules the script took longest to import. The imports of the stand-in
+itself are reported separately; the modules it imports (numpy and pandas) are therefore not attributed to the script.
+The command exits with status 1 when any script goes over `--budget` seconds (or fails), so it can be used as a check
+in CI.
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --budget 1.0 --top 10
+"""
+import argparse
+import json
+import os
+import runpy
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIR = os.path.dirname(BENCHMARK_DIR)
+DEFAULT_BUDGET = 1.5
+NO_DATA_START = "2010-01-01T00:00:00Z"
+NO_DATA_END = "2010-01-01T01:00:00Z"
+STAND_IN_MARKER = "startup: importing stand-in"
+MARKER = "startup: running script"
+
+
+def run_single(path):
+    """
+    Run the script at `path` on the no-data path, in this process. The imports of the TrendMiner stand-in and those of
+    the script are told apart by the markers printed before each.
+    """
+    sys.path[:0] = [REPOSITORY_DIR, BENCHMARK_DIR]
+    print(STAND_IN_MARKER, file=sys.stderr, flush=True)
+    import fake_trendminer
+
+    fake_trendminer.install()
+    print(MARKER, file=sys.stderr, flush=True)
+    workdir = tempfile.mkdtemp(prefix="startup_")
+    os.environ.update({
+        "ACCESS_TOKEN": "fake",
+        "START_TIMESTAMP": NO_DATA_START,
+        "END_TIMESTAMP": NO_DATA_END,
+        "OUTPUT_FILE": os.path.join(workdir, "output.csv"),
+    })
+    os.chdir(workdir)
+    try:
+        runpy.run_path(path, run_name="__main__")
+    except SystemExit:
+        pass
+
+
+def parse_import_times(stderr, start=MARKER, end=None):
+    """
+    Cumulative import time [s] of every module imported at the top level (i.e., not by another module) between the
+    `start` and `end` markers, from the output of `-X importtime`.
+    """
+    times = {}
+    lines = stderr.splitlines()
+    lines = lines[lines.index(start) + 1 if start in lines else 0:]
+    lines = lines[:lines.index(end)] if end in lines else lines
+    for line in lines:
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not name[1:].startswith(" "):  # nested imports are indented
+            times[name.strip()] = times.get(name.strip(), 0) + int(cumulative) / 1e6
+    return times
+
+
+def measure(path):
+    """
+    Wall time [s] of a cold run of the script at `path`, the top-level import times of the script, and the total import
+    time of the TrendMiner stand-in.
+    """
+    command = [sys.executable, "-X", "importtime", os.path.abspath(__file__), "--single", path]
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        # The caches are kept in the temporary directory, so every run starts cold
+        environment = dict(os.environ, TMPDIR=tmp, XDG_CACHE_HOME=tmp)
+        completed = subprocess.run(command, capture_output=True, text=True, env=environment)
+        wall_time = time.perf_counter() - start
+    error = None
+    if completed.returncode != 0:
+        error = [line for line in completed.stderr.splitlines() if not line.startswith("import time:")][-1]
+    stand_in_time = sum(parse_import_times(completed.stderr, start=STAND_IN_MARKER, end=MARKER).values())
+    return wall_time, parse_import_times(completed.stderr), stand_in_time, error
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scripts", nargs="*", help="names of the scripts to run (default: all)")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET, help="maximal cold start [s] per script")
+    parser.add_argument("--top", type=int, default=5, help="number of slowest imports to list per script")
+    parser.add_argument("--json", help="file to write the results to")
+    parser.add_argument("--single", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        run_single(args.single)
+        return
+
+    from run_benchmarks import find_scripts
+
+    scripts = find_scripts()
+    results = []
+    for name in (args.scripts or scripts):
+        wall_time, import_times, stand_in_time, error = measure(scripts[name])
+        slowest = sorted(import_times.items(), key=lambda item: -item[1])[:args.top]
+        over_budget = wall_time > args.budget
+        results.append({
+            "script": name,
+            "wall_time": wall_time,
+            "import_time": sum(import_times.values()),
+            "stand_in_import_time": stand_in_time,
+            "slowest_imports": dict(slowest),
+            "over_budget": over_budget,
+            "error": error,
+        })
+        status = "ERROR" if error else ("OVER BUDGET" if over_budget else "ok")
+        imports = f"imports {sum(import_times.values()):.3f} s, stand-in {stand_in_time:.3f} s"
+        print(f"{name:<45} {wall_time:>7.3f} s ({imports})  {status}")
+        for module, import_time in slowest:
+            print(f"    {module:<41} {import_time:>7.3f} s")
+        if error:
+            print(f"    {error}")
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+    failed = [result["script"] for result in results if result["over_budget"] or result["error"]]
+    if failed:
+        print(f"\n{len(failed)} script(s) over the budget of {args.budget} s or failing: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
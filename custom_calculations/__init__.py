@@ -0,0 +1,9 @@
+"""
+Shared helpers for the custom calculation example scripts.
+
+The example scripts in `custom_calculations_scripts` import from this package. Make sure it is importable in the
+environment the scripts run in, e.g. by adding the root of this repository to the `PYTHONPATH`.
+
+Timestamps are handled as sorted int64 arrays of nanoseconds since the epoch (UTC) wherever performance matters. Use
+the functions in `custom_calculations.timestamps` to convert from and to SDK intervals and pandas indexes.
+"""
@@ -0,0 +1,128 @@
+"""
+Helpers for the local stores, which can be shared by several processes at once.
+"""
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+
+# Set (to "1") by `custom_calculations.backfill` for the runs of its chunks, which overlap by design
+BACKFILL_VARIABLE = "CUSTOM_CALCULATIONS_BACKFILL"
+
+
+def user_cache_dir(name="custom_calculations"):
+    """
+    Per-user cache directory (under `XDG_CACHE_HOME`, or `~/.cache`), for files only the current user should write.
+    """
+    return os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser(os.path.join("~", ".cache")), name)
+
+
+def private_directory(path):
+    """
+    Create the directory `path` accessible only by the current user, or check that an existing one is. Raises a
+    ValueError otherwise, as files in it could then be replaced by other users.
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    status = os.stat(path)
+    if (status.st_uid != os.getuid()) or (status.st_mode & 0o077):
+        raise ValueError(f"{path} must be a directory only accessible by the current user")
+
+
+def user_cache_file(name):
+    """
+    Path of the file `name` in the per-user cache directory, which is created (see `private_directory`) if needed.
+    """
+    directory = user_cache_dir()
+    private_directory(directory)
+    return os.path.join(directory, name)
+
+
+@contextmanager
+def sqlite_connection(path, timeout=30):
+    """
+    Connection to the SQLite database in `path`, committing on success and rolling back on error.
+    """
+    connection = sqlite3.connect(path, timeout=timeout)
+    try:
+        connection.execute("PRAGMA journal_mode=WAL")
+        with connection:
+            yield connection
+    finally:
+        connection.close()
+
+
+def replace_file(path, write):
+    """
+    Write a file by calling `write` with a binary file object. The file is replaced atomically, so concurrent readers
+    never see a partially written file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, temporary_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(handle, "wb") as file:
+            write(file)
+        os.replace(temporary_path, path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+
+
+def create_processed_table(connection):
+    """
+    Create the table of processed index interval ranges per key, used to detect when a range is indexed again.
+    """
+    connection.execute(
+        """
+        CREATE TABLE IF NOT EXISTS processed_ranges (
+            key TEXT NOT NULL,
+            start INTEGER NOT NULL,
+            end INTEGER NOT NULL,
+            saved_at REAL NOT NULL,
+            PRIMARY KEY (key, start)
+        )
+        """
+    )
+
+
+def is_reindexed(connection, key, start, end, backfill=None):
+    """
+    Whether the index interval [start, end) (epoch nanoseconds) overlaps a range processed earlier, i.e., is indexed
+    again (e.g., because dependency data changed behind the indexing horizon). Runs of a backfill are never, as its
+    padded chunks overlap by design; `backfill` defaults to whether `BACKFILL_VARIABLE` is set.
+    """
+    if backfill is None:
+        backfill = os.environ.get(BACKFILL_VARIABLE) == "1"
+    if backfill or (start >= end):
+        return False
+    row = connection.execute(
+        "SELECT 1 FROM processed_ranges WHERE key = ? AND start < ? AND end > ? LIMIT 1", (key, end, start)
+    ).fetchone()
+    return row is not None
+
+
+def record_processed(connection, key, start, end):
+    """
+    Record that the index interval [start, end) (epoch nanoseconds) was processed. Overlapping and touching ranges are
+    joined, so the table keeps a handful of ranges rather than one per run.
+    """
+    if start >= end:
+        return
+    connection.execute("BEGIN IMMEDIATE")  # lock before reading, so concurrent runs cannot interleave
+    rows = connection.execute(
+        "SELECT start, end FROM processed_ranges WHERE key = ? AND start <= ? AND end >= ?", (key, end, start)
+    ).fetchall()
+    connection.executemany("DELETE FROM processed_ranges WHERE key = ? AND start = ?", [(key, row[0]) for row in rows])
+    connection.execute(
+        "INSERT INTO processed_ranges (key, start, end, saved_at) VALUES (?, ?, ?, ?)",
+        (key, min([start] + [row[0] for row in rows]), max([end] + [row[1] for row in rows]), time.time()),
+    )
+
+
+def trim_processed(connection, key, since):
+    """
+    Forget the processed ranges of `key` after `since` (epoch nanoseconds), e.g., after invalidating their results.
+    """
+    connection.execute("DELETE FROM processed_ranges WHERE key = ? AND start >= ?", (key, since))
+    connection.execute("UPDATE processed_ranges SET end = ? WHERE key = ? AND end > ?", (since, key, since))
@@ -0,0 +1,54 @@
+"""
+Aggregates of many tags and operations over one set of intervals, requested concurrently in batches.
+
+Every `tag.calculate` call computes one operation on one tag, and carries the full interval list. Here, a set of
+calculations (a key for every tag and operation, like the `calculations` of a value-based search) is computed over the
+intervals by splitting every calculation into requests of at most `batch_size` intervals, and running all requests
+concurrently. The results are collected in one `IntervalFrame`, with a column per key.
+
+    frame = aggregate(intervals, {
+        "conc_max": (tag1, TagCalculationOptions.MAXIMUM),
+        "level_mean": (tag2, TagCalculationOptions.MEAN),
+    }, tz=client.tz)
+
+`calculation_matrix` builds the calculations for every combination of a set of tags and a set of operations.
+"""
+from custom_calculations.frames import IntervalFrame, interval_result
+from custom_calculations.instrumentation import staged
+from custom_calculations.planner import FetchPlan
+
+
+def calculation_matrix(tags, operations):
+    """
+    Calculations for every tag in the dict `tags` (by name) and every operation, with keys such as `level_maximum`.
+    """
+    return {
+        f"{name}_{getattr(operation, 'name', operation).lower()}": (tag, operation)
+        for name, tag in tags.items()
+        for operation in operations
+    }
+
+
+def _calculate(tag, intervals, operation, key):
+    results = tag.calculate(intervals=intervals, operation=operation, key=key, inplace=False)
+    return [interval_result(result, key) for result in results]
+
+
+@staged("aggregate")
+def aggregate(intervals, calculations, tz=None, batch_size=1000, max_workers=8):
+    """
+    Compute `calculations` (a dict of `key: (tag, operation)`) over the SDK `intervals`, using requests of at most
+    `batch_size` intervals and at most `max_workers` concurrent requests. Returns an `IntervalFrame` with a column per
+    key. If any request fails, its error is raised once all requests have finished.
+    """
+    frame = IntervalFrame.from_intervals(intervals, tz=tz)
+    batches = [(start, min(start + batch_size, len(intervals))) for start in range(0, len(intervals), batch_size)]
+    plan = FetchPlan(max_workers=max_workers)
+    for key, (tag, operation) in calculations.items():
+        for start, stop in batches:
+            plan.add((key, start), _calculate, tag, intervals[start:stop], operation, key)
+    results = plan.run()
+
+    for key in calculations:
+        frame[key] = [value for start, _ in batches for value in results[(key, start)]]
+    return frame
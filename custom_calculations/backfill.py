@@ -0,0 +1,186 @@
+"""
+Backfill the history of a calculated tag by running one of the scripts on chunks of a long time range in parallel.
+
+The range is split into chunks starting at midnight (in the time zone `tz`), so chunk boundaries coincide with the
+reset boundaries of daily (or coarser, e.g. with `chunk="MS"`) buckets. Every chunk is run as a separate process, with
+its index interval padded by `halo` on both sides (the maximal duration of a bucket or search result), and only the
+output within the chunk itself is kept. The outer boundaries of the range are not padded, so the merged output follows
+the same boundary conventions as a single run of the script over the whole range.
+
+Every completed chunk leaves its output and a completion marker in `state_dir`. After a crash, running the same
+backfill again only runs the chunks without a marker, before merging all chunks into one sorted, deduplicated CSV.
+
+    python -m custom_calculations.backfill custom_calculations_scripts/.../kwh_totalizer.py \\
+        --start 2021-01-01 --end 2026-01-01 --output kwh.csv --chunk 30D --halo 25h --tz Europe/Brussels
+"""
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from custom_calculations._storage import BACKFILL_VARIABLE, replace_file
+
+REPOSITORY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def chunk_boundaries(start, end, chunk="30D", tz="UTC"):
+    """
+    Boundaries of the chunks covering [start, end]: every `chunk`, at midnight in time zone `tz`.
+    """
+    start = pd.Timestamp(start, tz=tz) if pd.Timestamp(start).tz is None else pd.Timestamp(start).tz_convert(tz)
+    end = pd.Timestamp(end, tz=tz) if pd.Timestamp(end).tz is None else pd.Timestamp(end).tz_convert(tz)
+    inner = pd.date_range(start.normalize(), end, freq=chunk).normalize().unique()
+    return [start] + [boundary for boundary in inner if start < boundary < end] + [end]
+
+
+def _chunk_name(chunk_start, chunk_end):
+    return f"chunk_{chunk_start.value}_{chunk_end.value}"
+
+
+def run_chunk(script, chunk_start, chunk_end, run_start, run_end, state_dir, environment=None):
+    """
+    Run `script` for the index interval [run_start, run_end], and store its output for [chunk_start, chunk_end] in
+    `state_dir`, followed by the completion marker. Returns None on success, or the error output of the script.
+    """
+    name = _chunk_name(chunk_start, chunk_end)
+    raw_output = os.path.join(state_dir, f"{name}.raw.csv")
+    if os.path.exists(raw_output):
+        os.remove(raw_output)  # left behind by an earlier, failed attempt
+    python_path = os.pathsep.join(filter(None, [REPOSITORY_DIR, os.environ.get("PYTHONPATH")]))
+    completed = subprocess.run(
+        [sys.executable, script],
+        env=dict(
+            os.environ,
+            **(environment or {}),
+            PYTHONPATH=python_path,
+            START_TIMESTAMP=run_start.isoformat(),
+            END_TIMESTAMP=run_end.isoformat(),
+            OUTPUT_FILE=raw_output,
+            **{BACKFILL_VARIABLE: "1"},  # the padded chunks overlap, which is not a re-index
+        ),
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        return completed.stderr.strip() or f"exit status {completed.returncode}"
+
+    if os.path.exists(raw_output):
+        os.replace(raw_output, os.path.join(state_dir, f"{name}.csv"))
+    replace_file(os.path.join(state_dir, f"{name}.done"), lambda file: file.write(b""))
+    return None
+
+
+def _read_chunk(path, chunk_start, chunk_end, is_first, is_last):
+    """
+    Rows of a chunk output within the chunk. Interior boundaries belong to the chunk starting there; the outer
+    boundaries of the range are kept as the script output them.
+    """
+    if not os.path.exists(path):
+        return None
+    data = pd.read_csv(path, index_col=0, dtype=str, keep_default_na=False)
+    timestamps = pd.to_datetime(data.index, utc=True, format="ISO8601")
+    keep = ((timestamps >= chunk_start) | is_first) & ((timestamps < chunk_end) | is_last)
+    data = data[keep]
+    data.insert(0, "__timestamp", timestamps[keep])
+    return data
+
+
+def merge_chunks(boundaries, state_dir, output_file):
+    """
+    Merge the outputs of all chunks into `output_file`, sorted by timestamp and without duplicate timestamps.
+    """
+    chunks = []
+    for i, (chunk_start, chunk_end) in enumerate(zip(boundaries[:-1], boundaries[1:])):
+        path = os.path.join(state_dir, f"{_chunk_name(chunk_start, chunk_end)}.csv")
+        data = _read_chunk(path, chunk_start, chunk_end, is_first=(i == 0), is_last=(i == len(boundaries) - 2))
+        if data is not None:
+            chunks.append(data)
+    if not chunks:
+        return 0
+
+    merged = (
+        pd.concat(chunks)
+        .sort_values("__timestamp", kind="stable")
+        .drop_duplicates("__timestamp", keep="first")
+        .drop(columns="__timestamp")
+    )
+    merged.to_csv(output_file)
+    return len(merged)
+
+
+def backfill(script, start, end, output_file, chunk="30D", halo="25h", tz="UTC", max_workers=4, state_dir=None,
+             environment=None):
+    """
+    Run `script` over [start, end] in chunks, using at most `max_workers` processes at once, and merge the outputs
+    into `output_file`. Chunks completed by an earlier call with the same settings are not run again. Raises a
+    RuntimeError listing the failed chunks if any chunk fails; their outputs are not merged.
+    """
+    script = os.path.abspath(script)
+    halo = pd.Timedelta(halo)
+    boundaries = chunk_boundaries(start, end, chunk=chunk, tz=tz)
+    state_dir = state_dir or f"{output_file}.chunks"
+    os.makedirs(state_dir, exist_ok=True)
+
+    # Completion markers are only valid for the same script and settings
+    settings = {"script": script, "halo": halo.value, "boundaries": [boundary.value for boundary in boundaries]}
+    with open(script, "rb") as file:
+        settings["script_hash"] = hashlib.sha1(file.read()).hexdigest()
+    settings_path = os.path.join(state_dir, "backfill.json")
+    if os.path.exists(settings_path):
+        with open(settings_path) as file:
+            if json.load(file) != settings:
+                raise ValueError(f"{state_dir} contains a backfill with other settings; remove it or pick another one")
+    else:
+        replace_file(settings_path, lambda file: file.write(json.dumps(settings).encode()))
+
+    jobs = []
+    for i, (chunk_start, chunk_end) in enumerate(zip(boundaries[:-1], boundaries[1:])):
+        if os.path.exists(os.path.join(state_dir, f"{_chunk_name(chunk_start, chunk_end)}.done")):
+            continue
+        run_start = chunk_start - halo if i > 0 else chunk_start
+        run_end = chunk_end + halo if i < len(boundaries) - 2 else chunk_end
+        jobs.append((chunk_start, chunk_end, run_start, run_end))
+
+    # Every chunk runs in its own process; the threads only wait for them
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        errors = list(executor.map(lambda job: run_chunk(script, *job, state_dir, environment), jobs))
+    failed = [(job[0], error) for job, error in zip(jobs, errors) if error is not None]
+    if failed:
+        raise RuntimeError(
+            f"{len(failed)} of {len(jobs)} chunks failed; run the backfill again to retry them.\n"
+            + "\n".join(f"chunk starting {chunk_start}: {error.splitlines()[-1]}" for chunk_start, error in failed)
+        )
+    return merge_chunks(boundaries, state_dir, output_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("script")
+    parser.add_argument("--start", required=True)
+    parser.add_argument("--end", required=True)
+    parser.add_argument("--output", required=True, help="merged output file")
+    parser.add_argument("--chunk", default="30D", help="chunk length, as a pandas frequency (e.g. 30D, MS)")
+    parser.add_argument("--halo", default="25h", help="padding of every chunk (the maximal duration of the script)")
+    parser.add_argument("--tz", default="UTC", help="time zone in which chunks start at midnight")
+    parser.add_argument("--workers", type=int, default=4, help="number of chunks to run at once")
+    parser.add_argument("--state-dir", help="directory for chunk outputs and completion markers")
+    args = parser.parse_args()
+
+    try:
+        rows = backfill(
+            args.script, args.start, args.end, args.output,
+            chunk=args.chunk, halo=args.halo, tz=args.tz, max_workers=args.workers, state_dir=args.state_dir,
+        )
+    except (RuntimeError, ValueError) as error:
+        print(error, file=sys.stderr)
+        sys.exit(1)
+    print(f"{rows} rows written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
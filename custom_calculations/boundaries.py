@@ -0,0 +1,175 @@
+"""
+Local generation of calendar buckets (e.g., hours, days, months or shifts) in a time zone, as start and end arrays.
+
+`client.time.interval.range(..., normalize=True)` only gives correct buckets from daily frequencies upwards, and
+returns a list of Interval objects. Here, buckets are generated locally for any pandas frequency, with the boundaries
+at the same local (wall clock) times on every day:
+
+* Frequencies shorter than a day (e.g., `h`, `15min`, `12h` with `offset="6h"` for shifts at 06:00 and 18:00) are
+  counted from local midnight. Boundaries are the instants at which the local time is on that grid, so around a DST
+  change the bucket containing the change is one hour shorter or longer, and the repeated hour in autumn has buckets
+  of its own.
+* Daily and longer frequencies (e.g., `D`, `W-MON`, `MS`, `YS`) start at local midnight, plus `offset`.
+* A list of local times of day (e.g., `["06:00", "14:00", "22:00"]`) gives a shift schedule, for shifts of unequal
+  length.
+
+For daily and longer frequencies and shift schedules, boundaries at a local time that is skipped by a DST change are
+moved forward to the change; boundaries at a local time that occurs twice are at its first occurrence.
+
+Bucket starts and ends are int64 arrays of nanoseconds since the epoch, as returned by
+`custom_calculations.timestamps.interval_arrays`. `iter_bucket_boundaries` yields them in chunks, so long ranges of
+short buckets (e.g., a decade of minutes) never have to be held in memory at once.
+
+    starts, ends = bucket_boundaries(index_interval.start, index_interval.end, freq="h", tz=client.tz)
+"""
+import numpy as np
+import pandas as pd
+from pandas.tseries.frequencies import to_offset
+
+DAY_NS = 86_400_000_000_000
+HOUR_NS = 3_600_000_000_000
+EPOCH = pd.Timestamp("1970-01-01")
+
+
+def _timestamp(timestamp, tz):
+    """
+    Timestamp in UTC; naive timestamps are local times in `tz`.
+    """
+    timestamp = pd.Timestamp(timestamp)
+    if timestamp.tz is None:
+        timestamp = timestamp.tz_localize(tz)
+    return timestamp.tz_convert("UTC")
+
+
+def _utc_offsets(epoch_ns, tz):
+    """
+    UTC offset [ns] of time zone `tz` at every instant of `epoch_ns`.
+    """
+    index = pd.DatetimeIndex(epoch_ns.astype("datetime64[ns]"), tz="UTC").tz_convert(tz)
+    return index.tz_localize(None).as_unit("ns").asi8 - epoch_ns
+
+
+def _localize(naive, tz):
+    """
+    Epoch nanoseconds of naive local times; skipped times move forward, repeated times are at their first occurrence.
+    """
+    index = pd.DatetimeIndex(naive).as_unit("ns")
+    index = index.tz_localize(tz, ambiguous=np.ones(len(index), dtype=bool), nonexistent="shift_forward")
+    return np.unique(index.tz_convert("UTC").asi8)
+
+
+def _trim(boundaries, start, end):
+    """
+    The boundaries from the last one at or before `start` up to the first one at or after `end`.
+    """
+    first = max(np.searchsorted(boundaries, start, side="right") - 1, 0)
+    last = np.searchsorted(boundaries, end, side="left")
+    return boundaries[first:last + 1]
+
+
+def _grid_boundaries(start, end, step, offset, tz):
+    """
+    Boundaries at which the local time is on a grid of `step` [ns] counted from local midnight plus `offset` [ns].
+    """
+    # The grid is built in UTC once for every UTC offset occurring around [start, end], and only the instants that
+    # actually have that offset are kept
+    margin = step + 3 * HOUR_NS
+    first, last = start - margin, end + margin
+    samples = np.append(np.arange(first, last, HOUR_NS, dtype=np.int64), last)
+    candidates = []
+    for utc_offset in np.unique(_utc_offsets(samples, tz)).tolist():
+        k_first = -((offset - utc_offset - first) // step)
+        k_last = (last + utc_offset - offset) // step
+        grid = np.arange(k_first, k_last + 1, dtype=np.int64) * step + offset - utc_offset
+        candidates.append(grid[_utc_offsets(grid, tz) == utc_offset])
+    return _trim(np.unique(np.concatenate(candidates)), start, end)
+
+
+def _calendar_boundaries(start, end, freq, offset, tz):
+    """
+    Boundaries of a daily or longer frequency, at local midnight plus `offset` [ns].
+    """
+    offset = pd.Timedelta(offset)
+    local_start = pd.Timestamp(start, tz="UTC").tz_convert(tz).tz_localize(None)
+    local_end = pd.Timestamp(end, tz="UTC").tz_convert(tz).tz_localize(None)
+    # One extra period on both sides, as DST changes can move boundaries across `start` or `end`
+    first = freq.base.rollback((local_start - offset).normalize() - pd.Timedelta("1D"))
+    if freq.n > 1:
+        # Multiples (e.g., 2D or 2W-MON) are counted from the first period after 1970-01-01, so every call agrees
+        elapsed = len(pd.date_range(EPOCH, first, freq=freq.base)) - 1
+        first = first - freq.base * (elapsed % freq.n)
+    last = freq.base.rollforward((local_end - offset).ceil("D") + pd.Timedelta("1D"))
+    naive = pd.date_range(first, last + freq, freq=freq) + offset
+    return _trim(_localize(naive, tz), start, end)
+
+
+def _shift_boundaries(start, end, times, tz):
+    """
+    Boundaries at the local times of day `times` (Timedeltas since midnight).
+    """
+    local_start = pd.Timestamp(start, tz="UTC").tz_convert(tz).tz_localize(None)
+    local_end = pd.Timestamp(end, tz="UTC").tz_convert(tz).tz_localize(None)
+    days = pd.date_range(local_start.normalize() - pd.Timedelta("1D"), local_end.normalize() + pd.Timedelta("1D"))
+    naive = (days.as_unit("ns").asi8[:, None] + np.array([time.value for time in times])[None, :]).ravel()
+    return _trim(_localize(np.sort(naive).astype("datetime64[ns]"), tz), start, end)
+
+
+def _time_of_day(time):
+    """
+    Timedelta since midnight of a time of day such as "06:00", "06:00:00" or "6h".
+    """
+    time = str(time)
+    return pd.Timedelta(f"{time}:00" if time.count(":") == 1 else time)
+
+
+def _schedule(freq, offset):
+    """
+    Returns the function generating the boundaries for `freq`, and the typical bucket length [ns].
+    """
+    offset = pd.Timedelta(offset or 0).value
+    if isinstance(freq, (list, tuple)):
+        times = sorted(_time_of_day(time) for time in freq)
+        if not times or times[0] < pd.Timedelta(0) or times[-1] >= pd.Timedelta("1D"):
+            raise ValueError(f"Shift times must be times of day, got {freq}")
+        return lambda start, end, tz: _shift_boundaries(start, end, times, tz), DAY_NS // len(times)
+
+    freq = to_offset(freq)
+    if isinstance(freq, pd.offsets.Tick) and freq.nanos < DAY_NS:
+        step = freq.nanos
+        return lambda start, end, tz: _grid_boundaries(start, end, step, offset % step, tz), step
+    reference = pd.Timestamp("2000-01-01")
+    length = ((reference + freq) - reference).value
+    return lambda start, end, tz: _calendar_boundaries(start, end, freq, offset, tz), length
+
+
+def iter_bucket_boundaries(start, end, freq, tz="UTC", offset=None, chunk_size=100_000):
+    """
+    Yield `(starts, ends)` arrays of the buckets of frequency `freq` overlapping [start, end), in time zone `tz`, in
+    chunks of about `chunk_size` buckets. `freq` is a pandas frequency or a list of local times of day (shift
+    schedule); `offset` shifts the buckets of a frequency, e.g. `freq="D", offset="6h"` for days starting at 06:00.
+    Naive `start` and `end` are local times in `tz`.
+    """
+    boundaries, length = _schedule(freq, offset)
+    start, end = _timestamp(start, tz).value, _timestamp(end, tz).value
+    if end <= start:
+        return
+    piece = max(chunk_size, 1) * length
+    piece_start = start
+    while piece_start < end:
+        piece_end = min(piece_start + piece, end)
+        edges = boundaries(piece_start, piece_end, tz)
+        starts, ends = edges[:-1], edges[1:]
+        keep = (starts < piece_end) & ((starts >= piece_start) | (piece_start == start))
+        if keep.any():
+            yield starts[keep], ends[keep]
+        piece_start = piece_end
+
+
+def bucket_boundaries(start, end, freq, tz="UTC", offset=None):
+    """
+    Start and end arrays of all buckets of frequency `freq` overlapping [start, end), see `iter_bucket_boundaries`.
+    """
+    chunks = list(iter_bucket_boundaries(start, end, freq, tz=tz, offset=offset))
+    if not chunks:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate([chunk[0] for chunk in chunks]), np.concatenate([chunk[1] for chunk in chunks])
@@ -0,0 +1,298 @@
+"""
+Local on-disk cache for tag data, so consecutive runs do not download the same history again.
+
+Data is cached per tag, resolution and time chunk. Chunks are aligned to multiples of `chunk_points` times the
+resolution since the epoch, and stored as two columns (int64 epoch nanoseconds and float64 values) in a `.npz` file.
+Only chunks that end before the indexing horizon of the tag are cached, as newer data can still change. The horizon is
+probed once per tag for the lifetime of the cache (a script run), as it can only be too early, never too late. Points
+at interval boundaries that are not on the resolution grid (interpolated by the appliance) are fetched directly, so the
+cached data equals the uncached data. Once the total size of the cache exceeds `max_bytes`, the least recently used
+chunks are removed.
+
+Opt in by wrapping the client; tags retrieved through the wrapped client use the cache:
+
+    client = CachedClient(TrendMinerClient.from_token(...))
+    tag = client.tag.get_by_name("[CS]BA:CONC.1")
+    tag.get_data(interval, resolution="1m")  # cached
+"""
+import hashlib
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from custom_calculations._storage import private_directory, replace_file, user_cache_dir
+from custom_calculations.horizon import indexing_horizon, tag_key
+from custom_calculations.timestamps import to_epoch_ns, to_index
+
+DEFAULT_CACHE_DIR = os.path.join(user_cache_dir(), "data")
+
+
+class DataCache:
+    """
+    On-disk cache of tag data in `cache_dir`, limited to `max_bytes`. The directory must only be accessible by the
+    current user, as cached chunks are served as tag data; otherwise, all data is fetched without the cache.
+    """
+
+    def __init__(self, client, cache_dir=DEFAULT_CACHE_DIR, max_bytes=1_000_000_000, chunk_points=1440,
+                 horizon_ttl="30s"):
+        self.client = client
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.chunk_points = chunk_points
+        self.horizon_ttl = horizon_ttl
+        self.horizons = {}
+        self.lock = threading.Lock()
+        try:
+            private_directory(cache_dir)
+            self.enabled = True
+        except (OSError, ValueError):
+            self.enabled = False
+
+    def _path(self, *parts):
+        name = hashlib.sha1("|".join(str(part) for part in parts).encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{name}.npz")
+
+    @staticmethod
+    def _load(path):
+        try:
+            with np.load(path) as file:
+                data = file["ts"], file["values"]
+            os.utime(path)  # mark as recently used
+            return data
+        except (OSError, KeyError, ValueError):
+            return None
+
+    @staticmethod
+    def _store(path, timestamps, values):
+        try:
+            replace_file(path, lambda file: np.savez(file, ts=timestamps, values=values))
+        except OSError:
+            pass  # the cache is only an optimization; the chunk is fetched again next time
+
+    def evict(self):
+        """
+        Remove the least recently used files until the cache is no larger than `max_bytes`.
+        """
+        files = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".npz"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def _horizon(self, source, start):
+        """
+        Indexing horizon of a tag [epoch ns], probed on the first request for the tag only.
+        """
+        with self.lock:
+            if source.identifier not in self.horizons:
+                horizon = indexing_horizon(self.client, [source], start=start, ttl=self.horizon_ttl)
+                self.horizons[source.identifier] = to_epoch_ns([horizon])[0]
+            return self.horizons[source.identifier]
+
+    def _off_grid(self, get_data, start, end, step, resolution):
+        """
+        Timestamps and values of the points in [start, end] that are not on the grid of `step` (the boundary points
+        interpolated by the appliance), fetched directly.
+        """
+        fetched = get_data(self._interval(start, end), resolution=resolution)
+        fetched_timestamps = to_epoch_ns(fetched.index)
+        off_grid = fetched_timestamps % step != 0
+        return fetched_timestamps[off_grid], np.asarray(fetched, dtype=float)[off_grid], fetched.dtype
+
+    def get_data(self, source, interval, resolution="1m"):
+        """
+        Cached version of `tag.get_data(interval, resolution=resolution)` for the `TagSource` of a tag. Data that is
+        not numeric is not cached.
+        """
+        get_data = source.get_data
+        if not self.enabled:
+            return get_data(interval, resolution=resolution)
+        step = pd.Timedelta(resolution).value
+        chunk = step * self.chunk_points
+        start, end = to_epoch_ns([interval.start, interval.end])
+        horizon = self._horizon(source, interval.start)
+
+        # Chunks overlapping [start, end] that end before the horizon are cacheable; the rest is fetched directly
+        chunk_starts = np.arange(start // chunk * chunk, end + 1, chunk)
+        cacheable = chunk_starts[chunk_starts + chunk <= horizon]
+
+        key = (source.identifier, step)
+        timestamps, values = [], []
+        missing = []
+        for chunk_start in cacheable:
+            data = self._load(self._path(*key, chunk_start))
+            if data is None:
+                missing.append(chunk_start)
+            else:
+                timestamps.append(data[0])
+                values.append(data[1])
+
+        # Fetch consecutive missing chunks in a single request
+        stored = False
+        runs = np.split(np.array(missing, dtype=np.int64), np.flatnonzero(np.diff(missing) != chunk) + 1)
+        for run in runs:
+            if len(run) == 0:
+                continue
+            fetched = get_data(self._interval(run[0], run[-1] + chunk), resolution=resolution)
+            if not pd.api.types.is_numeric_dtype(fetched.dtype):
+                return get_data(interval, resolution=resolution)
+            fetched_timestamps = to_epoch_ns(fetched.index)
+            fetched_values = np.asarray(fetched, dtype=float)
+            for chunk_start in run:
+                in_chunk = (fetched_timestamps >= chunk_start) & (fetched_timestamps < chunk_start + chunk)
+                self._store(self._path(*key, chunk_start), fetched_timestamps[in_chunk], fetched_values[in_chunk])
+                timestamps.append(fetched_timestamps[in_chunk])
+                values.append(fetched_values[in_chunk])
+            stored = True
+
+        # Data after the cached chunks
+        rest_start = cacheable[-1] + chunk if len(cacheable) > 0 else start
+        if rest_start <= end:
+            fetched = get_data(self._interval(max(rest_start, start), end), resolution=resolution)
+            if not pd.api.types.is_numeric_dtype(fetched.dtype):
+                return get_data(interval, resolution=resolution)
+            fetched_timestamps = to_epoch_ns(fetched.index)
+            timestamps.append(fetched_timestamps[fetched_timestamps >= rest_start])
+            values.append(np.asarray(fetched, dtype=float)[fetched_timestamps >= rest_start])
+
+        # Boundary points within the cached chunks that are not on the grid
+        edges = []
+        if (len(cacheable) > 0) and (start % step != 0):
+            edges.append((start, min(start - start % step + step, end)))
+        if (rest_start > end) and (end % step != 0) and (end - end % step > start):
+            edges.append((end - end % step, end))
+        for edge_start, edge_end in edges:
+            edge_timestamps, edge_values, dtype = self._off_grid(get_data, edge_start, edge_end, step, resolution)
+            if not pd.api.types.is_numeric_dtype(dtype):
+                return get_data(interval, resolution=resolution)
+            timestamps.append(edge_timestamps)
+            values.append(edge_values)
+
+        if stored:
+            self.evict()
+
+        timestamps = np.concatenate(timestamps) if timestamps else np.empty(0, dtype=np.int64)
+        values = np.concatenate(values) if values else np.empty(0)
+        order = np.argsort(timestamps, kind="stable")
+        timestamps, values = timestamps[order], values[order]
+        keep = (timestamps >= start) & (timestamps <= end)
+        return pd.Series(index=to_index(timestamps[keep], self.client.tz), data=values[keep])
+
+    def get_plot_data(self, source, interval, n_intervals):
+        """
+        Cached version of `tag.get_plot_data(interval, n_intervals=n_intervals)` for the `TagSource` of a tag. Only
+        intervals that end before the indexing horizon are cached.
+        """
+        get_plot_data = source.get_plot_data
+        if not self.enabled:
+            return get_plot_data(interval, n_intervals=n_intervals)
+        start, end = to_epoch_ns([interval.start, interval.end])
+        if end > self._horizon(source, interval.start):
+            return get_plot_data(interval, n_intervals=n_intervals)
+
+        path = self._path(source.identifier, "plot", start, end, n_intervals)
+        data = self._load(path)
+        if data is not None:
+            return pd.Series(index=to_index(data[0], self.client.tz), data=data[1])
+
+        fetched = get_plot_data(interval, n_intervals=n_intervals)
+        if pd.api.types.is_numeric_dtype(fetched.dtype):
+            self._store(path, to_epoch_ns(fetched.index), np.asarray(fetched, dtype=float))
+            self.evict()
+        return fetched
+
+    def _interval(self, start, end):
+        return self.client.time.interval(
+            pd.Timestamp(start, tz="UTC").tz_convert(self.client.tz),
+            pd.Timestamp(end, tz="UTC").tz_convert(self.client.tz),
+        )
+
+    def wrap_tag(self, tag):
+        """
+        Return a `CachedTag` of which `get_data` and `get_plot_data` use the cache.
+        """
+        return CachedTag(tag, self)
+
+
+class TagSource:
+    """
+    The uncached data methods of a tag, used to fill the cache and to probe the indexing horizon.
+    """
+
+    def __init__(self, tag):
+        self.identifier = tag_key(tag)
+        self.get_data = tag.get_data
+        self.get_plot_data = tag.get_plot_data
+
+
+class CachedTag:
+    """
+    Proxy of a tag of which `get_data` and `get_plot_data` use a `DataCache`. All other attributes are those of the
+    wrapped tag, and it passes `isinstance` checks for the class of the tag, so it can be used everywhere a tag is
+    expected (e.g., in search queries). The tag itself is `cached_tag.tag`.
+    """
+
+    def __init__(self, tag, cache):
+        self.tag = tag
+        self._source = TagSource(tag)
+        self._cache = cache
+
+    @property
+    def __class__(self):
+        return type(self.tag)
+
+    def __getattr__(self, name):
+        return getattr(self.tag, name)
+
+    def __repr__(self):
+        return repr(self.tag)
+
+    def get_data(self, interval, resolution="1m"):
+        return self._cache.get_data(self._source, interval, resolution=resolution)
+
+    def get_plot_data(self, interval, n_intervals):
+        return self._cache.get_plot_data(self._source, interval, n_intervals=n_intervals)
+
+
+class _CachedTagClient:
+    def __init__(self, tag_client, cache):
+        self._tag_client = tag_client
+        self._cache = cache
+
+    def __getattr__(self, name):
+        attribute = getattr(self._tag_client, name)
+        if not callable(attribute):
+            return attribute
+
+        def wrapped(*args, **kwargs):
+            result = attribute(*args, **kwargs)
+            if hasattr(result, "get_data"):
+                return self._cache.wrap_tag(result)
+            return result
+        return wrapped
+
+
+class CachedClient:
+    """
+    Wrapper around a `TrendMinerClient` of which the tags use a `DataCache`. All other attributes are those of the
+    wrapped client. Keyword arguments are passed to `DataCache`.
+    """
+
+    def __init__(self, client, **kwargs):
+        self._client = client
+        self.cache = DataCache(client, **kwargs)
+        self.tag = _CachedTagClient(client.tag, self.cache)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
@@ -0,0 +1,131 @@
+"""
+File-backed store of running totals at known timestamps, so totalizers do not have to integrate from their start time
+on every run.
+
+The store is an SQLite database (by default in the per-user cache directory), which can safely be shared by several
+processes and totalizers at once.
+"""
+import time
+
+import pandas as pd
+
+from custom_calculations._storage import (create_processed_table, is_reindexed, record_processed, sqlite_connection,
+                                          trim_processed, user_cache_file)
+from custom_calculations.horizon import tag_key
+
+
+class CheckpointStore:
+    """
+    Running totals per key (see `CheckpointStore.key`) at known timestamps.
+
+    Checkpoints newer than `settle_time` at the moment of saving are not stored, as the underlying data might still
+    change. When data arrives late, TrendMiner indexes the affected range again: an index interval overlapping a range
+    processed before invalidates all checkpoints from its start on (see `begin`). Saving a checkpoint again with a
+    different total also invalidates all later checkpoints for that key.
+    """
+
+    def __init__(self, path=None, settle_time="1h", tolerance=1e-9, timeout=30):
+        self.path = path if path is not None else user_cache_file("checkpoints.sqlite")
+        self.settle_time = pd.Timedelta(settle_time)
+        self.tolerance = tolerance
+        self.timeout = timeout
+        with self._connect() as connection:
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS checkpoints (
+                    key TEXT NOT NULL,
+                    ts INTEGER NOT NULL,
+                    total REAL NOT NULL,
+                    saved_at REAL NOT NULL,
+                    PRIMARY KEY (key, ts)
+                )
+                """
+            )
+            create_processed_table(connection)
+
+    def _connect(self):
+        return sqlite_connection(self.path, timeout=self.timeout)
+
+    @staticmethod
+    def key(tag, start_time, time_unit, resolution):
+        """
+        Key identifying one totalizer: the totalized tag (by identifier, so a re-created tag with the same name starts
+        over), the start time, the time unit and the data resolution.
+        """
+        return "|".join([
+            tag_key(tag),
+            pd.Timestamp(start_time).isoformat(),
+            str(pd.Timedelta(time_unit)),
+            str(pd.Timedelta(resolution)),
+        ])
+
+    def latest(self, key, before):
+        """
+        Return the latest checkpoint `(timestamp, total)` strictly before `before`, or None if there is none.
+        """
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT ts, total FROM checkpoints WHERE key = ? AND ts < ? ORDER BY ts DESC LIMIT 1",
+                (key, pd.Timestamp(before).value),
+            ).fetchone()
+        if row is None:
+            return None
+        return pd.Timestamp(row[0], tz="UTC").tz_convert(pd.Timestamp(before).tz), row[1]
+
+    def settled(self):
+        """
+        Latest epoch timestamp [ns] at which a checkpoint can be stored, `settle_time` ago.
+        """
+        return (pd.Timestamp.now(tz="UTC") - self.settle_time).value
+
+    def save(self, key, timestamp, total):
+        """
+        Store the running total at `timestamp`. Returns whether the checkpoint was stored: only settled timestamps are.
+        """
+        timestamp = pd.Timestamp(timestamp)
+        if timestamp.value > self.settled():
+            return False
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")  # lock before reading, so concurrent saves cannot interleave
+            row = connection.execute(
+                "SELECT total FROM checkpoints WHERE key = ? AND ts = ?",
+                (key, timestamp.value),
+            ).fetchone()
+            if (row is not None) and (abs(row[0] - total) > self.tolerance * max(1.0, abs(total))):
+                connection.execute(
+                    "DELETE FROM checkpoints WHERE key = ? AND ts > ?",
+                    (key, timestamp.value),
+                )
+            connection.execute(
+                "INSERT OR REPLACE INTO checkpoints (key, ts, total, saved_at) VALUES (?, ?, ?, ?)",
+                (key, timestamp.value, float(total), time.time()),
+            )
+        return True
+
+    def begin(self, key, start, end, backfill=None):
+        """
+        Start a run for the index interval [start, end). If it overlaps a range processed before, the range is being
+        indexed again (e.g., because data arrived late), so all checkpoints from `start` on are invalidated. Runs of a
+        backfill are exempt (see `_storage.is_reindexed`).
+        """
+        start, end = pd.Timestamp(start).value, pd.Timestamp(end).value
+        with self._connect() as connection:
+            reindexed = is_reindexed(connection, key, start, end, backfill=backfill)
+        if reindexed:
+            self.invalidate(key, start)
+
+    def processed(self, key, start, end):
+        """
+        Record that the index interval [start, end) was processed.
+        """
+        with self._connect() as connection:
+            record_processed(connection, key, pd.Timestamp(start).value, pd.Timestamp(end).value)
+
+    def invalidate(self, key, since):
+        """
+        Remove all checkpoints at or after `since`, e.g., when data before the indexing horizon was changed.
+        """
+        since = pd.Timestamp(since).value
+        with self._connect() as connection:
+            connection.execute("DELETE FROM checkpoints WHERE key = ? AND ts >= ?", (key, since))
+            trim_processed(connection, key, since)
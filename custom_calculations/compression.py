@@ -0,0 +1,166 @@
+"""
+Compression of output series before they are written, to keep only the points needed to reconstruct the signal.
+
+Three methods, each with an error bound `tolerance` in the unit of the values:
+
+* `remove_repeats`, for step and discrete tags: keeps the first point of every run of values within `tolerance` of the
+  first value of the run. Under stepped interpolation, every removed value is within `tolerance` of the signal.
+* `deadband`, for analog tags: keeps the original points needed to reconstruct the signal by linear interpolation,
+  dropping every point within `tolerance` of the straight line between the kept points around it. A point is kept as
+  soon as the line from the last kept point to the next one would leave the band of a point dropped since. With a
+  tolerance of 0, only points on a straight line between their neighbours (e.g., within flat stretches) are removed.
+* `swinging_door`, for analog tags: keeps as few points as possible such that every removed value is within `tolerance`
+  of the straight line between the kept points around it. Kept values are the original values, unless that line would
+  leave the tolerance band, in which case the kept value is moved towards it by at most `tolerance`.
+
+The first and the last point are always kept. The series must have a DatetimeIndex that is sorted, and no NaN values.
+
+    ser = compress(ser, method="swinging_door", tolerance=0.01)
+"""
+import numpy as np
+import pandas as pd
+
+from custom_calculations.timestamps import to_epoch_ns
+
+METHODS = ["repeats", "deadband", "swinging_door"]
+
+
+def _check(ser, tolerance):
+    if tolerance < 0:
+        raise ValueError(f"Compression tolerance must not be negative, got {tolerance}")
+    if ser.isna().any():
+        raise ValueError("Series to compress must not contain NaN values; drop them first")
+
+
+def _repeats_mask(values, tolerance):
+    keep = np.ones(len(values), dtype=bool)
+    if tolerance == 0:
+        keep[1:] = values[1:] != values[:-1]
+    else:
+        held = values[0]
+        for i, value in enumerate(values.tolist()):
+            if abs(value - held) > tolerance:
+                held = value
+            elif i > 0:
+                keep[i] = False
+    keep[-1] = True
+    return keep
+
+
+def _deadband_mask(times, values, tolerance):
+    keep = np.zeros(len(values), dtype=bool)
+    keep[0] = keep[-1] = True
+    anchor = 0
+    lower, upper = -np.inf, np.inf  # range of slopes from the anchor that keep all dropped points within tolerance
+    times, values = times.tolist(), values.tolist()
+    for i in range(1, len(times)):
+        elapsed = times[i] - times[anchor]
+        if not lower <= (values[i] - values[anchor]) / elapsed <= upper:
+            # The line to this point would leave the band of a dropped point: keep the previous point
+            anchor = i - 1
+            keep[anchor] = True
+            lower, upper = -np.inf, np.inf
+            elapsed = times[i] - times[anchor]
+        lower = max(lower, (values[i] - tolerance - values[anchor]) / elapsed)
+        upper = min(upper, (values[i] + tolerance - values[anchor]) / elapsed)
+    return keep
+
+
+def _seconds(index):
+    """
+    Seconds since the first timestamp of a sorted index with unique timestamps.
+    """
+    epoch_ns = to_epoch_ns(index)
+    if np.any(np.diff(epoch_ns) <= 0):
+        raise ValueError("Timestamps of the series to compress must be sorted and unique")
+    return (epoch_ns - epoch_ns[0]) / 1e9
+
+
+def _on_line(anchor_value, value, elapsed, lower, upper):
+    """
+    `value`, or the closest value reached from the anchor with a slope between `lower` and `upper`.
+    """
+    slope = (value - anchor_value) / elapsed
+    if lower <= slope <= upper:
+        return value
+    return anchor_value + min(max(slope, lower), upper) * elapsed
+
+
+def _swinging_door(times, values, tolerance):
+    """
+    Positions and values of the points kept by swinging door compression of `values` at `times` (in seconds).
+    """
+    positions = [0]
+    kept_values = [values[0]]
+    anchor_time, anchor_value = times[0], values[0]
+    lower, upper = -np.inf, np.inf  # range of slopes from the anchor that keep all points so far within tolerance
+    times, values = times.tolist(), values.tolist()
+    for i in range(1, len(times)):
+        elapsed = times[i] - anchor_time
+        new_lower = max(lower, (values[i] - tolerance - anchor_value) / elapsed)
+        new_upper = min(upper, (values[i] + tolerance - anchor_value) / elapsed)
+        if new_lower <= new_upper:
+            lower, upper = new_lower, new_upper
+            continue
+
+        # The doors opened too far: keep the previous point, on a line within the band of all points since the anchor
+        previous_elapsed = times[i - 1] - anchor_time
+        anchor_value = _on_line(anchor_value, values[i - 1], previous_elapsed, lower, upper)
+        anchor_time = times[i - 1]
+        positions.append(i - 1)
+        kept_values.append(anchor_value)
+        elapsed = times[i] - anchor_time
+        lower = (values[i] - tolerance - anchor_value) / elapsed
+        upper = (values[i] + tolerance - anchor_value) / elapsed
+
+    if len(times) > 1:
+        last_value = _on_line(anchor_value, values[-1], times[-1] - anchor_time, lower, upper)
+        positions.append(len(times) - 1)
+        kept_values.append(last_value)
+    return np.array(positions), np.array(kept_values)
+
+
+def remove_repeats(ser, tolerance=0):
+    """
+    Keep the first point of every run of values within `tolerance` of the first value of the run, and the last point.
+    """
+    _check(ser, tolerance)
+    if len(ser) < 3:
+        return ser
+    return ser[_repeats_mask(ser.to_numpy(), tolerance)]
+
+
+def deadband(ser, tolerance=0):
+    """
+    Keep the original points needed to reconstruct `ser` by linear interpolation within `tolerance`.
+    """
+    _check(ser, tolerance)
+    if len(ser) < 3:
+        return ser
+    return ser[_deadband_mask(_seconds(ser.index), ser.to_numpy(dtype=np.float64), tolerance)]
+
+
+def swinging_door(ser, tolerance=0):
+    """
+    Keep the points needed to reconstruct `ser` by linear interpolation within `tolerance`.
+    """
+    _check(ser, tolerance)
+    if len(ser) < 3:
+        return ser
+    positions, values = _swinging_door(_seconds(ser.index), ser.to_numpy(dtype=np.float64), tolerance)
+    return pd.Series(values, index=ser.index[positions], name=ser.name)
+
+
+def compress(ser, method=None, tolerance=0):
+    """
+    Compress `ser` with `method` (one of `METHODS`), or return it unchanged if `method` is None.
+    """
+    if method is None:
+        return ser
+    if method == "repeats":
+        return remove_repeats(ser, tolerance)
+    if method == "deadband":
+        return deadband(ser, tolerance)
+    if method == "swinging_door":
+        return swinging_door(ser, tolerance)
+    raise ValueError(f"Unknown compression method {method!r}; choose one of {', '.join(METHODS)}")
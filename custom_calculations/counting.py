@@ -0,0 +1,111 @@
+"""
+Counting events (e.g., search results) per bucket (e.g., regular intervals or the results of another search).
+
+An event belongs to a bucket when it starts in it, using half-open `[start, end)` bucket semantics. All times are int64
+arrays of nanoseconds since the epoch, see `custom_calculations.timestamps.interval_arrays`.
+"""
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from custom_calculations.timestamps import to_index
+
+EventCounts = namedtuple("EventCounts", ["count", "total_duration", "min_duration", "max_duration"])
+EventCounts.__doc__ = """
+Per-bucket event statistics. `count` is an int64 array, the durations are timedelta64[ns] arrays. The minimal and
+maximal durations are NaT for buckets without events.
+"""
+
+
+def _sort_events(event_starts, event_ends):
+    event_starts = np.asarray(event_starts, dtype=np.int64)
+    event_ends = np.asarray(event_ends, dtype=np.int64)
+    if np.any(event_starts[1:] < event_starts[:-1]):
+        order = np.argsort(event_starts, kind="stable")
+        event_starts, event_ends = event_starts[order], event_ends[order]
+    return event_starts, event_ends
+
+
+def event_bounds(bucket_starts, bucket_ends, event_starts):
+    """
+    For every bucket, return the positions `(first, last)` in the sorted `event_starts` such that
+    `event_starts[first:last]` are the events starting in `[bucket_start, bucket_end)`.
+    """
+    first = np.searchsorted(event_starts, np.asarray(bucket_starts, dtype=np.int64), side="left")
+    last = np.searchsorted(event_starts, np.asarray(bucket_ends, dtype=np.int64), side="left")
+    return first, np.maximum(first, last)
+
+
+def count_events(bucket_starts, bucket_ends, event_starts, event_ends):
+    """
+    Count the events starting in every bucket, and get the total, minimal and maximal duration of these events.
+
+    Buckets do not need to be sorted or contiguous. Events are sorted by start time if they are not already. The cost is
+    O((buckets + events) log(events)), rather than O(buckets x events) for checking every event against every bucket.
+    """
+    event_starts, event_ends = _sort_events(event_starts, event_ends)
+    first, last = event_bounds(bucket_starts, bucket_ends, event_starts)
+    count = last - first
+
+    durations = event_ends - event_starts
+    cumulative = np.concatenate([[0], np.cumsum(durations)])
+    total_duration = (cumulative[last] - cumulative[first]).astype("timedelta64[ns]")
+
+    min_duration = np.full(len(count), np.timedelta64("NaT"), dtype="timedelta64[ns]")
+    max_duration = min_duration.copy()
+    has_events = count > 0
+    if has_events.any():
+        # reduceat reduces over [indices[i], indices[i+1]); interleaving first/last gives the bucket slices at the even
+        # positions. The sentinel makes `last == len(events)` a valid index.
+        indices = np.column_stack([first[has_events], last[has_events]]).ravel()
+        padded = np.append(durations, 0)
+        min_duration[has_events] = np.minimum.reduceat(padded, indices)[::2]
+        max_duration[has_events] = np.maximum.reduceat(padded, indices)[::2]
+
+    return EventCounts(count, total_duration, min_duration, max_duration)
+
+
+def incrementing_counter(bucket_starts, bucket_ends, event_starts, tz, default_value=None):
+    """
+    Build an incrementing counter that resets at the start of every bucket, as a single Series with name "value".
+
+    Every bucket starts at 0, unless an event starts exactly at the bucket start. The counter increments by 1 at the
+    start of every event in the bucket. When `default_value` is given, the counter returns to that value at the end of
+    every bucket (e.g., in between search results). Buckets are expected to be sorted by start time.
+    """
+    bucket_starts = np.asarray(bucket_starts, dtype=np.int64)
+    bucket_ends = np.asarray(bucket_ends, dtype=np.int64)
+    event_starts = np.sort(np.asarray(event_starts, dtype=np.int64))
+    first, last = event_bounds(bucket_starts, bucket_ends, event_starts)
+    count = last - first
+
+    # Position of every event within its bucket, without looping over the buckets
+    bucket_of_event = np.repeat(np.arange(len(count)), count)
+    offset = np.arange(len(bucket_of_event)) - np.repeat(np.cumsum(count) - count, count)
+    event_index = first[bucket_of_event] + offset
+
+    has_zero = np.ones(len(count), dtype=bool)
+    has_zero[count > 0] = event_starts[first[count > 0]] != bucket_starts[count > 0]
+    has_end = default_value is not None
+
+    # Output layout per bucket: [zero], events, [default value at end]
+    sizes = has_zero + count + has_end
+    position = np.cumsum(sizes) - sizes
+    dtype = np.int64 if default_value is None else np.result_type(np.int64, np.asarray(default_value).dtype)
+    timestamps = np.empty(sizes.sum(), dtype=np.int64)
+    values = np.empty(sizes.sum(), dtype=dtype)
+
+    timestamps[position[has_zero]] = bucket_starts[has_zero]
+    values[position[has_zero]] = 0
+
+    event_position = position[bucket_of_event] + has_zero[bucket_of_event] + offset
+    timestamps[event_position] = event_starts[event_index]
+    values[event_position] = offset + 1
+
+    if has_end:
+        end_position = position + has_zero + count
+        timestamps[end_position] = bucket_ends
+        values[end_position] = default_value
+
+    return pd.Series(index=to_index(timestamps, tz), data=values, name="value")
@@ -0,0 +1,159 @@
+"""
+Columnar storage of intervals (search results or regular intervals) and their calculation results.
+
+The SDK returns intervals as lists of Interval objects, with calculation results stored by key (`interval["calc1"]`).
+An `IntervalFrame` holds the same information as arrays: the start and end times as int64 arrays of nanoseconds since
+the epoch, and an array per calculation key. Numeric calculations are float64 arrays, in which missing results (None,
+or a key that is absent on an interval) are NaN and flagged in the `missing` mask of the key. Custom operations on all
+intervals are then array operations, rather than loops over the Interval objects.
+
+    frame = IntervalFrame.from_intervals(search.get_results(search_interval), tz=client.tz, keys=["calc1", "calc2"])
+    frame["result"] = frame["calc1"] * frame["calc2"]
+    ser = frame.step_series("result", default=0)
+"""
+import numbers
+
+import numpy as np
+import pandas as pd
+
+from custom_calculations.timestamps import interval_arrays, to_index
+
+
+def interval_result(interval, key):
+    """
+    Calculation result of `key` on an SDK interval, or None if the interval has no result for `key`.
+    """
+    try:
+        return interval[key]
+    except KeyError:
+        return None
+
+
+def _column(values):
+    """
+    Column array and missing-value mask of calculation results. Numeric results are stored as float64, with NaN for
+    missing results; other results (e.g., strings) are stored as an object array.
+    """
+    values = np.asarray(values) if not isinstance(values, np.ndarray) else values
+    if values.dtype.kind in "biuf":
+        values = values.astype(np.float64, copy=False)
+        return values, np.isnan(values)
+    values = values.astype(object, copy=False)
+    missing = np.array([(value is None) or (value != value) for value in values.tolist()], dtype=bool)
+    if all(isinstance(value, numbers.Real) for value in values[~missing].tolist()):
+        numeric = np.full(len(values), np.nan)
+        numeric[~missing] = values[~missing].astype(np.float64)
+        return numeric, missing
+    return values, missing
+
+
+class IntervalFrame:
+    """
+    Intervals [start, end) in time zone `tz`, with a column of calculation results per key.
+    """
+
+    def __init__(self, starts, ends, tz="UTC", columns=None):
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.ends = np.asarray(ends, dtype=np.int64)
+        if self.starts.shape != self.ends.shape:
+            raise ValueError(f"Got {len(self.starts)} interval starts but {len(self.ends)} ends")
+        self.tz = tz
+        self.columns = {}
+        self.missing = {}
+        for key, values in (columns or {}).items():
+            self[key] = values
+
+    @classmethod
+    def from_intervals(cls, intervals, tz=None, keys=()):
+        """
+        Frame of a list of SDK intervals, e.g. search results or the output of `client.time.interval.range`, with a
+        column of the calculation results of every key in `keys`. A key that is absent on an interval is a missing
+        result.
+        """
+        starts, ends = interval_arrays(intervals)
+        if tz is None:
+            tz = getattr(intervals[0].start, "tzinfo", None) if len(intervals) > 0 else None
+        columns = {key: [interval_result(interval, key) for interval in intervals] for key in keys}
+        return cls(starts, ends, tz=tz or "UTC", columns=columns)
+
+    def to_intervals(self, client):
+        """
+        List of SDK intervals, with the calculation results set by key (missing results are left out), e.g. to pass to
+        `tag.calculate`.
+        """
+        intervals = [
+            client.time.interval(start, end)
+            for start, end in zip(to_index(self.starts, self.tz), to_index(self.ends, self.tz))
+        ]
+        for key, values in self.columns.items():
+            for interval, value, missing in zip(intervals, values.tolist(), self.missing[key].tolist()):
+                if not missing:
+                    interval[key] = value
+        return intervals
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __contains__(self, key):
+        return key in self.columns
+
+    def keys(self):
+        return self.columns.keys()
+
+    def __getitem__(self, key):
+        """
+        The column of `key`, or, for a slice, boolean mask or array of positions, a frame of the selected intervals.
+        """
+        if isinstance(key, str):
+            return self.columns[key]
+        return self.take(key)
+
+    def __setitem__(self, key, values):
+        if np.isscalar(values) or values is None:
+            values = [values] * len(self)
+        values, missing = _column(values)
+        if len(values) != len(self):
+            raise ValueError(f"Column '{key}' has {len(values)} values for {len(self)} intervals")
+        self.columns[key] = values
+        self.missing[key] = missing
+
+    def take(self, selection):
+        """
+        Frame of the intervals selected by a slice, boolean mask or array of positions.
+        """
+        frame = IntervalFrame(self.starts[selection], self.ends[selection], tz=self.tz)
+        frame.columns = {key: values[selection] for key, values in self.columns.items()}
+        frame.missing = {key: missing[selection] for key, missing in self.missing.items()}
+        return frame
+
+    @property
+    def durations(self):
+        """
+        Interval durations, as an int64 array of nanoseconds.
+        """
+        return self.ends - self.starts
+
+    def start_index(self):
+        return to_index(self.starts, self.tz)
+
+    def end_index(self):
+        return to_index(self.ends, self.tz)
+
+    def series(self, key, name=None):
+        """
+        The results of `key` at the interval starts, with NaN for missing results.
+        """
+        return pd.Series(self.columns[key], index=self.start_index(), name=name)
+
+    def step_series(self, key, default=0, name="value"):
+        """
+        The results of `key` at the interval starts, and `default` at the interval ends, e.g. to output a tag that has
+        the result of a search calculation during every search result.
+        """
+        values = np.empty(2 * len(self), dtype=self.columns[key].dtype)
+        values[0::2] = self.columns[key]
+        values[1::2] = default
+        timestamps = np.empty(2 * len(self), dtype=np.int64)
+        timestamps[0::2] = self.starts
+        timestamps[1::2] = self.ends
+        return pd.Series(values, index=to_index(timestamps, self.tz), name=name)
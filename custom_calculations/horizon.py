@@ -0,0 +1,116 @@
+"""
+Determine the last timestamp up to which all dependency tags are indexed (the indexing horizon).
+
+All tags are probed concurrently, and the horizon of every tag is cached in a file for a short time so consecutive
+runs (and other scripts depending on the same tags) can reuse it. A cached horizon can only be too early, never too
+late, so reusing it is always safe: at worst a run calculates a little less than possible. This relies on the cache
+file only being written by the current user, so it is kept in the per-user cache directory (and not used if that
+directory is accessible by others), and on horizons being cached per appliance (see `appliance_key`).
+"""
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from custom_calculations._storage import private_directory, replace_file, user_cache_dir
+from custom_calculations.instrumentation import staged
+
+DEFAULT_CACHE_FILE = os.path.join(user_cache_dir(), "horizons.json")
+
+
+def tag_key(tag):
+    """
+    Identifier of a tag to use in cache keys.
+    """
+    return str(getattr(tag, "identifier", None) or tag.name)
+
+
+def appliance_key(client):
+    """
+    Identifier of the appliance a client is connected to (its base URL), to use in cache keys, so tags with the same
+    identifier on different appliances are cached separately.
+    """
+    return str(getattr(client, "url", None) or getattr(client, "base_url", None) or "")
+
+
+def _read_cache(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_cache(path, cache):
+    try:
+        replace_file(path, lambda file: file.write(json.dumps(cache).encode()))
+    except OSError:
+        pass  # the cache is only an optimization
+
+
+def _probe(client, tag, start, previous):
+    """
+    Last indexed timestamp of a tag after `start`, or None when the tag has no data after `start`. When a previous
+    horizon is known, only the range after it needs to be scanned.
+    """
+    now = client.time.now()
+    for probe_start in ([previous, start] if (previous is not None) and (previous > start) else [start]):
+        try:
+            return tag.get_plot_data(client.time.interval(probe_start, now), n_intervals=2).index[-1]
+        except IndexError:
+            continue
+    return None
+
+
+@staged("indexing_horizon")
+def indexing_horizon(client, tags, start, ttl="30s", cache_file=DEFAULT_CACHE_FILE, max_workers=8):
+    """
+    Return the last timestamp up to which all `tags` are indexed, or `start` if any of the tags has no data after
+    `start`.
+
+    Horizons cached less than `ttl` ago are reused; the others are probed concurrently, using at most `max_workers`
+    threads. Pass `cache_file=None` to disable caching across runs.
+    """
+    start = pd.Timestamp(start)
+    if cache_file is not None:
+        try:
+            private_directory(os.path.dirname(os.path.abspath(cache_file)))
+        except (OSError, ValueError):
+            cache_file = None  # others could write a horizon that is too late
+    cache = _read_cache(cache_file) if cache_file is not None else {}
+    now = time.time()
+    ttl = pd.Timedelta(ttl).total_seconds()
+
+    horizons = {}
+    to_probe = {}
+    appliance = appliance_key(client)
+    for tag in tags:
+        key = f"{appliance}|{tag_key(tag)}"
+        entry = cache.get(key)
+        previous = pd.Timestamp(entry["horizon"], tz="UTC") if entry is not None else None
+        if (previous is not None) and (now - entry["probed_at"] < ttl) and (previous >= start):
+            horizons[key] = previous
+        else:
+            to_probe[key] = (tag, previous)
+
+    if to_probe:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(to_probe)))) as executor:
+            futures = {
+                key: executor.submit(_probe, client, tag, start, previous)
+                for key, (tag, previous) in to_probe.items()
+            }
+            for key, future in futures.items():
+                horizons[key] = future.result()
+
+        if cache_file is not None:
+            cache = _read_cache(cache_file)  # re-read to keep entries written by other processes in the meantime
+            for key in to_probe:
+                if horizons[key] is not None:
+                    cache[key] = {"horizon": pd.Timestamp(horizons[key]).value, "probed_at": now}
+            _write_cache(cache_file, cache)
+
+    if (not horizons) or any(horizon is None for horizon in horizons.values()):
+        return start
+    return min(pd.Timestamp(horizon) for horizon in horizons.values()).tz_convert(start.tz)
@@ -0,0 +1,306 @@
+"""
+Per-stage timing, API call and memory instrumentation of calculation runs, to find out where the time of a slow
+calculated tag goes.
+
+Set the environment variable `CUSTOM_CALCULATIONS_PROFILE` to switch it on:
+
+* `json`: write the profile of the run as JSON next to the output, to `<OUTPUT_FILE>.profile.json`,
+* `log`: print a line per stage to stderr.
+
+When it is not set, `instrument` returns the client itself and `stage` does nothing, so the instrumentation costs
+nothing. Otherwise, every API call of the client (`tag.get_by_name`, `tag.get_data`, `tag.get_plot_data`,
+`tag.calculate` and `search.get_results` of the tags and searches it creates) is a stage named after the method, and
+the main steps in this package (e.g., `indexing_horizon` and `write_csv`) are stages of their own. Per stage, the
+profile holds the number of calls, the wall time, the number of returned data points and search results, and the peak
+memory allocated during the stage (measured with `tracemalloc`, for the stages on the main thread). The time outside
+of any stage is reported as `local`.
+
+    client = instrument(TrendMinerClient.from_token(...))
+
+    with stage("custom"):
+        ...
+
+    @staged("preprocessing")
+    def preprocess(data):
+        ...
+
+The profile is written when the process exits, or when the worker finishes a run (see `finish`).
+"""
+import atexit
+import contextlib
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+PROFILE_VARIABLE = "CUSTOM_CALCULATIONS_PROFILE"
+MODES = ("json", "log")
+
+_NO_STAGE = contextlib.nullcontext()
+_active = None
+
+
+class StageRecord:
+    """
+    Totals of all calls of one stage.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.wall_time = 0.0
+        self.points = 0
+        self.results = 0
+        self.peak_memory = None
+
+    def as_dict(self):
+        return {
+            "calls": self.calls,
+            "wall_time": self.wall_time,
+            "points": self.points,
+            "results": self.results,
+            "peak_memory": self.peak_memory,
+        }
+
+
+class Profile:
+    """
+    Stage records of one run.
+    """
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.stages = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.main_thread = threading.main_thread()
+        self.start = time.perf_counter()
+        self.staged_time = 0.0  # wall time of the outermost stages on the main thread
+        self.started_tracing = not tracemalloc.is_tracing()
+        if self.started_tracing:
+            tracemalloc.start()
+
+    def _stack(self):
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        with self.lock:
+            record = self.stages.setdefault(name, StageRecord())
+        on_main_thread = threading.current_thread() is self.main_thread
+        stack = self._stack()
+        if on_main_thread:
+            # The peak of the enclosing stages so far, before resetting it for this stage
+            peak = tracemalloc.get_traced_memory()[1]
+            for _, outer_peak in stack:
+                outer_peak[0] = max(outer_peak[0], peak)
+            tracemalloc.reset_peak()
+        entry = (record, [0])
+        stack.append(entry)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            wall_time = time.perf_counter() - start
+            stack.pop()
+            with self.lock:
+                record.calls += 1
+                record.wall_time += wall_time
+                if on_main_thread:
+                    peak = max(entry[1][0], tracemalloc.get_traced_memory()[1])
+                    record.peak_memory = max(record.peak_memory or 0, peak)
+                    for _, outer_peak in stack:
+                        outer_peak[0] = max(outer_peak[0], peak)
+                    if not stack:
+                        self.staged_time += wall_time
+
+    def report(self):
+        wall_time = time.perf_counter() - self.start
+        stages = {name: record.as_dict() for name, record in self.stages.items()}
+        stages["local"] = {
+            "calls": 1,
+            "wall_time": max(wall_time - self.staged_time, 0.0),
+            "points": 0,
+            "results": 0,
+            "peak_memory": None,
+        }
+        return {
+            "script": os.path.abspath(sys.argv[0]) if sys.argv and sys.argv[0] else None,
+            "start": os.environ.get("START_TIMESTAMP"),
+            "end": os.environ.get("END_TIMESTAMP"),
+            "wall_time": wall_time,
+            "peak_memory": tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else None,
+            "stages": stages,
+        }
+
+    def write(self):
+        report = self.report()
+        output_file = os.environ.get("OUTPUT_FILE")
+        if (self.mode == "json") and output_file:
+            with open(output_file + ".profile.json", "w") as file:
+                json.dump(report, file, indent=2)
+            return
+        for name, record in report["stages"].items():
+            peak = "" if record["peak_memory"] is None else f" peak_memory={record['peak_memory'] / 1e6:.1f}MB"
+            print(
+                f"profile: stage={name} calls={record['calls']} wall_time={record['wall_time']:.3f}s"
+                f" points={record['points']} results={record['results']}{peak}",
+                file=sys.stderr,
+            )
+        print(f"profile: total wall_time={report['wall_time']:.3f}s", file=sys.stderr)
+
+
+def stage(name):
+    """
+    Context manager timing the code in it as stage `name`. Yields the `StageRecord` of the stage (to add the number of
+    points or results to), or None when the instrumentation is off.
+    """
+    profile = _active
+    return _NO_STAGE if profile is None else profile.stage(name)
+
+
+def staged(name):
+    """
+    Decorator recording every call of a function as stage `name`.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapped(*args, **kwargs):
+            profile = _active
+            if profile is None:
+                return function(*args, **kwargs)
+            with profile.stage(name):
+                return function(*args, **kwargs)
+        return wrapped
+    return decorator
+
+
+def _instrumented(profile, name, method, count):
+    """
+    `method`, recorded as stage `name`. `count(record, result)` adds the size of the result to the record.
+    """
+    method = getattr(method, "_uninstrumented", method)  # tags reused across runs (e.g., by the worker)
+
+    @functools.wraps(method)
+    def wrapped(*args, **kwargs):
+        if profile is not _active:  # a later run, which might not be instrumented
+            return method(*args, **kwargs)
+        with profile.stage(name) as record:
+            result = method(*args, **kwargs)
+            count(record, result)
+        return result
+
+    wrapped._uninstrumented = method
+    return wrapped
+
+
+def _count_points(record, data):
+    record.points += len(data)
+
+
+def _count_results(record, results):
+    record.results += len(results) if results is not None else 0
+
+
+def _wrap_methods(profile, obj, prefix, counts):
+    """
+    Record the methods of `obj` as stages. The object itself is returned, so it can still be used everywhere (e.g., a
+    tag in search queries).
+    """
+    for method_name, count in counts.items():
+        method = getattr(obj, method_name, None)
+        if callable(method):
+            object.__setattr__(obj, method_name, _instrumented(profile, f"{prefix}.{method_name}", method, count))
+    return obj
+
+
+_TAG_METHODS = {"get_data": _count_points, "get_plot_data": _count_points, "calculate": _count_results}
+_SEARCH_METHODS = {"get_results": _count_results}
+
+
+class _InstrumentedTagClient:
+    def __init__(self, tag_client, profile):
+        self._tag_client = tag_client
+        self._profile = profile
+
+    def __getattr__(self, name):
+        attribute = getattr(self._tag_client, name)
+        if not callable(attribute):
+            return attribute
+
+        def wrapped(*args, **kwargs):
+            with self._profile.stage(f"tag.{name}"):
+                result = attribute(*args, **kwargs)
+            if hasattr(result, "get_data"):
+                return _wrap_methods(self._profile, result, "tag", _TAG_METHODS)
+            return result
+        return wrapped
+
+
+class _InstrumentedSearchClient:
+    def __init__(self, search_client, profile):
+        self._search_client = search_client
+        self._profile = profile
+
+    def __getattr__(self, name):
+        attribute = getattr(self._search_client, name)
+        if not callable(attribute):
+            return attribute
+
+        def wrapped(*args, **kwargs):
+            return _wrap_methods(self._profile, attribute(*args, **kwargs), "search", _SEARCH_METHODS)
+        return wrapped
+
+
+class InstrumentedClient:
+    """
+    Wrapper around a `TrendMinerClient` recording its API calls as stages of `profile`. All other attributes are those
+    of the wrapped client.
+    """
+
+    def __init__(self, client, profile):
+        self._client = client
+        self.profile = profile
+        self.tag = _InstrumentedTagClient(client.tag, profile)
+        self.search = _InstrumentedSearchClient(client.search, profile)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def instrument(client):
+    """
+    Start recording a profile of this run when `CUSTOM_CALCULATIONS_PROFILE` is set, and return the client wrapped to
+    record its API calls. Returns the client itself otherwise.
+    """
+    global _active
+    mode = os.environ.get(PROFILE_VARIABLE, "").strip().lower()
+    if mode in ("", "0", "off", "false"):
+        return client
+    if mode not in MODES:
+        raise ValueError(f"Unknown {PROFILE_VARIABLE} '{mode}', expected one of {', '.join(MODES)}")
+    finish()
+    _active = Profile(mode)
+    return InstrumentedClient(client, _active)
+
+
+def finish():
+    """
+    Write the profile of the current run, if any, and stop recording.
+    """
+    global _active
+    profile, _active = _active, None
+    if profile is None:
+        return
+    try:
+        profile.write()
+    finally:
+        if profile.started_tracing:
+            tracemalloc.stop()
+
+
+atexit.register(finish)
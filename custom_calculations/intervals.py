@@ -0,0 +1,142 @@
+"""
+Interval algebra on start and end arrays, e.g. to post-process search results.
+
+Intervals are half-open `[start, end)`, with the start and end times as int64 arrays of nanoseconds since the epoch
+(see `custom_calculations.timestamps.interval_arrays`). `merge` turns any intervals into a sorted, disjoint set, in
+which touching intervals are joined; all other operations return such a set, and expect their inputs to be one (pass
+them through `merge` first otherwise). Every operation is a single vectorized pass of O(n log n) at most.
+
+    starts, ends = interval_arrays(search.get_results(search_interval))
+    starts, ends = merge_gaps(starts, ends, max_gap=pd.Timedelta("5m"))
+    starts, ends = filter_duration(starts, ends, min_duration=pd.Timedelta("1h"))
+"""
+import numpy as np
+import pandas as pd
+
+# Membership codes of the two inputs of a set operation
+_IN_A = 1
+_IN_B = 2
+
+
+def _arrays(starts, ends):
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    if starts.shape != ends.shape:
+        raise ValueError(f"Got {len(starts)} interval starts but {len(ends)} ends")
+    return starts, ends
+
+
+def _ns(duration):
+    return pd.Timedelta(duration).value
+
+
+def merge(starts, ends):
+    """
+    Sorted, disjoint intervals covering the same time as the given intervals; overlapping and touching intervals are
+    joined, and empty intervals are dropped.
+    """
+    starts, ends = _arrays(starts, ends)
+    nonempty = ends > starts
+    starts, ends = starts[nonempty], ends[nonempty]
+    if len(starts) == 0:
+        return starts, ends
+    if np.any(starts[1:] < starts[:-1]):
+        order = np.argsort(starts, kind="stable")
+        starts, ends = starts[order], ends[order]
+    running_end = np.maximum.accumulate(ends)
+    new_group = np.concatenate([[True], starts[1:] > running_end[:-1]])
+    group_end = np.concatenate([np.flatnonzero(new_group)[1:] - 1, [len(starts) - 1]])
+    return starts[new_group], running_end[group_end]
+
+
+def _combine(a_starts, a_ends, b_starts, b_ends, keep):
+    """
+    The parts of time in which the membership code (`_IN_A`, `_IN_B`, or both) satisfies `keep`, for two sorted,
+    disjoint sets of intervals.
+    """
+    a_starts, a_ends = _arrays(a_starts, a_ends)
+    b_starts, b_ends = _arrays(b_starts, b_ends)
+    times = np.concatenate([a_starts, a_ends, b_starts, b_ends])
+    changes = np.concatenate([
+        np.full(len(a_starts), _IN_A), np.full(len(a_ends), -_IN_A),
+        np.full(len(b_starts), _IN_B), np.full(len(b_ends), -_IN_B),
+    ])
+    order = np.argsort(times, kind="stable")
+    times, code = times[order], np.cumsum(changes[order])
+
+    # The code after the last change at every time holds until the next time
+    last = np.concatenate([times[1:] != times[:-1], [True]])
+    times, code = times[last], code[last]
+    selected = keep(code[:-1])
+    return merge(times[:-1][selected], times[1:][selected])
+
+
+def union(a_starts, a_ends, b_starts, b_ends):
+    """
+    Time covered by either set of intervals.
+    """
+    return merge(np.concatenate([a_starts, b_starts]), np.concatenate([a_ends, b_ends]))
+
+
+def intersection(a_starts, a_ends, b_starts, b_ends):
+    """
+    Time covered by both sets of intervals.
+    """
+    return _combine(a_starts, a_ends, b_starts, b_ends, lambda code: code == (_IN_A | _IN_B))
+
+
+def difference(a_starts, a_ends, b_starts, b_ends):
+    """
+    Time covered by the first set of intervals, but not by the second.
+    """
+    return _combine(a_starts, a_ends, b_starts, b_ends, lambda code: code == _IN_A)
+
+
+def complement(starts, ends, window_start, window_end):
+    """
+    Time within [window_start, window_end) not covered by the intervals (e.g., the gaps between search results).
+    """
+    window_start, window_end = pd.Timestamp(window_start).value, pd.Timestamp(window_end).value
+    return difference([window_start], [window_end], starts, ends)
+
+
+def merge_gaps(starts, ends, max_gap):
+    """
+    Join intervals separated by gaps of at most `max_gap`.
+    """
+    starts, ends = _arrays(starts, ends)
+    if len(starts) == 0:
+        return starts, ends
+    new_group = np.concatenate([[True], (starts[1:] - ends[:-1]) > _ns(max_gap)])
+    group_end = np.concatenate([np.flatnonzero(new_group)[1:] - 1, [len(starts) - 1]])
+    return starts[new_group], ends[group_end]
+
+
+def filter_duration(starts, ends, min_duration=None, max_duration=None):
+    """
+    Intervals lasting at least `min_duration` and at most `max_duration`.
+    """
+    starts, ends = _arrays(starts, ends)
+    keep = np.ones(len(starts), dtype=bool)
+    if min_duration is not None:
+        keep &= (ends - starts) >= _ns(min_duration)
+    if max_duration is not None:
+        keep &= (ends - starts) <= _ns(max_duration)
+    return starts[keep], ends[keep]
+
+
+def shift(starts, ends, offset):
+    """
+    Intervals moved in time by `offset`.
+    """
+    starts, ends = _arrays(starts, ends)
+    return starts + _ns(offset), ends + _ns(offset)
+
+
+def extend(starts, ends, before=0, after=0):
+    """
+    Intervals starting `before` earlier and ending `after` later; negative durations shrink them instead. Intervals
+    that start to overlap are joined, and intervals that vanish are dropped.
+    """
+    starts, ends = _arrays(starts, ends)
+    return merge(starts - _ns(before), ends + _ns(after))
@@ -0,0 +1,50 @@
+"""
+Run independent data requests (data fetches, searches, calculations) concurrently.
+
+A script declares all of its requests up front, after which they are executed in a thread pool. The wall time then
+approaches that of the slowest request, rather than the sum of all requests.
+
+    plan = FetchPlan(max_workers=4)
+    plan.add("temperature", temperature_tag.get_data, index_interval, resolution="1m")
+    plan.add("downtimes", search_downtime.get_results, search_interval)
+    results = plan.run()
+    results["temperature"], results["downtimes"]
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from custom_calculations.instrumentation import staged
+
+
+class FetchPlan:
+    """
+    Collection of named, independent requests that are executed concurrently by `run`, using at most `max_workers`
+    threads.
+    """
+
+    def __init__(self, max_workers=8):
+        self.max_workers = max_workers
+        self.requests = {}
+
+    def add(self, name, function, *args, **kwargs):
+        """
+        Declare the request `function(*args, **kwargs)`, of which the result will be available under `name`.
+        """
+        if name in self.requests:
+            raise ValueError(f"A request named '{name}' was already added")
+        self.requests[name] = (function, args, kwargs)
+        return self
+
+    @staged("fetch_plan")
+    def run(self):
+        """
+        Execute all requests and return their results as a dict by name. If any of the requests fails, the error of the
+        first failed request (in the order they were added) is raised once all requests have finished.
+        """
+        if not self.requests:
+            return {}
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(self.requests)))) as executor:
+            futures = {
+                name: executor.submit(function, *args, **kwargs)
+                for name, (function, args, kwargs) in self.requests.items()
+            }
+        return {name: future.result() for name, future in futures.items()}
@@ -0,0 +1,167 @@
+"""
+Vectorized and memoized thermodynamic property evaluation with CoolProp.
+
+Inputs are quantized to the given precisions (which should match the sensor precision), after which every unique pair
+of inputs is evaluated only once, in a single vectorized CoolProp call. Results are kept in a bounded LRU cache, which
+can be stored in a file (a plain `.npz` array file in the per-user cache directory by default) to persist across runs.
+
+Quantization changes the result by at most half a precision step in each input. With the defaults (0.01 K and 100 Pa),
+the specific enthalpy of liquid water or superheated steam differs less than 0.03 kJ/kg (roughly cp * 0.005 K) from
+the unquantized value. Close to the saturation line, quantization can move a point to the other phase; choose a finer
+precision if the process operates there.
+"""
+import json
+import os
+import zipfile
+from collections import OrderedDict
+
+import numpy as np
+
+from custom_calculations._storage import replace_file, user_cache_dir
+
+DEFAULT_CACHE_FILE = os.path.join(user_cache_dir(), "properties.npz")
+
+
+class PropertyCache:
+    """
+    Bounded LRU cache of property values, optionally stored in the file `path` (see `save`). The least recently used
+    values are evicted once more than `max_size` values are cached.
+
+    Keys are tuples of a namespace tuple (of strings and numbers) and two integer steps, as used by `props_si`. The file
+    only holds plain arrays, and is read without unpickling, so loading a file cannot run code. A missing or corrupt
+    file gives an empty cache.
+    """
+
+    def __init__(self, path=None, max_size=100_000):
+        self.path = path
+        self.max_size = max_size
+        self.values = OrderedDict()
+        if (path is not None) and os.path.exists(path):
+            try:
+                self.values = self._load(path)
+            except (OSError, EOFError, KeyError, ValueError, TypeError, AttributeError, zipfile.BadZipFile):
+                self.values = OrderedDict()
+
+    @staticmethod
+    def _load(path):
+        with np.load(path, allow_pickle=False) as file:
+            namespaces = [tuple(json.loads(namespace)) for namespace in file["namespaces"].tolist()]
+            codes, steps1, steps2, values = file["codes"], file["steps1"], file["steps2"], file["values"]
+        if not len(codes) == len(steps1) == len(steps2) == len(values):
+            raise ValueError(f"Inconsistent property cache file {path}")
+        return OrderedDict(
+            ((namespaces[code], step1, step2), value)
+            for code, step1, step2, value in zip(codes.tolist(), steps1.tolist(), steps2.tolist(), values.tolist())
+        )
+
+    def get(self, keys):
+        """
+        Return the cached values for `keys` as an array, and a mask of the keys that are cached. Cached values can be
+        NaN, for inputs that CoolProp cannot evaluate.
+        """
+        values = np.full(len(keys), np.nan)
+        found = np.zeros(len(keys), dtype=bool)
+        for i, key in enumerate(keys):
+            if key in self.values:
+                self.values.move_to_end(key)
+                values[i] = self.values[key]
+                found[i] = True
+        return values, found
+
+    def put(self, keys, values):
+        """
+        Add the values for `keys` to the cache, evicting the least recently used values when full.
+        """
+        for key, value in zip(keys, values):
+            self.values[key] = value
+            self.values.move_to_end(key)
+        while len(self.values) > self.max_size:
+            self.values.popitem(last=False)
+
+    def save(self):
+        """
+        Store the cache in its file. The file is replaced atomically, so concurrent runs never read a partial file.
+        """
+        if self.path is None:
+            return
+        namespaces = list(dict.fromkeys(namespace for namespace, _, _ in self.values))
+        codes = {namespace: code for code, namespace in enumerate(namespaces)}
+        arrays = {
+            "namespaces": np.array([json.dumps(list(namespace)) for namespace in namespaces], dtype=str),
+            "codes": np.array([codes[namespace] for namespace, _, _ in self.values], dtype=np.int32),
+            "steps1": np.array([step1 for _, step1, _ in self.values], dtype=np.int64),
+            "steps2": np.array([step2 for _, _, step2 in self.values], dtype=np.int64),
+            "values": np.array(list(self.values.values()), dtype=np.float64),
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), mode=0o700, exist_ok=True)
+        replace_file(self.path, lambda file: np.savez_compressed(file, **arrays))
+
+
+def _props_si_or_nan(function, *args):
+    try:
+        return function(*args)
+    except ValueError:
+        return np.nan
+
+
+def props_si(output, name1, values1, name2, values2, fluid, precision1, precision2, cache=None):
+    """
+    Evaluate `PropsSI(output, name1, value1, name2, value2, fluid)` for arrays of inputs.
+
+    The inputs are rounded to multiples of `precision1` and `precision2`, and every unique pair is evaluated only once.
+    Pairs found in `cache` (a `PropertyCache`) are not evaluated again. Points that CoolProp cannot evaluate are NaN.
+    """
+    steps1 = np.round(np.asarray(values1, dtype=float) / precision1)
+    steps2 = np.round(np.asarray(values2, dtype=float) / precision2)
+    valid = np.isfinite(steps1) & np.isfinite(steps2)
+    result = np.full(len(steps1), np.nan)
+    if not valid.any():
+        return result
+
+    pairs, inverse = np.unique(
+        np.column_stack([steps1[valid], steps2[valid]]).astype(np.int64),
+        axis=0,
+        return_inverse=True,
+    )
+    namespace = (output, name1, name2, fluid, precision1, precision2)
+    keys = [(namespace, step1, step2) for step1, step2 in pairs.tolist()]
+
+    if cache is not None:
+        unique_values, found = cache.get(keys)
+        missing = ~found
+    else:
+        unique_values = np.full(len(keys), np.nan)
+        missing = np.ones(len(keys), dtype=bool)
+    if missing.any():
+        from CoolProp.CoolProp import PropsSI  # imported only when there is something to evaluate
+
+        inputs1 = pairs[missing, 0] * precision1
+        inputs2 = pairs[missing, 1] * precision2
+        try:
+            computed = np.atleast_1d(PropsSI(output, name1, inputs1, name2, inputs2, fluid)).astype(float)
+        except ValueError:
+            # CoolProp raises instead of returning inf when a single point cannot be evaluated
+            computed = np.array([_props_si_or_nan(PropsSI, output, name1, value1, name2, value2, fluid)
+                                 for value1, value2 in zip(inputs1, inputs2)])
+        computed[~np.isfinite(computed)] = np.nan
+        unique_values[missing] = computed
+        if cache is not None:
+            cache.put([key for key, is_missing in zip(keys, missing) if is_missing], computed)
+
+    result[valid] = unique_values[inverse.ravel()]
+    return result
+
+
+def water_enthalpy(temperature, pressure, temperature_precision=0.01, pressure_precision=100.0, cache=None):
+    """
+    Specific enthalpy of water [J/kg] (IAPWS-IF97) for arrays of temperatures [K] and pressures [Pa].
+    """
+    return props_si(
+        "H",
+        "T", temperature,
+        "P", pressure,
+        "IF97::Water",
+        precision1=temperature_precision,
+        precision2=pressure_precision,
+        cache=cache,
+    )
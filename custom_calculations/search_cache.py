@@ -0,0 +1,302 @@
+"""
+Incremental cache for value-based search results, so runs with widened search intervals only search the part of the
+interval that was not searched before.
+
+The cache remembers, per search definition, the time ranges in which all results starting in that range are known
+completely (including ranges without any results). On a new request, only the uncovered gaps are searched, and the
+results are stitched together with the cached ones. A result that runs past the end of a searched range (e.g., an
+open-ended result at the indexing horizon) is returned as found but not cached, and the covered range stops at its
+start, so it is searched again on the next request. Ranges after the indexing horizon of the search tags are never
+marked as covered.
+
+Covered ranges do not expire. When data changes behind the horizon, TrendMiner indexes the affected range again, so the
+searches of a calculation are invalidated from the start of an index interval overlapping one processed before (see
+`SearchCache.begin`). Changes outside the index intervals that are indexed again (e.g., in the margin by which the
+search interval is widened) are not detected; remove the cache file to search everything again.
+
+    search_cache = SearchCache(client)
+    search = search_cache.value(queries=[...], duration="2m")
+    search_cache.begin([search], index_interval.start, index_interval.end)
+    results = search.get_results(search_interval)
+    search_cache.processed([search], index_interval.start, index_interval.end)
+
+Results are returned as intervals of `client.time.interval`, with the search calculations available by key. Only the
+results that start within the requested interval are returned; the searches in the example scripts widen their
+interval by the maximal result duration, so results starting before it are never needed.
+"""
+import hashlib
+import json
+
+import numpy as np
+import pandas as pd
+
+from custom_calculations._storage import (create_processed_table, is_reindexed, record_processed, sqlite_connection,
+                                          trim_processed, user_cache_file)
+from custom_calculations.horizon import indexing_horizon, tag_key
+from custom_calculations.intervals import complement, merge
+from custom_calculations.timestamps import to_epoch_ns
+
+
+def search_hash(queries, duration=None, calculations=None):
+    """
+    Canonical hash of a value-based search definition.
+    """
+    definition = {
+        "queries": [
+            [tag_key(query[0])] + [str(part) for part in query[1:]]
+            for query in queries
+        ],
+        "duration": pd.Timedelta(duration).value if duration is not None else None,
+        "calculations": {
+            key: [tag_key(tag), str(operation)]
+            for key, (tag, operation) in sorted((calculations or {}).items())
+        },
+    }
+    return hashlib.sha1(json.dumps(definition, sort_keys=True).encode()).hexdigest()
+
+
+def _ranges(starts, ends):
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def _merge(ranges):
+    ranges = np.array(list(ranges), dtype=np.int64).reshape(-1, 2)
+    return _ranges(*merge(ranges[:, 0], ranges[:, 1]))
+
+
+def _subtract(start, end, ranges):
+    """
+    Parts of [start, end) not covered by the sorted, disjoint `ranges`.
+    """
+    ranges = np.array(list(ranges), dtype=np.int64).reshape(-1, 2)
+    return _ranges(*complement(ranges[:, 0], ranges[:, 1], start, end))
+
+
+class SearchCache:
+    """
+    Search result cache stored in the SQLite database `path` (by default `search_cache.sqlite` in the per-user cache
+    directory), which can be shared by several processes at once.
+    """
+
+    def __init__(self, client, path=None, timeout=30):
+        self.client = client
+        self.path = path if path is not None else user_cache_file("search_cache.sqlite")
+        self.timeout = timeout
+        with self._connect() as connection:
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS results (
+                    search TEXT NOT NULL,
+                    start INTEGER NOT NULL,
+                    end INTEGER NOT NULL,
+                    calculations TEXT NOT NULL,
+                    PRIMARY KEY (search, start)
+                )
+                """
+            )
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS coverage (
+                    search TEXT NOT NULL,
+                    start INTEGER NOT NULL,
+                    end INTEGER NOT NULL
+                )
+                """
+            )
+            create_processed_table(connection)
+
+    def _connect(self):
+        return sqlite_connection(self.path, timeout=self.timeout)
+
+    def value(self, queries, duration=None, calculations=None, **kwargs):
+        """
+        Cached equivalent of `client.search.value`.
+        """
+        return CachedSearch(self, queries, duration, calculations, **kwargs)
+
+    @staticmethod
+    def _key(searches):
+        return "|".join(sorted(search.hash for search in searches))
+
+    def begin(self, searches, start, end, backfill=None):
+        """
+        Start a run for the index interval [start, end) using the `CachedSearch` objects `searches`. If it overlaps a
+        range processed before with the same searches, the range is being indexed again (e.g., because data arrived
+        late), so the cached results of the searches from `start` on are invalidated. Runs of a backfill are exempt
+        (see `_storage.is_reindexed`).
+        """
+        start, end = pd.Timestamp(start).value, pd.Timestamp(end).value
+        key = self._key(searches)
+        with self._connect() as connection:
+            reindexed = is_reindexed(connection, key, start, end, backfill=backfill)
+            if reindexed:
+                trim_processed(connection, key, start)
+        if reindexed:
+            for search in searches:
+                search.invalidate(start)
+
+    def processed(self, searches, start, end):
+        """
+        Record that the index interval [start, end) was processed with the `CachedSearch` objects `searches`.
+        """
+        with self._connect() as connection:
+            record_processed(connection, self._key(searches), pd.Timestamp(start).value, pd.Timestamp(end).value)
+
+    def invalidate(self, search, since=None):
+        """
+        Forget the cached results (starting at or after `since`) of the search with hash `search`.
+        """
+        since = pd.Timestamp(since).value if since is not None else np.iinfo(np.int64).min
+        with self._connect() as connection:
+            connection.execute("DELETE FROM results WHERE search = ? AND start >= ?", (search, since))
+            connection.execute("DELETE FROM coverage WHERE search = ? AND start >= ?", (search, since))
+            connection.execute("UPDATE coverage SET end = ? WHERE search = ? AND end > ?", (since, search, since))
+
+
+class CachedSearch:
+    """
+    Value-based search of which the results are cached in a `SearchCache`.
+    """
+
+    def __init__(self, cache, queries, duration=None, calculations=None, **kwargs):
+        self.cache = cache
+        self.client = cache.client
+        self.search = self.client.search.value(queries=queries, duration=duration, calculations=calculations, **kwargs)
+        self.hash = search_hash(queries, duration, calculations)
+        self.keys = list(calculations or {})
+        self.tags = [query[0] for query in queries] + [tag for tag, _ in (calculations or {}).values()]
+        # Results starting less than the minimal duration before the end of a searched range might be missing (the
+        # part inside the range being too short), so covered ranges stop this margin before the end
+        self.margin = (pd.Timedelta(duration).value if duration is not None else 0) + pd.Timedelta(
+            self.client.resolution).value
+
+    def invalidate(self, since):
+        """
+        Forget the cached results that might change when the data from `since` on changes: the results starting at or
+        after `since`, the results running into it, and the results that could now start less than the margin before it.
+        """
+        since = pd.Timestamp(since).value
+        with self.cache._connect() as connection:
+            running_into = connection.execute(
+                "SELECT MIN(start) FROM results WHERE search = ? AND end >= ?", (self.hash, since)
+            ).fetchone()[0]
+        since = since - self.margin if running_into is None else min(since - self.margin, running_into)
+        self.cache.invalidate(self.hash, pd.Timestamp(since, tz="UTC"))
+
+    def _record(self, result):
+        calculations = {}
+        for key in self.keys:
+            try:
+                calculations[key] = result[key]
+            except (KeyError, TypeError):
+                calculations[key] = None
+        start, end = to_epoch_ns([result.start, result.end])
+        return int(start), int(end), calculations
+
+    def _interval(self, start, end, calculations):
+        interval = self.client.time.interval(
+            pd.Timestamp(start, tz="UTC").tz_convert(self.client.tz),
+            pd.Timestamp(end, tz="UTC").tz_convert(self.client.tz),
+        )
+        for key, value in calculations.items():
+            interval[key] = value
+        return interval
+
+    def _search(self, start, end):
+        results = self.search.get_results(self._interval(start, end, {}))
+        return [self._record(result) for result in results]
+
+    def _search_gap(self, gap_start, gap_end, end, horizon):
+        """
+        Search a gap in the coverage. Returns all results found, the complete results, and the end of the newly
+        covered range.
+        """
+        resolution = pd.Timedelta(self.client.resolution).value
+
+        # Search from a margin before the gap, so results starting at the start of the gap are complete
+        # (results starting at the start of the search range are cut off, so they are dropped)
+        search_start = gap_start - self.margin
+        search_end = gap_end
+        results = [result for result in self._search(search_start, search_end) if result[0] > search_start]
+
+        # A result running past the end of the gap is incomplete; find its end by searching up to the requested end
+        if results and (results[-1][1] >= search_end - resolution) and (search_end < end):
+            last_start = results[-1][0]
+            search_end = end
+            results = results[:-1] + [
+                result for result in self._search(last_start - self.margin, search_end) if result[0] >= last_start
+            ]
+
+        is_complete = [result_end < search_end - resolution for _, result_end, _ in results]
+        covered_end = min(
+            [search_end - self.margin, horizon - self.margin]
+            + [result[0] for result, complete in zip(results, is_complete) if not complete and result[0] >= gap_start]
+        )
+        complete = [
+            result for result, complete in zip(results, is_complete)
+            if complete and (gap_start <= result[0] < covered_end)
+        ]
+        return results, complete, covered_end
+
+    def get_results(self, interval):
+        """
+        Results starting in `interval`, searching only the parts that are not cached yet.
+        """
+        start, end = (int(timestamp) for timestamp in to_epoch_ns([interval.start, interval.end]))
+        with self.cache._connect() as connection:
+            coverage = _merge(
+                [row[0], row[1]] for row in connection.execute(
+                    "SELECT start, end FROM coverage WHERE search = ?", (self.hash,)
+                )
+            )
+
+        found = {}
+        to_store = []
+        new_coverage = []
+        gaps = _subtract(start, end, coverage)
+        if gaps:
+            horizon = int(to_epoch_ns([indexing_horizon(self.client, self.tags, start=interval.start)])[0])
+        for gap_start, gap_end in gaps:
+            results, complete, covered_end = self._search_gap(gap_start, gap_end, end, horizon)
+            for result in results:
+                found.setdefault(result[0], result)
+            for result in complete:
+                found[result[0]] = result
+            to_store.extend(complete)
+            if covered_end > gap_start:
+                new_coverage.append([gap_start, covered_end])
+
+        with self.cache._connect() as connection:
+            if new_coverage:
+                connection.execute("BEGIN IMMEDIATE")  # lock, so concurrent runs cannot lose each other's coverage
+                connection.executemany(
+                    "INSERT OR REPLACE INTO results (search, start, end, calculations) VALUES (?, ?, ?, ?)",
+                    [
+                        (self.hash, result_start, result_end, json.dumps(calculations))
+                        for result_start, result_end, calculations in to_store
+                    ],
+                )
+                stored = [
+                    [row[0], row[1]] for row in connection.execute(
+                        "SELECT start, end FROM coverage WHERE search = ?", (self.hash,)
+                    )
+                ]
+                connection.execute("DELETE FROM coverage WHERE search = ?", (self.hash,))
+                connection.executemany(
+                    "INSERT INTO coverage (search, start, end) VALUES (?, ?, ?)",
+                    [(self.hash, range_start, range_end) for range_start, range_end in _merge(stored + new_coverage)],
+                )
+            cached = connection.execute(
+                "SELECT start, end, calculations FROM results WHERE search = ? AND start >= ? AND start <= ?",
+                (self.hash, start, end),
+            ).fetchall()
+
+        # Cached results are complete, so they take precedence over results that were cut off by a search range
+        for result_start, result_end, calculations in cached:
+            found[result_start] = (result_start, result_end, json.loads(calculations))
+
+        return [
+            self._interval(*found[result_start])
+            for result_start in sorted(found)
+            if start <= result_start <= end
+        ]
@@ -0,0 +1,222 @@
+"""
+File-backed calculation state, so consecutive index runs only calculate what is new.
+
+For every calculation (identified by a key, see `IncrementalState.key`) the store keeps:
+
+* the results of finalized periods (e.g., the daily values of a block aggregation), which are reused instead of being
+  calculated again,
+* running totals and counts within a period at known timestamps (e.g., an incrementing totalizer halfway its reset
+  period), from which the next run continues,
+* the time ranges of the processed index intervals.
+
+Results are only stored for periods that end before the indexing horizon and at least `settle_time` ago, as the
+underlying data might still change. When dependency data changes behind the horizon, TrendMiner indexes the affected
+range again: an index interval overlapping a range processed before therefore invalidates all state from its start on
+(see `begin`). The runs of `custom_calculations.backfill`, of which the padded chunks overlap and run concurrently or
+out of order, are exempt. Storing a finalized period again with a different result also invalidates all later state.
+
+The store is an SQLite database (by default in the per-user cache directory), which can safely be shared by several
+processes and calculations at once.
+"""
+import hashlib
+import time
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from custom_calculations._storage import (create_processed_table, is_reindexed, record_processed, sqlite_connection,
+                                          trim_processed, user_cache_file)
+from custom_calculations.horizon import tag_key
+
+Running = namedtuple("Running", ["period_start", "timestamp", "total", "count"])
+Running.__doc__ = """
+Running total and count of the period starting at `period_start`, at `timestamp` (both int64 epoch nanoseconds).
+"""
+
+
+class IncrementalState:
+    """
+    Finalized period results, running totals and the processed ranges per calculation key, in the SQLite database
+    `path` (by default `state.sqlite` in the per-user cache directory).
+    """
+
+    def __init__(self, path=None, settle_time="1h", tolerance=1e-9, timeout=30):
+        self.path = path if path is not None else user_cache_file("state.sqlite")
+        self.settle_time = pd.Timedelta(settle_time)
+        self.tolerance = tolerance
+        self.timeout = timeout
+        with self._connect() as connection:
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS periods (
+                    key TEXT NOT NULL,
+                    start INTEGER NOT NULL,
+                    end INTEGER NOT NULL,
+                    value REAL,
+                    saved_at REAL NOT NULL,
+                    PRIMARY KEY (key, start, end)
+                )
+                """
+            )
+            connection.execute(
+                """
+                CREATE TABLE IF NOT EXISTS running (
+                    key TEXT NOT NULL,
+                    period_start INTEGER NOT NULL,
+                    ts INTEGER NOT NULL,
+                    total REAL NOT NULL,
+                    count INTEGER NOT NULL,
+                    saved_at REAL NOT NULL,
+                    PRIMARY KEY (key, ts)
+                )
+                """
+            )
+            create_processed_table(connection)
+
+    def _connect(self):
+        return sqlite_connection(self.path, timeout=self.timeout)
+
+    @staticmethod
+    def key(name, tags=(), *settings, script=None):
+        """
+        Key identifying one calculation: a name, its dependency tags and any settings that affect the results (e.g.,
+        the frequency and time unit). Pass the path of the calculating script as `script` (e.g., `__file__`) to start
+        from a clean state whenever the script is edited.
+        """
+        parts = [str(name)] + [tag_key(tag) for tag in tags] + [str(setting) for setting in settings]
+        if script is not None:
+            with open(script, "rb") as file:
+                parts.append(hashlib.sha1(file.read()).hexdigest())
+        return "|".join(parts)
+
+    def settled(self, horizon=None):
+        """
+        Latest epoch timestamp [ns] up to which results can be stored: `settle_time` ago, and at most `horizon`.
+        """
+        settled = (pd.Timestamp.now(tz="UTC") - self.settle_time).value
+        return settled if horizon is None else min(settled, pd.Timestamp(horizon).value)
+
+    def begin(self, key, start, end, backfill=None):
+        """
+        Start a run for the index interval [start, end). If it overlaps a range processed before, the range is being
+        indexed again (e.g., because dependency data changed), so all state from `start` on is invalidated. Runs of a
+        backfill are exempt (see `_storage.is_reindexed`).
+        """
+        start, end = pd.Timestamp(start).value, pd.Timestamp(end).value
+        with self._connect() as connection:
+            reindexed = is_reindexed(connection, key, start, end, backfill=backfill)
+        if reindexed:
+            self.invalidate(key, start)
+
+    def processed(self, key, start, end):
+        """
+        Record that the index interval [start, end) was processed.
+        """
+        with self._connect() as connection:
+            record_processed(connection, key, pd.Timestamp(start).value, pd.Timestamp(end).value)
+
+    def invalidate(self, key, since):
+        """
+        Remove all state of `key` for periods ending after `since`, running totals at or after `since`, and the
+        processed ranges after `since`.
+        """
+        since = pd.Timestamp(since).value
+        with self._connect() as connection:
+            connection.execute("DELETE FROM periods WHERE key = ? AND end > ?", (key, since))
+            connection.execute("DELETE FROM running WHERE key = ? AND ts >= ?", (key, since))
+            trim_processed(connection, key, since)
+
+    def periods(self, key, starts, ends):
+        """
+        Finalized results of the periods [starts, ends) (int64 epoch arrays). Returns the results as a float64 array
+        (NaN when the stored result is missing) and a mask of the periods that were found.
+        """
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        values = np.full(len(starts), np.nan)
+        found = np.zeros(len(starts), dtype=bool)
+        if len(starts) == 0:
+            return values, found
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT start, end, value FROM periods WHERE key = ? AND start >= ? AND start <= ?",
+                (key, int(starts.min()), int(starts.max())),
+            ).fetchall()
+        stored = {(start, end): value for start, end, value in rows}
+        for i, period in enumerate(zip(starts.tolist(), ends.tolist())):
+            if period in stored:
+                found[i] = True
+                values[i] = np.nan if stored[period] is None else stored[period]
+        return values, found
+
+    def finalize(self, key, starts, ends, values, horizon=None):
+        """
+        Store the results of the periods [starts, ends) that ended before `horizon` and at least `settle_time` ago.
+        Returns the number of periods stored. If a period was stored before with another result, all later state of
+        `key` is invalidated.
+        """
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        values = np.asarray(values, dtype=np.float64)
+        final = ends <= self.settled(horizon)
+        if not final.any():
+            return 0
+        rows = [
+            (key, start, end, None if np.isnan(value) else value, time.time())
+            for start, end, value in zip(starts[final].tolist(), ends[final].tolist(), values[final].tolist())
+        ]
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")  # lock before reading, so concurrent runs cannot interleave
+            changed = None
+            for _, start, end, value, _ in rows:
+                row = connection.execute(
+                    "SELECT value FROM periods WHERE key = ? AND start = ? AND end = ?", (key, start, end)
+                ).fetchone()
+                if (row is not None) and not self._equal(row[0], value):
+                    changed = start if changed is None else min(changed, start)
+            if changed is not None:
+                connection.execute("DELETE FROM periods WHERE key = ? AND start > ?", (key, changed))
+                connection.execute("DELETE FROM running WHERE key = ? AND ts > ?", (key, changed))
+            connection.executemany(
+                "INSERT OR REPLACE INTO periods (key, start, end, value, saved_at) VALUES (?, ?, ?, ?, ?)", rows
+            )
+        return len(rows)
+
+    def _equal(self, stored, value):
+        if (stored is None) or (value is None):
+            return (stored is None) and (value is None)
+        return abs(stored - value) <= self.tolerance * max(1.0, abs(value))
+
+    def running(self, key, before):
+        """
+        The latest running total `Running(period_start, timestamp, total, count)` at or before `before`, or None.
+        """
+        with self._connect() as connection:
+            row = connection.execute(
+                """
+                SELECT period_start, ts, total, count FROM running
+                WHERE key = ? AND ts <= ?
+                ORDER BY ts DESC LIMIT 1
+                """,
+                (key, pd.Timestamp(before).value),
+            ).fetchone()
+        return None if row is None else Running(*row)
+
+    def save_running(self, key, period_start, timestamp, total, count=0, horizon=None):
+        """
+        Store the running `total` (and `count`) of the period starting at `period_start`, at `timestamp` (both epoch
+        nanoseconds or timestamps). Returns whether it was stored: only settled timestamps before `horizon` are.
+        """
+        timestamp = pd.Timestamp(timestamp).value
+        if timestamp > self.settled(horizon):
+            return False
+        with self._connect() as connection:
+            connection.execute(
+                """
+                INSERT OR REPLACE INTO running (key, period_start, ts, total, count, saved_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (key, pd.Timestamp(period_start).value, timestamp, float(total), int(count), time.time()),
+            )
+        return True
@@ -0,0 +1,42 @@
+"""
+Conversion between SDK intervals, pandas timestamps and int64 epoch arrays.
+"""
+import numpy as np
+import pandas as pd
+
+
+def to_epoch_ns(timestamps):
+    """
+    Convert timestamps (list of datetimes, pandas index, ...) to an int64 array of nanoseconds since the epoch.
+    """
+    index = pd.DatetimeIndex(timestamps)
+    if index.tz is None:
+        index = index.tz_localize("UTC")
+    return index.as_unit("ns").asi8
+
+
+def interval_arrays(intervals):
+    """
+    Return the start and end times of a list of intervals (e.g., search results or the output of
+    `client.time.interval.range`) as int64 arrays of nanoseconds since the epoch.
+    """
+    if len(intervals) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    if isinstance(intervals[0].start, pd.Timestamp):
+        # Reading the epoch values directly is much faster than parsing a list of timestamps
+        try:
+            starts = np.fromiter((interval.start.value for interval in intervals), np.int64, len(intervals))
+            ends = np.fromiter((interval.end.value for interval in intervals), np.int64, len(intervals))
+            return starts, ends
+        except AttributeError:
+            pass  # not all timestamps are pandas Timestamps
+    starts = to_epoch_ns([interval.start for interval in intervals])
+    ends = to_epoch_ns([interval.end for interval in intervals])
+    return starts, ends
+
+
+def to_index(epoch_ns, tz):
+    """
+    Convert an int64 array of nanoseconds since the epoch to a timezone-aware DatetimeIndex in timezone `tz`.
+    """
+    return pd.DatetimeIndex(np.asarray(epoch_ns, dtype="datetime64[ns]")).tz_localize("UTC").tz_convert(tz)
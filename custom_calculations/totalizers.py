@@ -0,0 +1,291 @@
+"""
+Totalizers that reset at the start of every bucket (e.g., regular intervals or search results).
+
+All times are int64 arrays of nanoseconds since the epoch, see `custom_calculations.timestamps.interval_arrays`. Buckets
+are expected to be sorted and non-overlapping.
+"""
+import numpy as np
+import pandas as pd
+
+from custom_calculations.instrumentation import staged
+from custom_calculations.intervals import merge, merge_gaps
+from custom_calculations.planner import FetchPlan
+from custom_calculations.timestamps import to_index
+
+# Offset of the first point of a bucket, so it does not coincide with the last point of the previous bucket
+RESET_OFFSET = pd.Timedelta(milliseconds=1).value
+
+
+def _active_duration(times, starts, ends):
+    """
+    Total time covered by the disjoint, sorted intervals `[starts, ends)` before every time in `times`.
+    """
+    cumulative = np.concatenate([[0], np.cumsum(ends - starts)])
+    n_started = np.searchsorted(starts, times, side="right")
+    previous_end = ends[np.maximum(n_started - 1, 0)] if len(ends) > 0 else np.zeros(len(times), dtype=np.int64)
+    still_running = np.where(n_started > 0, np.maximum(previous_end - times, 0), 0)
+    return cumulative[n_started] - still_running
+
+
+def duration_totalizer(bucket_starts, bucket_ends, result_starts, result_ends, tz,
+                       time_unit=pd.Timedelta("1h"), resolution=None):
+    """
+    Totalize the duration of the results per bucket, as a single Series with name "value" in units of `time_unit`.
+
+    The duration is computed exactly from the result boundaries with a sweep over the sorted results; results that
+    overlap a bucket boundary only count for the part inside each bucket. By default, only the points where the
+    totalizer changes slope are returned: the reset just after the bucket start, the result starts and ends, and the
+    final value at the bucket end. Linear interpolation between these points gives the exact totalizer. Pass a
+    `resolution` (e.g., `pd.Timedelta("1m")`) to get the totalizer on a regular grid from every bucket start instead.
+    """
+    bucket_starts = np.asarray(bucket_starts, dtype=np.int64)
+    bucket_ends = np.asarray(bucket_ends, dtype=np.int64)
+    starts, ends = merge(result_starts, result_ends)
+
+    if resolution is None:
+        # Result boundaries strictly inside a bucket
+        boundaries = np.concatenate([starts, ends])
+        bucket = np.searchsorted(bucket_starts, boundaries, side="right") - 1
+        inside = (
+            (bucket >= 0)
+            & (boundaries > bucket_starts[np.maximum(bucket, 0)] + RESET_OFFSET)
+            & (boundaries < bucket_ends[np.maximum(bucket, 0)])
+        )
+        buckets = np.arange(len(bucket_starts))
+        bucket = np.concatenate([buckets, bucket[inside], buckets])
+        times = np.concatenate([bucket_starts + RESET_OFFSET, boundaries[inside], bucket_ends])
+        order = np.argsort(times, kind="stable")
+        bucket, times = bucket[order], times[order]
+    else:
+        step = pd.Timedelta(resolution).value
+        n_points = -((bucket_starts - bucket_ends) // step)  # ceiling division
+        bucket = np.repeat(np.arange(len(bucket_starts)), n_points)
+        offset = np.arange(len(bucket)) - np.repeat(np.cumsum(n_points) - n_points, n_points)
+        times = bucket_starts[bucket] + offset * step
+
+    totals = _active_duration(times, starts, ends) - _active_duration(bucket_starts, starts, ends)[bucket]
+    return pd.Series(
+        index=to_index(times, tz),
+        data=totals / pd.Timedelta(time_unit).value,
+        name="value",
+    )
+
+
+def get_data(client, tag, start, end, resolution="1m", max_duration=None):
+    """
+    Get the interpolated data of a tag from `start` to `end` with as few requests as possible.
+
+    The whole range is fetched in a single request, unless `max_duration` is given (e.g., "90d" to limit the size of
+    the responses), in which case the range is split into consecutive chunks of that size.
+    """
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    step = pd.Timedelta(max_duration) if max_duration is not None else end - start
+    chunks = []
+    chunk_start = start
+    while True:
+        chunk_end = min(chunk_start + step, end)
+        chunks.append(tag.get_data(client.time.interval(chunk_start, chunk_end), resolution=resolution))
+        if chunk_end >= end:
+            break
+        chunk_start = chunk_end
+    data = pd.concat(chunks) if len(chunks) > 1 else chunks[0]
+    return data[~data.index.duplicated(keep="first")]
+
+
+def _pair_errors(data, range_start, range_end, breakpoints):
+    """
+    Estimated integration errors of `data` on [range_start, range_end], per pair of consecutive steps: the difference
+    between the trapezoids over both steps and the single trapezoid over the pair. The error is NaN when it cannot be
+    estimated, or when the pair needs finer data anyway: with missing values, containing a breakpoint, a trailing
+    unpaired step, and the parts of the range before the first and after the last data point.
+    """
+    times = data.index.as_unit("ns").asi8
+    if len(times) == 0:
+        return np.array([range_start]), np.array([range_end]), np.array([np.nan])
+    values = np.asarray(data, dtype=float)
+
+    t0, t1, t2 = times[0:-2:2], times[1:-1:2], times[2::2]
+    y0, y1, y2 = values[0:-2:2], values[1:-1:2], values[2::2]
+    errors = ((t1 - t0) * (y0 + y1) + (t2 - t1) * (y1 + y2) - (t2 - t0) * (y0 + y2)) / 2
+    errors[np.searchsorted(breakpoints, t0, side="right") < np.searchsorted(breakpoints, t2)] = np.nan
+
+    unpaired = times[-2:] if len(times) % 2 == 0 else times[:0]
+    starts = np.concatenate([[range_start], t0, unpaired[:1], [times[-1]]])
+    ends = np.concatenate([[times[0]], t2, unpaired[1:], [range_end]])
+    errors = np.concatenate([[np.nan], errors, np.full(len(unpaired) // 2, np.nan), [np.nan]])
+    nonempty = ends > starts
+    return starts[nonempty], ends[nonempty], errors[nonempty]
+
+
+def _to_refine(starts, errors, breakpoints, budget):
+    """
+    Which pairs to refine, so the estimated error of the running sum of the other pairs, from every breakpoint on,
+    stays within `budget`: those with an unknown error, and those that would take it beyond the budget. The error of a
+    running sum is estimated as the magnitude of the sum of the errors (which cancel out over the periods of a smooth
+    signal) plus the root of the sum of their squares (for the errors of noise in the data, which only partly cancel).
+    As noise can make a single estimate small by chance, the squares are those of the largest error of every pair and
+    its neighbours.
+    """
+    refine = np.isnan(errors)
+    known = np.where(refine, 0.0, errors)
+    magnitudes = np.abs(known)
+    magnitudes[1:] = np.maximum(magnitudes[1:], np.abs(known[:-1]))
+    magnitudes[:-1] = np.maximum(magnitudes[:-1], np.abs(known[1:]))
+    segment = np.searchsorted(breakpoints, starts, side="right")
+    first = np.concatenate([[True], segment[1:] != segment[:-1]])
+
+    def running(values):
+        sums = np.cumsum(values)
+        return sums - (sums - values)[first][np.cumsum(first) - 1]
+
+    if np.all(np.abs(running(known)) + np.sqrt(running(magnitudes ** 2)) <= budget):
+        return refine
+
+    # Keep the pairs one by one, as long as the estimated error of the running sum stays within the budget
+    total = squares = 0.0
+    previous = None
+    for i, (pair_segment, error, magnitude) in enumerate(zip(segment.tolist(), known.tolist(), magnitudes.tolist())):
+        if pair_segment != previous:
+            total = squares = 0.0
+            previous = pair_segment
+        if abs(total + error) + np.sqrt(squares + magnitude ** 2) > budget:
+            refine[i] = True
+        else:
+            total += error
+            squares += magnitude ** 2
+    return refine
+
+
+@staged("adaptive_data")
+def get_adaptive_data(client, tag, start, end, resolution="1m", tolerance=None, time_unit=pd.Timedelta("1h"),
+                      coarse_resolutions=("1h", "15m", "5m"), breakpoints=None, max_requests=8, max_duration=None):
+    """
+    Get the data of a tag from `start` to `end` only as fine as needed to integrate it within `tolerance` (in units of
+    the tag times `time_unit`) of the integral of the data at `resolution`.
+
+    The range is fetched at the first of `coarse_resolutions` (each a multiple of the next, and of `resolution`). The
+    integration error of every pair of consecutive steps is estimated by comparing the trapezoids over both steps with
+    the single trapezoid over the pair, as in adaptive quadrature. Only the pairs that would take the estimated error of
+    the running integral (from every breakpoint on) beyond an equal share of the tolerance per coarse resolution are
+    fetched again at the next resolution, and so on down to `resolution`; the totals of `value_totalizer` then stay
+    within the tolerance. The ranges of every resolution are fetched concurrently, in at most `max_requests` requests
+    (joining the ranges separated by the shortest gaps). Pairs with missing values or containing one of the
+    `breakpoints` (int64 epoch times, e.g., the bucket starts and ends at which `value_totalizer` resets) are always
+    refined. The result holds the finest data fetched at every time.
+
+    The error is estimated from the coarse data, so variations and gaps in the data shorter than the coarse steps can
+    be missed: pick coarse resolutions well below the time scale of the signal. Without `tolerance`, this is
+    `get_data` at `resolution`.
+    """
+    if tolerance is None:
+        return get_data(client, tag, start, end, resolution=resolution, max_duration=max_duration)
+    if tolerance <= 0:
+        raise ValueError(f"The tolerance must be positive, got {tolerance}")
+    resolutions = [pd.Timedelta(coarse) for coarse in coarse_resolutions] + [pd.Timedelta(resolution)]
+    for coarse, fine in zip(resolutions[:-1], resolutions[1:]):
+        if (coarse <= fine) or (coarse.value % fine.value != 0):
+            raise ValueError(f"Every resolution must be a multiple of the next, got {coarse} and {fine}")
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    if end <= start:
+        return get_data(client, tag, start, end, resolution=resolution, max_duration=max_duration)
+
+    # Allowed running sum of the estimated errors per coarse resolution, in units of the tag times nanoseconds
+    budget = tolerance * pd.Timedelta(time_unit).value / len(coarse_resolutions)
+    breakpoints = np.sort(np.asarray([] if breakpoints is None else breakpoints, dtype=np.int64).ravel())
+    tz = start.tz or client.tz
+    ranges = (np.array([start.value]), np.array([end.value]))
+    pieces = []
+    for level, step in enumerate(resolutions):
+        plan = FetchPlan()
+        for i, (range_start, range_end) in enumerate(zip(*ranges)):
+            plan.add(i, get_data, client, tag, *to_index([range_start, range_end], tz), resolution=step,
+                     max_duration=max_duration)
+        results = plan.run()
+        pieces.extend(results.values())
+        if level == len(resolutions) - 1:
+            break
+        pairs = [
+            _pair_errors(data, range_start, range_end, breakpoints)
+            for (range_start, range_end), data in zip(zip(*ranges), results.values())
+        ]
+        starts, ends, errors = (np.concatenate(arrays) for arrays in zip(*pairs))
+        refine = _to_refine(starts, errors, breakpoints, budget)
+        starts, ends = merge(starts[refine], ends[refine])
+        # Join the ranges separated by the shortest gaps (at least those a single step apart), to save requests
+        max_gap = step.value
+        if len(starts) > max_requests:
+            max_gap = max(max_gap, np.sort(starts[1:] - ends[:-1])[len(starts) - 1 - max_requests])
+        ranges = merge_gaps(starts, ends, max_gap=pd.Timedelta(max_gap))
+        if len(ranges[0]) == 0:
+            break
+
+    # The finer grids contain the points of the coarser ones, so keep the finest data at every time
+    data = pd.concat(pieces) if len(pieces) > 1 else pieces[0]
+    data = data[~data.index.duplicated(keep="last")]
+    return data.sort_index(kind="stable")
+
+
+def value_totalizer(tag_data, bucket_starts, bucket_ends, tz, time_unit=pd.Timedelta("1h"), default_value=None,
+                    initial_totals=None):
+    """
+    Integrate `tag_data` with the trapezoidal rule from the start of every bucket, as a single Series with name
+    "value" in units of the tag times `time_unit`.
+
+    `tag_data` only needs to be fetched once for the full range of all buckets (see `get_data`). The data is split at
+    the bucket boundaries in a single vectorized pass; the values at the boundaries are linearly interpolated, so every
+    bucket starts exactly at 0 (placed 1ms after the bucket start, to avoid duplicate timestamps with the final value of
+    the previous bucket) and ends with the total over the full bucket. Buckets with fewer than 2 data points are
+    skipped. A missing value stops the totalizer for the rest of its bucket. When `default_value` is given, it is added
+    1ms after the end of every bucket (e.g., to return to 0 in between search results).
+
+    `initial_totals` optionally gives the total at the start of every bucket (NaN for 0), to continue a bucket from a
+    saved running total: pass the timestamp of that total as its bucket start. Such a bucket starts at its total, at
+    its start itself.
+    """
+    if len(tag_data) < 2:
+        return pd.Series(index=to_index([], tz), dtype=float, name="value")
+    times = tag_data.index.as_unit("ns").asi8
+    values = np.asarray(tag_data, dtype=float)
+    bucket_starts = np.asarray(bucket_starts, dtype=np.int64)
+    bucket_ends = np.asarray(bucket_ends, dtype=np.int64)
+
+    # Only keep buckets with at least 2 data points; the segments are limited to the available data
+    n_points = np.searchsorted(times, bucket_ends, side="right") - np.searchsorted(times, bucket_starts, side="left")
+    keep = n_points >= 2
+    initial = np.full(len(bucket_starts), np.nan) if initial_totals is None else np.asarray(initial_totals, dtype=float)
+    resumed = ~np.isnan(initial[keep])
+    segment_starts = np.maximum(bucket_starts[keep], times[0])
+    segment_ends = np.minimum(bucket_ends[keep], times[-1])
+
+    # Data points strictly inside the segments, with interpolated points added at the segment boundaries
+    first = np.searchsorted(times, segment_starts, side="right")
+    sizes = np.searchsorted(times, segment_ends, side="left") - first + 2
+    position = np.cumsum(sizes) - sizes
+    last = position + sizes - 1
+    segment = np.repeat(np.arange(len(sizes)), sizes)
+    source = np.clip(first[segment] + np.arange(len(segment)) - position[segment] - 1, 0, len(times) - 1)
+    x = times[source]
+    y = values[source]
+    x[position] = segment_starts
+    y[position] = np.interp(segment_starts, times, values)
+    x[last] = segment_ends
+    y[last] = np.interp(segment_ends, times, values)
+
+    # Segmented cumulative trapezoid: the first step of every segment contributes nothing
+    areas = np.zeros(len(x))
+    areas[1:] = np.diff(x) * (y[1:] + y[:-1]) / 2 / pd.Timedelta(time_unit).value
+    areas[position] = 0
+    missing = np.isnan(areas)
+    areas[missing] = 0
+    totals = np.cumsum(areas)
+    totals -= totals[position][segment]
+    n_missing = np.cumsum(missing)
+    totals[(n_missing - n_missing[position][segment]) > 0] = np.nan
+    totals += np.where(resumed, initial[keep], 0)[segment]
+
+    x[position[~resumed]] += RESET_OFFSET
+    if default_value is not None:
+        x = np.insert(x, last + 1, bucket_ends[keep] + RESET_OFFSET)
+        totals = np.insert(totals, last + 1, default_value)
+
+    return pd.Series(index=to_index(x, tz), data=totals, name="value")
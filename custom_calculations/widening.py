@@ -0,0 +1,99 @@
+"""
+Windows around the index interval that are only as wide as needed, instead of a fixed `maximal_duration` on both sides.
+
+Scripts widen their queries so the intervals and search results at the edges of the index interval are complete. A
+fixed `maximal_duration` has to cover the longest possible interval or result, so every run fetches the full widened
+window, even when the result at the edge starts minutes before the index interval.
+
+* For regular intervals, `freq_window` gives the exact window: from the start of the interval (of frequency `freq`, in
+  the time zone of the client) containing the start of the index interval, up to the end of the interval containing
+  its end.
+* For search results, `widened_results` starts with a small margin on both sides (at least the minimal duration of
+  the search results), and only doubles the margin on a side while a result at that edge of the window might be
+  truncated (i.e., starts or ends within `clearance` of the edge), up to a maximal margin. A side stops growing once
+  it reaches the present, as no later data exists.
+
+    window = freq_window(client, index_interval, freq="D")
+    intervals = client.time.interval.range(freq="D", start=window.start, end=window.end, normalize=True)
+
+    results, search_interval = widened_results(
+        client, search.get_results, index_interval, margin="1h", cap="25h", min_duration=search_duration,
+    )
+
+Repeated searches of growing windows are cheap with a `SearchCache` search, which only searches the part of the
+window that is new.
+"""
+import pandas as pd
+
+from custom_calculations.boundaries import bucket_boundaries
+from custom_calculations.instrumentation import staged
+from custom_calculations.timestamps import interval_arrays, to_index
+
+
+def freq_window(client, interval, freq, offset=None):
+    """
+    Interval from the start of the bucket of frequency `freq` containing the start of `interval`, to the end of the
+    bucket containing its end, in the time zone of the client (see `custom_calculations.boundaries`). When `interval`
+    starts at a bucket boundary, the window starts at the previous bucket, of which the final value is at that start.
+    """
+    start = pd.Timestamp(interval.start) - pd.Timedelta(1, "ns")
+    starts, ends = bucket_boundaries(start, interval.end, freq, tz=client.tz, offset=offset)
+    if len(starts) == 0:
+        return client.time.interval(interval.start, interval.end)
+    start, end = to_index([starts[0], ends[-1]], client.tz)
+    return client.time.interval(start, end)
+
+
+def _clear_edges(results, window, clearance):
+    """
+    Whether no result starts within `clearance` of the start of the window (i.e., might have started before it), and
+    whether no result ends within `clearance` of its end (i.e., might still be running).
+    """
+    starts, ends = interval_arrays(results)
+    if len(starts) == 0:
+        return True, True
+    window_start, window_end = pd.Timestamp(window.start).value, pd.Timestamp(window.end).value
+    return starts.min() - window_start >= clearance, window_end - ends.max() >= clearance
+
+
+@staged("widened_results")
+def widened_results(client, get_results, interval, margin="1h", cap="25h", factor=2, min_duration=None, clearance=None,
+                    complete=None):
+    """
+    Results of `get_results(window)` (e.g., `search.get_results`) for the narrowest window around `interval`, starting
+    with `margin` on both sides, in which the results at both edges are complete. The margin on a side is multiplied by
+    `factor` while it is not, up to `cap`. By default, the results at an edge are complete when they start and end
+    at least `clearance` (the client resolution by default) away from it; pass e.g. the maximal ignored gap between
+    results as `clearance` when the results next to those at the edges matter as well. Pass a function
+    `complete(results, window)` returning a `(start_complete, end_complete)` tuple of booleans for any other condition.
+
+    A search does not return the results of which less than its minimal duration lies inside the window, so a result
+    at an edge can only be detected when the margin is at least that long: pass the `duration` of the search as
+    `min_duration` to start from a margin of at least that duration plus the client resolution.
+
+    Returns the results and the window they were requested for.
+    """
+    margin, cap = pd.Timedelta(margin), pd.Timedelta(cap)
+    if min_duration is not None:
+        margin = max(margin, pd.Timedelta(min_duration) + pd.Timedelta(client.resolution))
+    if margin <= pd.Timedelta(0):
+        raise ValueError(f"The margin must be positive, got {margin}")
+    if factor <= 1:
+        raise ValueError(f"The growth factor must be larger than 1, got {factor}")
+    clearance = pd.Timedelta(client.resolution if clearance is None else clearance).value
+    now = client.time.now()
+    before = after = min(margin, cap)
+    while True:
+        window = client.time.interval(interval.start - before, interval.end + after)
+        results = get_results(window)
+        start_complete, end_complete = (
+            _clear_edges(results, window, clearance) if complete is None else complete(results, window)
+        )
+        grow_before = (not start_complete) and (before < cap)
+        grow_after = (not end_complete) and (after < cap) and (window.end < now)
+        if not (grow_before or grow_after):
+            return results, window
+        if grow_before:
+            before = min(before * factor, cap)
+        if grow_after:
+            after = min(after * factor, cap)
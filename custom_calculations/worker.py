@@ -0,0 +1,267 @@
+"""
+Persistent worker that runs calculation scripts without paying the cold start (imports, authentication and tag
+lookups) on every index run.
+
+The worker imports the heavy dependencies once, and then runs the scripts it receives over a local socket, each in a
+fresh namespace with its own `START_TIMESTAMP`, `END_TIMESTAMP` and `OUTPUT_FILE`. The scripts are run unchanged:
+`TrendMinerClient.from_token` returns the client created less than `client_ttl` ago for the same token and time zone,
+and `client.tag.get_by_name` reuses tags looked up less than `tag_ttl` ago. Jobs are run one at a time, as they share
+the process environment.
+
+    export WORKER_AUTHKEY=...
+    python -m custom_calculations.worker serve
+    python -m custom_calculations.worker run custom_calculations_scripts/.../event_counter.py \\
+        --start 2025-01-01T00:00:00Z --end 2025-01-01T00:05:00Z --output output.csv
+
+As the worker runs the scripts its clients send it, both commands require the shared secret `WORKER_AUTHKEY`, with
+which every connection is authenticated. The default socket is only accessible by the current user, and the worker
+only runs scripts within `scripts_dir` (the example scripts by default).
+"""
+import argparse
+import getpass
+import hashlib
+import os
+import runpy
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+from custom_calculations import instrumentation
+from custom_calculations._storage import private_directory
+
+REPOSITORY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_ADDRESS = os.path.join(tempfile.gettempdir(), f"custom_calculations_worker_{getpass.getuser()}", "worker.sock")
+DEFAULT_PRELOAD = ["numpy", "pandas", "scipy.integrate", "CoolProp.CoolProp", "trendminer"]
+DEFAULT_SCRIPTS_DIR = os.path.join(REPOSITORY_DIR, "custom_calculations_scripts")
+
+
+def _authkey():
+    key = os.environ.get("WORKER_AUTHKEY")
+    if not key:
+        raise ValueError("Set WORKER_AUTHKEY to a shared secret to authenticate the worker connections")
+    return key.encode()
+
+
+def _address(address):
+    """
+    Socket path, or (host, port) tuple for addresses of the form `host:port`.
+    """
+    host, _, port = address.rpartition(":")
+    if host and port.isdigit():
+        return host, int(port)
+    return address
+
+
+def _allowed(path, scripts_dir):
+    """
+    Whether `path` is a Python script within `scripts_dir` (after resolving symbolic links).
+    """
+    path = os.path.realpath(path)
+    scripts_dir = os.path.realpath(scripts_dir)
+    return path.endswith(".py") and os.path.isfile(path) and os.path.commonpath([path, scripts_dir]) == scripts_dir
+
+
+def _job_error(job, scripts_dir):
+    """
+    Why the received `job` cannot be run, or None if it can.
+    """
+    if not isinstance(job, dict) or not isinstance(job.get("script"), str):
+        return "A job must be a dict with the path of the script to run as 'script'"
+    environment = job.get("environment")
+    if not isinstance(environment, dict) or not all(
+        isinstance(key, str) and isinstance(value, str) for key, value in environment.items()
+    ):
+        return "The 'environment' of a job must be a dict of strings"
+    if not _allowed(job["script"], scripts_dir):
+        return f"{job['script']} is not a script in {scripts_dir}"
+    return None
+
+
+def _handle(connection, scripts_dir):
+    """
+    Receive a job on `connection`, run it and send back its outcome. Errors are reported to the client, so a malformed
+    or failing job never stops the worker.
+    """
+    try:
+        job = connection.recv()
+    except EOFError:
+        return
+    try:
+        error = _job_error(job, scripts_dir)
+        outcome = {"ok": False, "error": error} if error is not None else run_script(job["script"], job["environment"])
+    except Exception:
+        outcome = {"ok": False, "error": traceback.format_exc()}
+    connection.send(outcome)
+
+
+class WarmClients:
+    """
+    Keeps the clients created by `TrendMinerClient.from_token` (per token and time zone) for `client_ttl` seconds, so
+    rotated or expired tokens are not used for long, and their tag lookups for `tag_ttl` seconds.
+    """
+
+    def __init__(self, client_ttl=3600, tag_ttl=3600):
+        self.client_ttl = client_ttl
+        self.tag_ttl = tag_ttl
+        self.clients = {}
+        self.lock = threading.Lock()
+
+    def install(self):
+        """
+        Replace `trendminer.TrendMinerClient.from_token` by a version reusing earlier clients.
+        """
+        try:
+            from trendminer import TrendMinerClient
+        except ImportError:
+            return
+        from_token = TrendMinerClient.from_token
+
+        def warm_from_token(*args, **kwargs):
+            key = hashlib.sha256(repr((args, sorted(kwargs.items()))).encode()).hexdigest()  # keep no tokens around
+            with self.lock:
+                entry = self.clients.get(key)
+                if (entry is None) or (time.monotonic() - entry[0] > self.client_ttl):
+                    entry = self.clients[key] = (time.monotonic(), self._warm(from_token(*args, **kwargs)))
+                return entry[1]
+
+        TrendMinerClient.from_token = warm_from_token
+
+    def _warm(self, client):
+        get_by_name = client.tag.get_by_name
+        tags = {}
+
+        def cached_get_by_name(name, *args, **kwargs):
+            key = repr((name, args, sorted(kwargs.items())))
+            entry = tags.get(key)
+            if (entry is None) or (time.monotonic() - entry[0] > self.tag_ttl):
+                entry = tags[key] = (time.monotonic(), get_by_name(name, *args, **kwargs))
+            return entry[1]
+
+        object.__setattr__(client.tag, "get_by_name", cached_get_by_name)
+        return client
+
+
+def run_script(path, environment):
+    """
+    Run the script at `path` in a fresh namespace, with `environment` added to the process environment while it runs.
+    Returns a dict with the outcome of the run.
+    """
+    saved_environment = dict(os.environ)
+    saved_cwd = os.getcwd()
+    saved_argv = sys.argv
+    os.environ.update(environment)
+    sys.argv = [path]
+    start = time.perf_counter()
+    try:
+        runpy.run_path(path, run_name="__main__")
+        outcome = {"ok": True}
+    except SystemExit as exit:
+        outcome = {"ok": exit.code in (None, 0)}
+        if not outcome["ok"]:
+            outcome["error"] = f"SystemExit: {exit.code}"
+    except Exception:
+        outcome = {"ok": False, "error": traceback.format_exc()}
+    finally:
+        instrumentation.finish()  # write the profile of the run, if it was instrumented
+        os.environ.clear()
+        os.environ.update(saved_environment)
+        os.chdir(saved_cwd)
+        sys.argv = saved_argv
+    outcome["wall_time"] = time.perf_counter() - start
+    return outcome
+
+
+def _listener(address, authkey):
+    """
+    Listener on `address`. A socket file is created accessible only by the current user, in a private directory.
+    """
+    if not isinstance(address, str):
+        return Listener(address, authkey=authkey)
+    private_directory(os.path.dirname(os.path.abspath(address)))
+    if os.path.exists(address):
+        os.remove(address)  # left behind by a worker that was killed
+    umask = os.umask(0o177)
+    try:
+        listener = Listener(address, authkey=authkey)
+    finally:
+        os.umask(umask)
+    os.chmod(address, 0o600)
+    return listener
+
+
+def serve(address=DEFAULT_ADDRESS, preload=DEFAULT_PRELOAD, client_ttl=3600, tag_ttl=3600,
+          scripts_dir=DEFAULT_SCRIPTS_DIR):
+    """
+    Run jobs received on `address` until interrupted. Only scripts within `scripts_dir` are run.
+    """
+    authkey = _authkey()
+    for module in preload:
+        try:
+            __import__(module)
+        except ImportError:
+            pass
+    WarmClients(client_ttl=client_ttl, tag_ttl=tag_ttl).install()
+
+    with _listener(_address(address), authkey) as listener:
+        while True:
+            try:
+                connection = listener.accept()
+            except (OSError, EOFError, AuthenticationError):
+                continue  # e.g., a client failing to authenticate
+            with connection:
+                try:
+                    _handle(connection, scripts_dir)
+                except Exception:
+                    traceback.print_exc()  # e.g., a client disconnecting before receiving the outcome
+
+
+def submit(script, start, end, output_file, address=DEFAULT_ADDRESS, environment=None):
+    """
+    Run `script` on the worker at `address` for the index interval [start, end], and return the outcome.
+    """
+    environment = dict(environment or {})
+    environment.update({
+        "START_TIMESTAMP": str(start),
+        "END_TIMESTAMP": str(end),
+        "OUTPUT_FILE": os.path.abspath(output_file),
+    })
+    with Client(_address(address), authkey=_authkey()) as connection:
+        connection.send({"script": os.path.abspath(script), "environment": environment})
+        return connection.recv()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--address", default=DEFAULT_ADDRESS, help="socket path, or host:port")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="start a worker")
+    serve_parser.add_argument("--preload", nargs="*", default=DEFAULT_PRELOAD, help="modules to import up front")
+    serve_parser.add_argument("--client-ttl", type=float, default=3600, help="seconds to reuse clients")
+    serve_parser.add_argument("--tag-ttl", type=float, default=3600, help="seconds to reuse tag lookups")
+    serve_parser.add_argument("--scripts-dir", default=DEFAULT_SCRIPTS_DIR, help="directory of the scripts to run")
+    run_parser = commands.add_parser("run", help="run a script on a worker")
+    run_parser.add_argument("script")
+    run_parser.add_argument("--start", default=os.environ.get("START_TIMESTAMP"))
+    run_parser.add_argument("--end", default=os.environ.get("END_TIMESTAMP"))
+    run_parser.add_argument("--output", default=os.environ.get("OUTPUT_FILE"))
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args.address, preload=args.preload, client_ttl=args.client_ttl, tag_ttl=args.tag_ttl,
+              scripts_dir=args.scripts_dir)
+        return
+
+    # The access token is passed along, so the worker can serve several tokens
+    environment = {"ACCESS_TOKEN": os.environ["ACCESS_TOKEN"]} if "ACCESS_TOKEN" in os.environ else {}
+    outcome = submit(args.script, args.start, args.end, args.output, address=args.address, environment=environment)
+    if not outcome["ok"]:
+        print(outcome["error"], file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
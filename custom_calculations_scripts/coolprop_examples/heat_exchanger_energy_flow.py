@@ -1,10 +1,12 @@
 #%%
 import os
-from time import tzname
 
 import pandas as pd
-from CoolProp.CoolProp import PropsSI
 from trendminer import TrendMinerClient
+from custom_calculations.instrumentation import instrument
+from custom_calculations.output import write_csv
+from custom_calculations.planner import FetchPlan
+from custom_calculations.properties import DEFAULT_CACHE_FILE, PropertyCache, water_enthalpy
 
 # ——————————————————————————————————————————
 # 1. Init client & index interval
@@ -14,6 +16,9 @@ client = TrendMinerClient.from_token(
     tz="Europe/Brussels",
 )
 
+# Record the time, API calls and memory use per stage when CUSTOM_CALCULATIONS_PROFILE is set
+client = instrument(client)
+
 index_interval = client.time.interval(
     os.environ["START_TIMESTAMP"],
     os.environ["END_TIMESTAMP"],
@@ -28,12 +33,19 @@ rho_tag  = client.tag.get_by_name("TM5-HEX-QI0620")   # fluid density (kg/m³)
 flow_tag = client.tag.get_by_name("TM5-HEX-FI0620")   # volumetric flow (m³/s)
 
 # ——————————————————————————————————————————
-# 3. Fetch raw data at 1 min resolution
+# 3. Fetch raw data at 1 min resolution (all tags at once)
 # ——————————————————————————————————————————
-ser_T    = T_tag   .get_data(index_interval, resolution="1m")
-ser_P    = P_tag   .get_data(index_interval, resolution="1m")
-ser_rho  = rho_tag .get_data(index_interval, resolution="1m")
-ser_flow = flow_tag.get_data(index_interval, resolution="1m")
+plan = FetchPlan(max_workers=4)
+plan.add("T",    T_tag   .get_data, index_interval, resolution="1m")
+plan.add("P",    P_tag   .get_data, index_interval, resolution="1m")
+plan.add("rho",  rho_tag .get_data, index_interval, resolution="1m")
+plan.add("flow", flow_tag.get_data, index_interval, resolution="1m")
+data = plan.run()
+
+ser_T    = data["T"]
+ser_P    = data["P"]
+ser_rho  = data["rho"]
+ser_flow = data["flow"]
 
 # ——————————————————————————————————————————
 # 4. Align into one DataFrame & drop missing points
@@ -50,14 +62,22 @@ df = df.dropna()
 # Pre-compute arrays for speed/readability
 temps_K  = df["T"] + 273.15
 press_Pa = df["P"] * 1e5
-# print(temps_K)
-# Compute specific enthalpy [kJ/kg] at each point
-enthalpies = [
-    PropsSI('H', 'T', T, 'P', P, 'IF97::Water') / 1e3
-    for T, P in zip(temps_K, press_Pa)
-]
-# print(enthalpies)
-df["h_kJkg"] = enthalpies
+
+# Compute specific enthalpy [kJ/kg] at each point, in a single CoolProp call. Inputs are rounded to the sensor
+# precision (0.01 K, 100 Pa) so repeated (T, P) pairs are only evaluated once; enthalpies remembered from previous runs
+# are not evaluated again. Rounding changes the enthalpy by less than 0.03 kJ/kg.
+enthalpy_cache = PropertyCache(
+    os.environ.get("PROPERTY_CACHE_FILE", DEFAULT_CACHE_FILE),
+    max_size=100_000,
+)
+df["h_kJkg"] = water_enthalpy(
+    temps_K,
+    press_Pa,
+    temperature_precision=0.01,
+    pressure_precision=100.0,
+    cache=enthalpy_cache,
+) / 1e3
+enthalpy_cache.save()
 
 # Compute mass flow [kg/s] = density [kg/m³] * volumetric flow [m³/s]
 df["m_dot"] = df["rho"] * df["vol_flow"]
@@ -73,9 +93,9 @@ df = df[["value"]]
 df = df.loc[
     (df.index >= index_interval.start) &
     (df.index < index_interval.end)
-]
+].dropna()
 
 ser = pd.Series(df["value"].values, index=df.index)
 ser.name = "value"
 
-ser.to_csv(os.environ["OUTPUT_FILE"])
\ No newline at end of file
+write_csv(ser, os.environ["OUTPUT_FILE"])
\ No newline at end of file
@@ -9,9 +9,18 @@
 
 # Imports
 import os
+import numpy as np
 import pandas as pd
 from trendminer import TrendMinerClient
 from trendminer.sdk.search import ValueBasedSearchOperators
+from custom_calculations.compression import compress
+from custom_calculations.instrumentation import instrument
+from custom_calculations.intervals import complement, union
+from custom_calculations.output import write_csv
+from custom_calculations.planner import FetchPlan
+from custom_calculations.search_cache import SearchCache
+from custom_calculations.timestamps import interval_arrays, to_index
+from custom_calculations.widening import widened_results
 
 # Initialize client
 client = TrendMinerClient.from_token(
@@ -19,9 +28,21 @@ client = TrendMinerClient.from_token(
     tz="Europe/Brussels",
 )
 
+# Record the time, API calls and memory use per stage when CUSTOM_CALCULATIONS_PROFILE is set
+client = instrument(client)
+
 # Set the maximal duration a run or downtime can take
 maximal_duration = client.time.timedelta("30d")
 
+# Margin around the index interval for the searches. It is doubled (up to the maximal duration) only while the searched
+# window does not contain the full downtime before, and the stable period after, every startup in the index interval.
+minimal_margin = client.time.timedelta("1d")
+
+# Output compression. The output is a discrete tag, so "repeats" drops the points that repeat the previous value (e.g.,
+# the 0 of a stable period directly following another one). None keeps every point.
+compression = None
+compression_tolerance = 0
+
 # Received index interval
 index_interval = client.time.interval(
     os.environ["START_TIMESTAMP"],
@@ -31,8 +52,15 @@ index_interval = client.time.interval(
 # Load tags; add these as dependencies!
 tag = client.tag.get_by_name("[CS]BA:LEVEL.1")
 
+# Search results are cached across runs (by default in the per-user cache directory), so only the part of the widened
+# interval that was not searched before is searched again. When an index interval is indexed again (e.g., because data
+# arrived late), the cached results from its start on are searched again. Cached results are otherwise kept: changes to
+# the data only within the search margin, outside the index intervals that are indexed again, are not picked up. Point
+# SEARCH_CACHE_FILE to a new file (or remove the file) to search everything again, e.g., after correcting old data.
+search_cache = SearchCache(client, os.environ.get("SEARCH_CACHE_FILE"))
+
 # Downtime search definition
-search_downtime = client.search.value(
+search_downtime = search_cache.value(
     queries = [
         (tag, ValueBasedSearchOperators.LESS_THAN, 1)
     ],
@@ -40,47 +68,78 @@ search_downtime = client.search.value(
 )
 
 # Running search definition
-search_running = client.search.value(
+search_running = search_cache.value(
     queries = [
         (tag, ValueBasedSearchOperators.GREATER_THAN, 18)
     ],
     duration="5m"
 )
 
-# --- CODE EXECUTION ----
 
-# Widen interval
-search_interval = client.time.interval(
-    index_interval.start - maximal_duration,
-    index_interval.end + maximal_duration,
-)
+# Perform both searches at once
+def search_both(window):
+    plan = FetchPlan()
+    plan.add("downtimes", search_downtime.get_results, window)
+    plan.add("running", search_running.get_results, window)
+    return plan.run()
 
-# Perform the searches
-downtimes = search_downtime.get_results(search_interval)
-running = search_running.get_results(search_interval)
 
-# The start of the startup is the end of the downtime
-df_downtimes = pd.DataFrame(index=[result.end for result in downtimes])
+# The startups in the index interval are known when a search result ends before the index interval (so the downtimes
+# ending in the index interval start in the window), and a search result starts after the last downtime ending in the
+# index interval (so it is known whether stable operation followed it)
+def startups_complete(results, window):
+    starts = np.concatenate([interval_arrays(results[key])[0] for key in ("downtimes", "running")])
+    ends = np.concatenate([interval_arrays(results[key])[1] for key in ("downtimes", "running")])
+    downtime_ends = interval_arrays(results["downtimes"])[1]
+    index_start, index_end = pd.Timestamp(index_interval.start).value, pd.Timestamp(index_interval.end).value
+    ending_downtimes = downtime_ends[(index_start <= downtime_ends) & (downtime_ends < index_end)]
+    return (
+        bool(np.any(ends <= index_start)),
+        (len(ending_downtimes) == 0) or bool(np.any(starts >= ending_downtimes.max())),
+    )
 
-# We add the duration (in hours)
-df_downtimes["value"] = [result.duration.total_seconds()/3600 for result in downtimes]
 
-# The end of the startup is the start of the stable period
-df_running = pd.DataFrame(index=[result.start for result in running])
+# --- CODE EXECUTION ----
+
+# Forget the cached search results from the start of the index interval if it is being indexed again
+search_cache.begin([search_downtime, search_running], index_interval.start, index_interval.end)
+
+# Widen interval, only as far as needed
+results, search_interval = widened_results(
+    client,
+    search_both,
+    index_interval,
+    margin=minimal_margin,
+    cap=maximal_duration,
+    complete=startups_complete,
+)
 
-# At which point our tag value should become 0 again
-df_running["value"] = 0
+downtime_starts, downtime_ends = interval_arrays(results["downtimes"])
+running_starts, running_ends = interval_arrays(results["running"])
 
-# We put all values together, sorted by timestamp
-df = (
-    pd.concat([df_downtimes, df_running])
-    .sort_index()
+# Startups are the gaps between the searches that run from the end of a downtime up to the start of a stable period.
+# This ignores instances where a downtime does not reach stable operation, but rather is followed by another downtime.
+gap_starts, gap_ends = complement(
+    *union(downtime_starts, downtime_ends, running_starts, running_ends),
+    search_interval.start,
+    search_interval.end,
 )
+is_startup = np.isin(gap_starts, downtime_ends) & np.isin(gap_ends, running_starts)
+startup_starts = gap_starts[is_startup]
+
+# The duration of the downtime (in hours) at the start of the startup, and 0 from the start of every stable period
+downtime_hours = (downtime_ends - downtime_starts) / pd.Timedelta(hours=1).value
+timestamps = np.concatenate([startup_starts, running_starts])
+values = np.concatenate([downtime_hours[np.searchsorted(downtime_ends, startup_starts)], np.zeros(len(running_starts))])
+order = np.argsort(timestamps, kind="stable")
+ser = pd.Series(values[order], index=to_index(timestamps[order], client.tz), name="value")
+
+# Keep only the timestamps in the index interval
+ser = ser.loc[lambda x: (index_interval.start <= x.index) & (x.index < index_interval.end)]
 
-# We want to ignore instances where a downtime does not reach stable operation, but rather is followed by another downtime
-# Keep only values of 0 (running) or where the next value is 0 (downtime followed by running), and the timestamp is in the index interval
-keep = ((df["value"] == 0) | (df["value"].shift(-1) == 0)) & (index_interval.start <= df.index) & (df.index < index_interval.end)
-df = df[keep]
+# Only keep the points needed to reconstruct the signal
+ser = compress(ser, method=compression, tolerance=compression_tolerance)
 
 # To file
-df.to_csv(os.environ["OUTPUT_FILE"])
\ No newline at end of file
+write_csv(ser, os.environ["OUTPUT_FILE"])
+search_cache.processed([search_downtime, search_running], index_interval.start, index_interval.end)
\ No newline at end of file
@@ -1,11 +1,11 @@
 import os
 import pandas as pd
-import numpy as np
-from datetime import timedelta
-from scipy.integrate import cumulative_trapezoid
 from trendminer import TrendMinerClient
-from trendminer.sdk.tag import TagCalculationOptions
-from trendminer.sdk.search import ValueBasedSearchOperators
+from custom_calculations.instrumentation import instrument
+from custom_calculations.output import write_csv
+from custom_calculations.timestamps import interval_arrays
+from custom_calculations.totalizers import get_adaptive_data, value_totalizer
+from custom_calculations.widening import freq_window
 
 # ---- PARAMETERS -----
 
@@ -15,6 +15,9 @@ client = TrendMinerClient.from_token(
     tz="Europe/Brussels",  # <--- SET TIMEZONE
 )
 
+# Record the time, API calls and memory use per stage when CUSTOM_CALCULATIONS_PROFILE is set
+client = instrument(client)
+
 # Frequency selection for the totalizer reset interval
 # Change 'freq' to set the duration of the totalizer:
 #   - Daily:    freq = "D"
@@ -24,13 +27,6 @@ client = TrendMinerClient.from_token(
 # See: https://pandas.pydata.org/docs/user_guide/timeseries.html#timeseries-offset-aliases
 freq = "D"  # <-- Change this value for different totalizer durations
 
-# Set maximal_duration to the maximum possible length of one interval
-# For daily:   "25h" (covers a full day plus a margin)
-# For weekly:  "8d"  (covers a full week plus a margin)
-# For monthly: "32d" (covers a full month plus a margin)
-# Adjust as needed for your chosen freq
-maximal_duration = client.time.timedelta("25h")  # <-- Change this for different durations
-
 # tag definition; this is the tag we will integrate (in kW)
 tag_to_totalize = client.tag.get_by_name("[CS]BA:CONC.1")  # <-- replace with your kW tag name
 
@@ -39,6 +35,11 @@ tag_to_totalize = client.tag.get_by_name("[CS]BA:CONC.1")  # <-- replace with yo
 # 1 hour = 3600 seconds
 kwh_time_unit = client.time.timedelta("1h")
 
+# Maximal integration error of the totals, in kWh. When set, the data is first fetched at a coarse resolution, and only
+# refined to the 1m resolution where needed to stay within this error, which transfers far fewer points for slowly
+# changing signals. None fetches all data at 1m.
+max_error = None  # <-- e.g. 1.0
+
 # ---- CODE EXECUTION -----
 
 # Received index interval
@@ -47,38 +48,37 @@ index_interval = client.time.interval(
     os.environ["END_TIMESTAMP"],
 )
 
-# Get regular intervals. In this case we also have to look backwards.
+# Get the regular intervals overlapping the index interval. In this case we also have to look backwards, to the start
+# of the interval containing the start of the index interval.
+window = freq_window(client, index_interval, freq)
 intervals = client.time.interval.range(
     freq=freq,  # <-- This determines the reset interval for the totalizer
-    start=index_interval.start - maximal_duration,
-    end=index_interval.end + maximal_duration,
+    start=window.start,
+    end=window.end,
     normalize=True,
 )
 
-# Generate a dataframe per interval
-ser_list = []
-for interval in intervals:
-    tag_data = tag_to_totalize.get_data(interval, resolution="1m")
-    if len(tag_data) <= 1:
-        continue
-    relative_index = tag_data.index - tag_data.index[0]
-    x_coordinate = relative_index.total_seconds() / kwh_time_unit.total_seconds()
-    # Integrate kW over hours to get kWh
-    total_values = cumulative_trapezoid(y=tag_data, x=x_coordinate)
-    total_values = np.insert(total_values, 0, 0)  # start values at 0
-
-    # Add 1ms to avoid duplicate timestamps
-    totals = pd.Series(
-        index=[tag_data.index[0] + timedelta(seconds=0.001)] + tag_data.index[1:].tolist(),
-        data=total_values,
+# only proceed if there are intervals
+if len(intervals) > 0:
+    # Get the data for all intervals at once
+    tag_data = get_adaptive_data(
+        client,
+        tag_to_totalize,
+        start=intervals[0].start,
+        end=intervals[-1].end,
+        resolution="1m",
+        tolerance=max_error,
+        time_unit=kwh_time_unit,
+        breakpoints=interval_arrays(intervals),  # the totalizer resets at the interval boundaries
     )
-    ser_list.append(totals)
 
-# only proceed if the list is not empty
-if ser_list:
-    # Concatenate the series
-    ser = pd.concat(ser_list)
-    ser.name = "value"
+    # Integrate kW over hours to get kWh, starting from 0 at the start of every interval
+    ser = value_totalizer(
+        tag_data,
+        *interval_arrays(intervals),
+        tz=client.tz,
+        time_unit=kwh_time_unit,
+    )
 
     # Filter for timestamps and NaN values
     ser = (
@@ -89,6 +89,7 @@ if ser_list:
     )
 
     # To file
-    ser.to_csv(
+    write_csv(
+        ser,
         os.environ["OUTPUT_FILE"]
     )
@@ -1,7 +1,15 @@
 import os
-import pandas as pd
 from trendminer import TrendMinerClient
 from trendminer.sdk.tag import TagCalculationOptions
+from custom_calculations.aggregates import aggregate
+from custom_calculations.compression import compress
+from custom_calculations.frames import IntervalFrame
+from custom_calculations.horizon import indexing_horizon
+from custom_calculations.instrumentation import instrument
+from custom_calculations.output import write_csv
+from custom_calculations.state import IncrementalState
+from custom_calculations.timestamps import interval_arrays
+from custom_calculations.widening import freq_window
 
 # ---- PARAMETERS -----
 
@@ -11,42 +19,52 @@ client = TrendMinerClient.from_token(
     tz="Europe/Brussels",  # <--- SET TIMEZONE
 )
 
+# Record the time, API calls and memory use per stage when CUSTOM_CALCULATIONS_PROFILE is set
+client = instrument(client)
+
 # Frequency selection
 # https://pandas.pydata.org/docs/user_guide/timeseries.html#timeseries-offset-aliases
 # Daily: D | Weekly starting Monday: W-MON | Monthly: MS | Yearly: YS
 freq = "D"
-maximal_duration = client.time.timedelta("25h")  # the maximal possible duration of one interval
 
 # tag definition
 tag1 = client.tag.get_by_name("[CS]BA:CONC.1")
 tag2 = client.tag.get_by_name("[CS]BA:LEVEL.1")
 tags = [tag1, tag2]
 
+# Output compression. The result is a step signal, so "repeats" only keeps the points where the value changes by more
+# than compression_tolerance. None keeps every point. See custom_calculations.compression for the other methods.
+compression = None
+compression_tolerance = 0
+
+# File in which the results of finalized intervals are stored (STATE_FILE, or the per-user cache directory), so they are
+# not calculated again by later runs. Results are only stored for intervals that ended before the indexing horizon and
+# at least `settle_time` ago. Stored results from the start of an index interval on are dropped when it overlaps an
+# already processed range (the range is indexed again), and all of them when this script is edited.
+state = IncrementalState(
+    os.environ.get("STATE_FILE"),
+    settle_time="1h",
+)
+state_key = IncrementalState.key("block_aggregation", tags, freq, script=__file__)
+
 
 # calculation definition
 def calculate(intervals):
-    # Aggregations
-    tag1.calculate(
-        intervals=intervals,
-        operation=TagCalculationOptions.MAXIMUM,  # MEAN, MINIMUM, MAXIMUM, RANGE, START, END, DELTA, INTEGRAL, STDEV
-        key="calc1",
-        inplace=True,
+    # Aggregations; all tags and operations are requested at once, in concurrent batches of intervals. Use
+    # calculation_matrix to request every combination of several tags and operations.
+    frame = aggregate(
+        intervals,
+        calculations={
+            "calc1": (tag1, TagCalculationOptions.MAXIMUM),
+            # MEAN, MINIMUM, MAXIMUM, RANGE, START, END, DELTA, INTEGRAL, STDEV
+            "calc2": (tag2, TagCalculationOptions.MAXIMUM),
+        },
+        tz=client.tz,
     )
 
-    tag2.calculate(
-        intervals=intervals,
-        operation=TagCalculationOptions.MAXIMUM,
-        key="calc2",
-        inplace=True,
-    )
-
-    # Custom operations
-    for interval in intervals:
-        # Account for potential missing calculations
-        try:
-            interval["result"] = interval["calc1"] * interval["calc2"]
-        except (TypeError, KeyError):
-            interval["result"] = None
+    # Custom operations, on all intervals at once. Missing calculations are NaN, so they give a NaN result.
+    frame["result"] = frame["calc1"] * frame["calc2"]
+    return frame
 
 
 # ---- CODE EXECUTION -----
@@ -56,44 +74,34 @@ index_interval = client.time.interval(
     os.environ["START_TIMESTAMP"],
     os.environ["END_TIMESTAMP"],
 )
+state.begin(state_key, index_interval.start, index_interval.end)
 
-# Determine the last point up to which we can perform calculations (all tags indexed)
-check_interval = client.time.interval(
-    index_interval.start,
-    client.time.now(),
-)
+# Determine the last point up to which we can perform calculations (all tags indexed). All tags are checked at once,
+# and recently checked tags are not checked again.
+last_timestamp = indexing_horizon(client, tags, start=index_interval.start)
 
-try:
-    last_timestamp = min([
-        tag.get_plot_data(check_interval, n_intervals=2).index[-1]
-        for tag in tags
-        ])
-except IndexError:
-    last_timestamp = index_interval.start
-
-# Get intervals
+# Get the intervals starting in the index interval, up to the end of the interval containing its end (or the
+# indexing horizon)
+window = freq_window(client, index_interval, freq)
 intervals = client.time.interval.range(
     freq=freq,
     start=index_interval.start,
     end=min([
-        index_interval.end + maximal_duration,
+        window.end,
         last_timestamp,
     ]),
     normalize=True,
 )
 
-# Perform the calculation
-calculate(intervals)
+# Reuse the stored results of finalized intervals, and only perform the calculation for the other intervals
+starts, ends = interval_arrays(intervals)
+results, found = state.periods(state_key, starts, ends)
+calculated = calculate([interval for interval, is_found in zip(intervals, found) if not is_found])
+results[~found] = calculated["result"]
+state.finalize(state_key, calculated.starts, calculated.ends, calculated["result"], horizon=last_timestamp)
 
 # Put the results in a Series
-ser = pd.Series(
-    index=[
-        interval.start for interval in intervals
-    ],
-    data=[
-        interval["result"] for interval in intervals
-    ],
-)
+ser = IntervalFrame(starts, ends, tz=client.tz, columns={"result": results}).series("result")
 
 # Filter for timestamps and NaN values
 ser = (
@@ -103,8 +111,14 @@ ser = (
     .dropna()
 )
 
+# Only keep the points needed to reconstruct the signal
+ser = compress(ser, method=compression, tolerance=compression_tolerance)
+
 # To file
 if not ser.empty:
-    ser.to_csv(
+    write_csv(
+        ser,
         os.environ["OUTPUT_FILE"]
-    )
\ No newline at end of file
+    )
+
+state.processed(state_key, index_interval.start, index_interval.end)
\ No newline at end of file
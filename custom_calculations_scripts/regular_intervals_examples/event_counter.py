@@ -1,8 +1,13 @@
 import os
 import pandas as pd
 from trendminer import TrendMinerClient
-from trendminer.sdk.tag import TagCalculationOptions
 from trendminer.sdk.search import ValueBasedSearchOperators
+from custom_calculations.counting import count_events
+from custom_calculations.horizon import indexing_horizon
+from custom_calculations.instrumentation import instrument
+from custom_calculations.output import write_csv
+from custom_calculations.timestamps import interval_arrays
+from custom_calculations.widening import freq_window
 
 # ---- PARAMETERS -----
 
@@ -12,11 +17,13 @@ client = TrendMinerClient.from_token(
     tz="Europe/Brussels",  # <--- SET TIMEZONE
 )
 
+# Record the time, API calls and memory use per stage when CUSTOM_CALCULATIONS_PROFILE is set
+client = instrument(client)
+
 # Frequency selection
 # https://pandas.pydata.org/docs/user_guide/timeseries.html#timeseries-offset-aliases
 # Daily: D | Weekly starting Monday: W-MON | Monthly: MS | Yearly: YS
 freq = "D"
-maximal_duration = client.time.timedelta("25h")  # the maximal possible duration of one interval
 
 # tag definition
 tag1 = client.tag.get_by_name("[CS]BA:ACTIVE.1")
@@ -39,26 +46,18 @@ index_interval = client.time.interval(
     os.environ["END_TIMESTAMP"],
 )
 
-# Determine the last point up to which we can perform calculations (all tags indexed)
-check_interval = client.time.interval(
-    index_interval.start,
-    client.time.now(),
-)
-
-try:
-    last_timestamp = min([
-        tag.get_plot_data(check_interval, n_intervals=2).index[-1]
-        for tag in tags
-        ])
-except IndexError:
-    last_timestamp = index_interval.start
+# Determine the last point up to which we can perform calculations (all tags indexed). All tags are checked at once,
+# and recently checked tags are not checked again.
+last_timestamp = indexing_horizon(client, tags, start=index_interval.start)
 
-# Get regular intervals
+# Get the intervals starting in the index interval, up to the end of the interval containing its end (or the
+# indexing horizon)
+window = freq_window(client, index_interval, freq)
 intervals = client.time.interval.range(
     freq=freq,
     start=index_interval.start,
     end=min([
-        index_interval.end + maximal_duration,
+        window.end,
         last_timestamp - search_duration,
     ]),
     normalize=True,
@@ -67,27 +66,23 @@ intervals = client.time.interval.range(
 # Get search results
 search_interval = client.time.interval(
     index_interval.start - client.resolution,
-    index_interval.end + maximal_duration,
+    window.end,
 )
 
 results = event_search.get_results(search_interval)
 
 # Count number of results that start in each regular interval
-for interval in intervals:
-    interval["count"] = sum([
-        1 for result in results
-        if (interval.start <= result.start)
-           and (result.start < interval.end)
-    ])
+counts = count_events(
+    *interval_arrays(intervals),
+    *interval_arrays(results),
+)
 
 # Put the results in a Series
 ser = pd.Series(
     index=[
         interval.start for interval in intervals
     ],
-    data=[
-        interval["count"] for interval in intervals
-    ],
+    data=counts.count,
 )
 
 # Filter for timestamps and NaN values
@@ -100,6 +95,7 @@ ser = (
 
 # To file
 if not ser.empty:
-    ser.to_csv(
+    write_csv(
+        ser,
         os.environ["OUTPUT_FILE"]
     )
@@ -1,8 +1,13 @@
 import os
 import pandas as pd
 from trendminer import TrendMinerClient
-from trendminer.sdk.tag import TagCalculationOptions
 from trendminer.sdk.search import ValueBasedSearchOperators
+from custom_calculations.counting import incrementing_counter
+from custom_calculations.horizon import indexing_horizon
+from custom_calculations.instrumentation import instrument
+from custom_calculations.output import write_csv
+from custom_calculations.timestamps import interval_arrays
+from custom_calculations.widening import freq_window
 
 # ---- PARAMETERS -----
 
@@ -12,11 +17,13 @@ client = TrendMinerClient.from_token(
     tz="Europe/Brussels",  # <--- SET TIMEZONE
 )
 
+# Record the time, API calls and memory use per stage when CUSTOM_CALCULATIONS_PROFILE is set
+client = instrument(client)
+
 # Frequency selection
 # https://pandas.pydata.org/docs/user_guide/timeseries.html#timeseries-offset-aliases
 # Daily: D | Weekly starting Monday: W-MON | Monthly: MS | Yearly: YS
 freq = "D"
-maximal_duration = client.time.timedelta("25h")  # the maximal possible duration of one interval
 
 # tag definition
 tag1 = client.tag.get_by_name("[CS]BA:ACTIVE.1")
@@ -39,71 +46,32 @@ index_interval = client.time.interval(
     os.environ["END_TIMESTAMP"],
 )
 
-# Determine the last point up to which we can perform calculations (all tags indexed)
-check_interval = client.time.interval(
-    index_interval.start,
-    client.time.now(),
-)
-
-try:
-    last_timestamp = min([
-        tag.get_plot_data(check_interval, n_intervals=2).index[-1]
-        for tag in tags
-        ])
-except IndexError:
-    last_timestamp = index_interval.start
+# Determine the last point up to which we can perform calculations (all tags indexed). All tags are checked at once,
+# and recently checked tags are not checked again.
+last_timestamp = indexing_horizon(client, tags, start=index_interval.start)
 
-# Get regular intervals. In this case we also have to look backwards.
+# Get the regular intervals overlapping the index interval. In this case we also have to look backwards, to the start
+# of the interval containing the start of the index interval.
+window = freq_window(client, index_interval, freq)
 intervals = client.time.interval.range(
     freq=freq,
-    start=index_interval.start - maximal_duration,
-    end=index_interval.end + maximal_duration,
+    start=window.start,
+    end=window.end,
     normalize=True,
 )
 
-# Get search results
-search_interval = client.time.interval(
-    index_interval.start - maximal_duration,
-    index_interval.end + maximal_duration,
-)
-
-results = event_search.get_results(search_interval)
-
-# Generate a dataframe per interval
-ser_list = []
-for interval in intervals:
+# Get search results over the same window
+results = event_search.get_results(window)
 
-    interval_results = [
-        result for result in results
-        if (interval.start <= result.start)
-           and (result.start < interval.end)
-    ]
-
-    interval_ser = pd.Series(
-        index=[result.start for result in interval_results],
-        data=1,
-    ).cumsum()
-
-    # start at 0 unless first result starts at interval start
-    if (len(interval_results) == 0) or (interval_results[0].start != interval.start):
-        interval_ser = pd.concat(
-            [
-                pd.Series(
-                    index=[interval.start],
-                    data=[0],
-                ),
-                interval_ser,
-            ]
-        )
-
-    ser_list.append(interval_ser)
-
-# only proceed if the list is not empty
-if ser_list:
-    # Concatenate the series
-    ser = pd.concat(ser_list)
-    ser.name = "value"
+# Build the counter for all intervals at once; it starts at 0 and increments at the start of every result
+ser = incrementing_counter(
+    *interval_arrays(intervals),
+    interval_arrays(results)[0],
+    tz=client.tz,
+)
 
+# only proceed if there are intervals
+if not ser.empty:
     # Filter for timestamps and NaN values
     ser = (
         ser
@@ -113,6 +81,7 @@ if ser_list:
     )
 
     # To file
-    ser.to_csv(
+    write_csv(
+        ser,
         os.environ["OUTPUT_FILE"]
     )
@@ -5,6 +5,12 @@ import os
 import pandas as pd
 from trendminer import TrendMinerClient
 from trendminer.sdk.search import ValueBasedSearchOperators
+from custom_calculations.compression import compress
+from custom_calculations.instrumentation import instrument
+from custom_calculations.output import write_csv
+from custom_calculations.timestamps import interval_arrays
+from custom_calculations.totalizers import duration_totalizer
+from custom_calculations.widening import freq_window
 
 # Initialize client
 client = TrendMinerClient.from_token(
@@ -12,11 +18,13 @@ client = TrendMinerClient.from_token(
     tz="Europe/Brussels",  # <--- SET TIMEZONE
 )
 
+# Record the time, API calls and memory use per stage when CUSTOM_CALCULATIONS_PROFILE is set
+client = instrument(client)
+
 # Frequency selection
 # https://pandas.pydata.org/docs/user_guide/timeseries.html#timeseries-offset-aliases
 # Daily: D | Weekly starting Monday: W-MON | Monthly: MS | Yearly: YS
 freq = "D"
-maximal_duration = client.time.timedelta("25h")  # the maximal possible duration of one interval
 
 # tag definition
 tag1 = client.tag.get_by_name("[CS]BA:ACTIVE.1")
@@ -31,62 +39,46 @@ event_search = client.search.value(
     duration=search_duration,
 )
 
+# Resolution of the output tag. With None, only the points where the totalizer changes slope are returned, which gives
+# the exact totalizer when interpolated. Set e.g. pd.Timedelta("1m") to get a value every minute instead.
+tag_freq = None
+
+# Output compression, mostly useful with a tag_freq: the totalizer is flat between events and increases linearly during
+# them, so "swinging_door" with a small tolerance (in hours) only keeps the points where the slope changes. None keeps
+# every point. See custom_calculations.compression for the other methods.
+compression = None
+compression_tolerance = 1e-6
+
 # Received index interval
 index_interval = client.time.interval(
     os.environ["START_TIMESTAMP"],
     os.environ["END_TIMESTAMP"],
 )
 
-# Get regular intervals. In this case we also have to look backwards.
+# Get the regular intervals overlapping the index interval. In this case we also have to look backwards, to the start
+# of the interval containing the start of the index interval.
+window = freq_window(client, index_interval, freq)
 intervals = client.time.interval.range(
     freq=freq,
-    start=index_interval.start - maximal_duration,
-    end=index_interval.end + maximal_duration,
+    start=window.start,
+    end=window.end,
     normalize=True,
 )
 
-# Get search results
-search_interval = client.time.interval(
-    index_interval.start - maximal_duration,
-    index_interval.end + maximal_duration,
-)
-
-results = event_search.get_results(search_interval)
-
-# Generate a dataframe per interval
-ser_list = []
-tag_freq = pd.Timedelta("1m")  # resolution of the output tag
-for interval in intervals:
+# Get search results over the same window
+results = event_search.get_results(window)
 
-    # Start from empty Series for the interval
-    interval_ser = pd.Series(
-            index=pd.date_range(
-                start=interval.start,
-                end=interval.end - tag_freq,  # avoid duplicate timestamps
-                freq=tag_freq,
-                tz=client.tz,
-            ),
-            data=0.0,  # set as float to avoid warnings
-        )
-
-    # Set a value for the times that fall in a search result
-    for result in results:
-        if (result.start > interval.end) or (result.end < interval.start):
-            continue
-        interval_ser[
-            (result.start <= interval_ser.index) &
-            (interval_ser.index <= result.end)
-        ] = tag_freq.total_seconds()/3600  # will get duration in hours
-
-    # Get cumulative sum to get increasing duration
-    interval_ser = interval_ser.cumsum()
-    ser_list.append(interval_ser)
-
-# only proceed if the list is not empty
-if ser_list:
-    # Concatenate the series
-    ser = pd.concat(ser_list)
+# Totalize the search result durations (in hours) per interval
+ser = duration_totalizer(
+    *interval_arrays(intervals),
+    *interval_arrays(results),
+    tz=client.tz,
+    time_unit=pd.Timedelta("1h"),
+    resolution=tag_freq,
+)
 
+# only proceed if there are intervals
+if not ser.empty:
     # Filter for timestamps and NaN values
     ser = (
         ser
@@ -95,7 +87,11 @@ if ser_list:
         .dropna()
     )
 
+    # Only keep the points needed to reconstruct the signal
+    ser = compress(ser, method=compression, tolerance=compression_tolerance)
+
     # To file
-    ser.to_csv(
+    write_csv(
+        ser,
         os.environ["OUTPUT_FILE"]
     )
@@ -1,11 +1,13 @@
 import os
-import pandas as pd
 import numpy as np
-from datetime import timedelta
-from scipy.integrate import cumulative_trapezoid
+import pandas as pd
 from trendminer import TrendMinerClient
-from trendminer.sdk.tag import TagCalculationOptions
-from trendminer.sdk.search import ValueBasedSearchOperators
+from custom_calculations.instrumentation import instrument
+from custom_calculations.output import write_csv
+from custom_calculations.state import IncrementalState
+from custom_calculations.timestamps import interval_arrays
+from custom_calculations.totalizers import RESET_OFFSET, get_adaptive_data, value_totalizer
+from custom_calculations.widening import freq_window
 
 # ---- PARAMETERS -----
 
@@ -15,11 +17,13 @@ client = TrendMinerClient.from_token(
     tz="Europe/Brussels",  # <--- SET TIMEZONE
 )
 
+# Record the time, API calls and memory use per stage when CUSTOM_CALCULATIONS_PROFILE is set
+client = instrument(client)
+
 # Frequency selection
 # https://pandas.pydata.org/docs/user_guide/timeseries.html#timeseries-offset-aliases
 # Daily: D | Weekly starting Monday: W-MON | Monthly: MS | Yearly: YS
 freq = "D"
-maximal_duration = client.time.timedelta("25h")  # the maximal possible duration of one interval
 
 # tag definition; this is the tag we will integrate
 tag_to_totalize = client.tag.get_by_name("[CS]BA:CONC.1")
@@ -27,6 +31,21 @@ tag_to_totalize = client.tag.get_by_name("[CS]BA:CONC.1")
 # Time unit the tag is expressed in; required to get correct totalizer values
 time_unit = client.time.timedelta("1h")  # here expressed in 'per hour'
 
+# Maximal integration error of the totals, in units of the tag times the time unit. When set, the data is first
+# fetched at a coarse resolution, and only refined to the 1m resolution where needed to stay within this error, which
+# transfers far fewer points for slowly changing signals. None fetches all data at 1m.
+max_error = None  # <-- e.g. 1.0
+
+# File in which the last settled running total of every index interval is stored (STATE_FILE, or the per-user cache
+# directory), so the next run continues from it rather than integrating the current interval from its start. Totals are
+# only stored once the data is at least `settle_time` old, and stored totals from the start of an index interval on are
+# dropped when it overlaps an already processed range (the range is indexed again).
+state = IncrementalState(
+    os.environ.get("STATE_FILE"),
+    settle_time="1h",
+)
+state_key = IncrementalState.key("incrementing_totalizer", [tag_to_totalize], freq, time_unit, script=__file__)
+
 # ---- CODE EXECUTION -----
 
 # Received index interval
@@ -34,38 +53,65 @@ index_interval = client.time.interval(
     os.environ["START_TIMESTAMP"],
     os.environ["END_TIMESTAMP"],
 )
+state.begin(state_key, index_interval.start, index_interval.end)
 
-# Get regular intervals. In this case we also have to look backwards.
+# Get the regular intervals overlapping the index interval. In this case we also have to look backwards, to the start
+# of the interval containing the start of the index interval.
+window = freq_window(client, index_interval, freq)
 intervals = client.time.interval.range(
     freq=freq,
-    start=index_interval.start - maximal_duration,
-    end=index_interval.end + maximal_duration,
+    start=window.start,
+    end=window.end,
     normalize=True,
 )
 
-# Generate a dataframe per interval
-ser_list = []
-for interval in intervals:
-    tag_data = tag_to_totalize.get_data(interval, resolution="1m")
-    if len(tag_data) <= 1:
-        continue
-    relative_index = tag_data.index - tag_data.index[0]
-    x_coordinate = relative_index.total_seconds() / time_unit.total_seconds()
-    total_values = cumulative_trapezoid(y=tag_data, x=x_coordinate)
-    total_values = np.insert(total_values, 0, 0)  # start values at 0
-
-    # Add 1ms to avoid duplicate timestamps
-    totals = pd.Series(
-        index=[tag_data.index[0] + timedelta(seconds=0.001)] + tag_data.index[1:].tolist(),
-        data=total_values,
+# Only the intervals ending in or after the index interval are needed
+interval_starts, interval_ends = interval_arrays(intervals)
+needed = interval_ends >= pd.Timestamp(index_interval.start).value
+interval_starts, interval_ends = interval_starts[needed], interval_ends[needed]
+
+# only proceed if there are intervals
+if len(interval_starts) > 0:
+    # Continue the interval containing the last stored running total from that total
+    data_starts = interval_starts.copy()
+    initial_totals = np.full(len(interval_starts), np.nan)
+    running = state.running(state_key, before=index_interval.start)
+    if running is not None:
+        resumed = (interval_starts == running.period_start) & (running.timestamp < interval_ends)
+        data_starts[resumed] = running.timestamp
+        initial_totals[resumed] = running.total
+
+    # Get the data for all intervals at once
+    tag_data = get_adaptive_data(
+        client,
+        tag_to_totalize,
+        start=pd.Timestamp(data_starts[0], tz="UTC"),
+        end=pd.Timestamp(interval_ends[-1], tz="UTC"),
+        resolution="1m",
+        tolerance=max_error,
+        time_unit=time_unit,
+        breakpoints=(data_starts, interval_ends),  # the totalizer resets at the interval boundaries
+    )
+
+    # Integrate per interval, starting from 0 at the start of every interval (or from the stored running total)
+    ser = value_totalizer(
+        tag_data,
+        data_starts,
+        interval_ends,
+        tz=client.tz,
+        time_unit=time_unit,
+        initial_totals=initial_totals,
     )
-    ser_list.append(totals)
 
-# only proceed if the list is not empty
-if ser_list:
-    # Concatenate the series
-    ser = pd.concat(ser_list)
-    ser.name = "value"
+    # Store the last settled running total up to the end of the index interval, for the next run. During live
+    # indexing the end of the index interval is more recent than `settle_time`, so that is an earlier total.
+    settled = min(pd.Timestamp(index_interval.end).value, state.settled())
+    totals = ser.loc[lambda x: x.index.asi8 <= settled]
+    if (not totals.empty) and not np.isnan(totals.iloc[-1]):
+        timestamp = totals.index[-1].value
+        i = np.searchsorted(interval_starts, timestamp, side="right") - 1
+        if (i >= 0) and (interval_starts[i] + RESET_OFFSET < timestamp < interval_ends[i]):
+            state.save_running(state_key, interval_starts[i], timestamp, totals.iloc[-1])
 
     # Filter for timestamps and NaN values
     ser = (
@@ -76,6 +122,9 @@ if ser_list:
     )
 
     # To file
-    ser.to_csv(
+    write_csv(
+        ser,
         os.environ["OUTPUT_FILE"]
-    )
\ No newline at end of file
+    )
+
+state.processed(state_key, index_interval.start, index_interval.end)
\ No newline at end of file
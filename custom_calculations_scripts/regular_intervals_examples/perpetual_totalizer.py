@@ -1,9 +1,10 @@
 import os
 import pandas as pd
-import numpy as np
-from scipy.integrate import cumulative_trapezoid
 from trendminer import TrendMinerClient
-from trendminer.sdk.tag import TagCalculationOptions
+from custom_calculations.checkpoints import CheckpointStore
+from custom_calculations.instrumentation import instrument
+from custom_calculations.output import write_csv
+from custom_calculations.totalizers import get_adaptive_data
 
 # Initialize client
 client = TrendMinerClient.from_token(
@@ -11,9 +12,13 @@ client = TrendMinerClient.from_token(
     tz="Europe/Brussels",  # <--- SET TIMEZONE
 )
 
+# Record the time, API calls and memory use per stage when CUSTOM_CALCULATIONS_PROFILE is set
+client = instrument(client)
+
 
 # tag definition; this is the tag we will integrate
-tag = client.tag.get_by_name("[CS]BA:CONC.1")  # <-- replace with your kW tag name
+tag_name = "[CS]BA:CONC.1"  # <-- replace with your kW tag name
+tag = client.tag.get_by_name(tag_name)
 
 # To get a correct integrated value, we need to know about the time unit of the tag.
 time_unit = client.time.timedelta("1h")
@@ -21,11 +26,28 @@ time_unit = client.time.timedelta("1h")
 # The start time from which we start integrating
 start_time = client.time.datetime("2025-01-01 00:00:00")
 
+# Resolution of the data we integrate over
+resolution = client.time.timedelta("1m")
+
+# Maximal integration error of the total, in units of the tag times the time unit. When set, the data is first fetched
+# at a coarse resolution, and only refined to the resolution above where needed to stay within this error, which
+# transfers far fewer points for slowly changing signals. None fetches all data at the resolution above.
+max_error = None  # <-- e.g. 1.0
+
+# File in which the running totals of previous index intervals are stored (by default in the per-user cache
+# directory), so we only need to integrate from the nearest earlier checkpoint rather than from the start time. Every
+# run stores the total at the start of its index interval, or at the last timestamp before it that is at least
+# `settle_time` old. When an interval is indexed again (e.g., because data arrived late), the checkpoints from its
+# start on are discarded.
+checkpoints = CheckpointStore(os.environ.get("CHECKPOINT_FILE"), settle_time="1h")
+checkpoint_key = CheckpointStore.key(tag, start_time, time_unit, resolution)
+
 # Received index interval
 index_interval = client.time.interval(
     os.environ["START_TIMESTAMP"],
     os.environ["END_TIMESTAMP"],
 )
+checkpoints.begin(checkpoint_key, index_interval.start, index_interval.end)
 
 # If the index interval is completely before the start_time, return zeros
 if index_interval.end <= start_time:
@@ -35,20 +57,42 @@ if index_interval.end <= start_time:
     )
 
 else:
+    # Only imported when there is data to integrate, so index intervals before the start time return quickly
+    import numpy as np
 
     # Special consideration for the start value falling in the index interval
     if index_interval.start >= start_time:
-        aggregation_interval = client.time.interval(
-            start_time,
-            index_interval.start,
-        )
+        from trendminer.sdk.tag import TagCalculationOptions
+
+        # Start from the nearest earlier checkpoint, or from the start time if there is none
+        checkpoint = checkpoints.latest(checkpoint_key, before=index_interval.start)
+        if (checkpoint is None) or (checkpoint[0] < start_time):
+            checkpoint = (start_time, 0)
+
+        # During live indexing the start of the index interval is not settled yet, so the integral is split at the
+        # last settled timestamp, where the running total can be stored as a checkpoint for later runs
+        settled = pd.Timestamp(checkpoints.settled(), tz="UTC").floor(resolution).tz_convert(index_interval.start.tz)
+        boundaries = [checkpoint[0], index_interval.start]
+        if checkpoint[0] < settled < index_interval.start:
+            boundaries.insert(1, settled)
+        aggregation_intervals = [
+            client.time.interval(interval_start, interval_end)
+            for interval_start, interval_end in zip(boundaries[:-1], boundaries[1:])
+        ]
 
         aggregation_correction = client.time.timedelta("24h")/time_unit
-        start_value = tag.calculate(
-            intervals=[aggregation_interval],
-            operation=TagCalculationOptions.INTEGRAL,
-            key="total",
-        )[0]["total"]*aggregation_correction
+        totals = checkpoint[1] + np.cumsum([
+            result["total"] for result in tag.calculate(
+                intervals=aggregation_intervals,
+                operation=TagCalculationOptions.INTEGRAL,
+                key="total",
+            )
+        ])*aggregation_correction
+        start_value = totals[-1]
+
+        # Only settled checkpoints are stored
+        for timestamp, total in zip(boundaries[1:], totals):
+            checkpoints.save(checkpoint_key, timestamp, total)
 
         data_interval = index_interval
     else:
@@ -58,12 +102,22 @@ else:
         )
         start_value = 0
 
-    resolution = client.time.timedelta("1m")
-    trapezoid_correction = resolution/time_unit
-    tag_data = tag.get_data(data_interval, resolution=resolution)
+    tag_data = get_adaptive_data(
+        client,
+        tag,
+        start=data_interval.start,
+        end=data_interval.end,
+        resolution=resolution,
+        tolerance=max_error,
+        time_unit=time_unit,
+    )
     if tag_data.empty:
         quit()
-    data = np.insert(cumulative_trapezoid(y=tag_data), 0, 0)*trapezoid_correction + start_value
+    # Cumulative trapezoidal integral (numpy only, so scipy does not need to be imported); the steps between the data
+    # points are not all equal when the data is only refined where needed
+    values = tag_data.to_numpy(dtype=float)
+    steps = np.diff(tag_data.index.as_unit("ns").asi8)/pd.Timedelta(time_unit).value
+    data = np.concatenate([[0], np.cumsum(steps*(values[1:] + values[:-1])/2)]) + start_value
     ser = pd.Series(
         index=tag_data.index,
         data=data,
@@ -76,9 +130,11 @@ ser = (
     .loc[lambda x: x.index < index_interval.end]
     .dropna()
 )
+checkpoints.processed(checkpoint_key, index_interval.start, index_interval.end)
 
 # To file
 if not ser.empty:
-    ser.to_csv(
+    write_csv(
+        ser,
         os.environ["OUTPUT_FILE"]
     )
\ No newline at end of file
@@ -1,8 +1,10 @@
 import os
-import pandas as pd
 from trendminer import TrendMinerClient
-from trendminer.sdk.tag import TagCalculationOptions
 from trendminer.sdk.search import ValueBasedSearchOperators, SearchCalculationOptions
+from custom_calculations.frames import IntervalFrame
+from custom_calculations.instrumentation import instrument
+from custom_calculations.output import write_csv
+from custom_calculations.widening import widened_results
 
 # ---- PARAMETERS -----
 
@@ -12,6 +14,9 @@ client = TrendMinerClient.from_token(
     tz="Europe/Brussels",  # <--- SET TIMEZONE
 )
 
+# Record the time, API calls and memory use per stage when CUSTOM_CALCULATIONS_PROFILE is set
+client = instrument(client)
+
 # default value to return to between results
 default_value = 0
 
@@ -21,11 +26,12 @@ tag2 = client.tag.get_by_name("[CS]BA:LEVEL.1")
 tag3 = client.tag.get_by_name("TM_day_Europe_Brussels")
 
 # search definition
+search_duration = client.time.timedelta("23h")
 search = client.search.value(
     queries=[
         (tag3, ValueBasedSearchOperators.IN_SET, ["Monday", "Wednesday", "Friday"])
     ],
-    duration="23h",
+    duration=search_duration,
     calculations={
         "calc1": (tag1, SearchCalculationOptions.MAXIMUM),
         # MEAN, MINIMUM, MAXIMUM, RANGE, START, END, DELTA, INTEGRAL, STDEV
@@ -36,15 +42,15 @@ search = client.search.value(
 # maximal search result duration
 maximal_duration = client.time.timedelta("25h")
 
+# Margin around the index interval for the search, at least the minimal search result duration. It is doubled (up to
+# the maximal search result duration) only while a search result at the edge of the searched window might be cut off.
+minimal_margin = client.time.timedelta("1h")
+
 
-# additional custom operation on search calculations
-def calculate(intervals):
-    for interval in intervals:
-        # Account for potential missing calculations
-        try:
-            interval["result"] = interval["calc1"] * interval["calc2"]
-        except (TypeError, KeyError):
-            interval["result"] = None
+# additional custom operation on search calculations, on all results at once. Missing calculations are NaN, so they
+# give a NaN result.
+def calculate(frame):
+    frame["result"] = frame["calc1"] * frame["calc2"]
 
 
 # ---- CODE EXECUTION -----
@@ -55,34 +61,28 @@ index_interval = client.time.interval(
     os.environ["END_TIMESTAMP"],
 )
 
-# Widen interval
-search_interval = client.time.interval(
-    index_interval.start - maximal_duration,
-    index_interval.end + maximal_duration,
+# Get search results, widening the searched window only as far as needed for complete results at its edges
+intervals, search_interval = widened_results(
+    client,
+    search.get_results,
+    index_interval,
+    margin=minimal_margin,
+    cap=maximal_duration,
+    min_duration=search_duration,
 )
 
-# Get results
-intervals = search.get_results(search_interval)
-
 # Remove open-ended result
 if (len(intervals) > 0) and ((search_interval.end - intervals[-1].end) < client.resolution):
     intervals.pop(-1)
 
+# Put the results and their calculations in columns
+frame = IntervalFrame.from_intervals(intervals, tz=client.tz, keys=["calc1", "calc2"])
+
 # Perform the calculation
-calculate(intervals)
-
-# Put the results in a Series
-ser = pd.Series(
-    name="value",
-    index=[
-        timestamp for interval in intervals
-        for timestamp in (interval.start, interval.end)
-    ],
-    data=[
-        value for interval in intervals
-        for value in (interval["result"], default_value)
-    ],
-)
+calculate(frame)
+
+# Put the results in a Series: the result during every search result, and the default value after it
+ser = frame.step_series("result", default=default_value, name="value")
 
 # Filter for timestamps and NaN values
 ser = (
@@ -93,6 +93,7 @@ ser = (
 )
 
 # To file
-ser.to_csv(
+write_csv(
+    ser,
     os.environ["OUTPUT_FILE"]
 )
\ No newline at end of file
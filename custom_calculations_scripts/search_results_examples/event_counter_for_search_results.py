@@ -1,8 +1,12 @@
 import os
 import pandas as pd
 from trendminer import TrendMinerClient
-from trendminer.sdk.tag import TagCalculationOptions
 from trendminer.sdk.search import ValueBasedSearchOperators
+from custom_calculations.counting import count_events
+from custom_calculations.instrumentation import instrument
+from custom_calculations.output import write_csv
+from custom_calculations.timestamps import interval_arrays
+from custom_calculations.widening import widened_results
 
 
 # ---- PARAMETERS -----
@@ -13,6 +17,9 @@ client = TrendMinerClient.from_token(
     tz="Europe/Brussels",  # <--- SET TIMEZONE
 )
 
+# Record the time, API calls and memory use per stage when CUSTOM_CALCULATIONS_PROFILE is set
+client = instrument(client)
+
 # default value to return to between results
 default_value = 0
 
@@ -22,11 +29,12 @@ tag2 = client.tag.get_by_name("[CS]BA:ACTIVE.1")
 
 
 # Base search definition
+search_duration = client.time.timedelta("23h")
 search = client.search.value(
     queries=[
         (tag1, ValueBasedSearchOperators.IN_SET, ["Monday", "Wednesday", "Friday"])
     ],
-    duration="23h",
+    duration=search_duration,
 )
 
 # event search definition
@@ -41,6 +49,10 @@ event_search = client.search.value(
 # maximal search result duration over both searches
 maximal_duration = client.time.timedelta("25h")
 
+# Margin around the index interval for the search, at least the minimal search result duration. It is doubled (up to
+# the maximal search result duration) only while a search result at the edge of the searched window might be cut off.
+minimal_margin = client.time.timedelta("1h")
+
 # ---- CODE EXECUTION -----
 
 # Received index interval
@@ -49,29 +61,29 @@ index_interval = client.time.interval(
     os.environ["END_TIMESTAMP"],
 )
 
-# Widen interval
-search_interval = client.time.interval(
-    index_interval.start - maximal_duration,
-    index_interval.end + maximal_duration,
+# Get the base search results, widening the searched window only as far as needed for complete results at its
+# edges
+intervals, search_interval = widened_results(
+    client,
+    search.get_results,
+    index_interval,
+    margin=minimal_margin,
+    cap=maximal_duration,
+    min_duration=search_duration,
 )
 
-# Get base search results
-intervals = search.get_results(search_interval)
+# Get the event results over the same window
+results = event_search.get_results(search_interval)
 
 # Remove open-ended result
 if (len(intervals) > 0) and ((search_interval.end - intervals[-1].end) < client.resolution):
     intervals.pop(-1)
 
-# Get event restults
-results = event_search.get_results(search_interval)
-
-# Count number of results that start in each regular interval
-for interval in intervals:
-    interval["count"] = sum([
-        1 for result in results
-        if (interval.start <= result.start)
-        and (result.start < interval.end)
-    ])
+# Count number of results that start in each base search result
+counts = count_events(
+    *interval_arrays(intervals),
+    *interval_arrays(results),
+)
 
 # Put the results in a Series
 ser = pd.Series(
@@ -81,8 +93,8 @@ ser = pd.Series(
         for timestamp in (interval.start, interval.end)
     ],
     data=[
-        value for interval in intervals
-        for value in (interval["count"], default_value)
+        value for count in counts.count
+        for value in (count, default_value)
     ],
 )
 
@@ -95,6 +107,7 @@ ser = (
 )
 
 # To file
-ser.to_csv(
+write_csv(
+    ser,
     os.environ["OUTPUT_FILE"]
 )
\ No newline at end of file
@@ -1,8 +1,14 @@
 # Put a value of 1 when a value-based search is True, but ignore gaps between results which are shorter than a given threshold
 import os
+import numpy as np
 import pandas as pd
 from trendminer import TrendMinerClient
 from trendminer.sdk.search import ValueBasedSearchOperators
+from custom_calculations.instrumentation import instrument
+from custom_calculations.intervals import merge_gaps
+from custom_calculations.output import write_csv
+from custom_calculations.timestamps import interval_arrays, to_index
+from custom_calculations.widening import widened_results
 
 
 # Initialize client
@@ -11,6 +17,9 @@ client = TrendMinerClient.from_token(
     tz="Europe/Brussels",  # <--- SET TIMEZONE
 )
 
+# Record the time, API calls and memory use per stage when CUSTOM_CALCULATIONS_PROFILE is set
+client = instrument(client)
+
 # tag definition; add these as dependencies!
 tag1 = client.tag.get_by_name("TM5-HEX-PI06201")
 
@@ -20,6 +29,11 @@ max_ignored_gap = pd.Timedelta(minutes=5)
 # Estimated maximal duration of a search result to make sure we get complete results
 maximal_duration = pd.Timedelta(days=1)
 
+# Margin around the index interval for the search, at least the minimal search result duration. It is doubled (up to
+# the maximal search result duration plus the gap size) only while a search result at the edge of the searched window
+# might be cut off, or might be followed by a short gap and another result outside the window.
+minimal_margin = pd.Timedelta(hours=1)
+
 # search definition
 search_duration = pd.Timedelta(minutes=5)
 search = client.search.value(
@@ -38,41 +52,33 @@ index_interval = client.time.interval(
     os.environ["END_TIMESTAMP"],
 )
 
-# Widen interval. Accounting for gap size and maximal search result duration
-search_interval = client.time.interval(
-    index_interval.start - max_ignored_gap - maximal_duration,
-    index_interval.end + max_ignored_gap + maximal_duration,
+# Get results, widening the searched window only as far as needed. Accounting for gap size and maximal search result
+# duration
+intervals, search_interval = widened_results(
+    client,
+    search.get_results,
+    index_interval,
+    margin=minimal_margin,
+    cap=max_ignored_gap + maximal_duration,
+    min_duration=search_duration,
+    clearance=max_ignored_gap + search_duration + client.resolution,
 )
 
-# Get results
-intervals = search.get_results(search_interval)
-
 # Remove open-ended result
 if (len(intervals) > 0) and ((search_interval.end - intervals[-1].end) < client.resolution):
     intervals.pop(-1)
 
-# Put the results in a Series; 1 on result start, 0 on result end
+# Join the results separated by short gaps
+starts, ends = interval_arrays(intervals)
+starts, ends = merge_gaps(starts, ends, max_gap=max_ignored_gap)
+
+# Put the joined results in a Series; 1 on result start, 0 on result end
 ser = pd.Series(
     name="value",
-    index=[
-        timestamp for interval in intervals
-        for timestamp in (interval.start, interval.end)
-    ],
-    data=[
-        value for _ in intervals
-        for value in (1, 0)
-    ],
-)
-
-# Filter out the short gaps
-is_short_gap = (
-    (ser == 0)  # end of search result
-    & (-ser.index.diff(-1) <= max_ignored_gap)  # and short time to next search result
+    index=to_index(np.column_stack([starts, ends]).ravel(), client.tz),
+    data=np.tile([1, 0], len(starts)),
 )
 
-# Remove the short gaps
-ser = ser[~is_short_gap]
-
 # Filter for timestamps
 ser = (
     ser
@@ -82,6 +88,7 @@ ser = (
 
 # To file
 if not ser.empty:
-    ser.to_csv(
+    write_csv(
+        ser,
         os.environ["OUTPUT_FILE"]
     )
@@ -2,6 +2,11 @@ import os
 import pandas as pd
 from trendminer import TrendMinerClient
 from trendminer.sdk.search import ValueBasedSearchOperators
+from custom_calculations.counting import incrementing_counter
+from custom_calculations.instrumentation import instrument
+from custom_calculations.output import write_csv
+from custom_calculations.timestamps import interval_arrays
+from custom_calculations.widening import widened_results
 
 # ---- PARAMETERS -----
 
@@ -11,6 +16,9 @@ client = TrendMinerClient.from_token(
     tz="Europe/Brussels",  # <--- SET TIMEZONE
 )
 
+# Record the time, API calls and memory use per stage when CUSTOM_CALCULATIONS_PROFILE is set
+client = instrument(client)
+
 # default value to return to between results
 default_value = 0
 
@@ -19,11 +27,12 @@ tag1 = client.tag.get_by_name("TM_day_Europe_Brussels")
 tag2 = client.tag.get_by_name("[CS]BA:ACTIVE.1")
 
 # Base search definition
+search_duration = client.time.timedelta("23h")
 search = client.search.value(
     queries=[
         (tag1, ValueBasedSearchOperators.IN_SET, ["Monday", "Wednesday", "Friday"])
     ],
-    duration="23h",
+    duration=search_duration,
 )
 
 # event search definition
@@ -38,6 +47,10 @@ event_search = client.search.value(
 # maximal search result duration over both searches
 maximal_duration = client.time.timedelta("25h")
 
+# Margin around the index interval for the search, at least the minimal search result duration. It is doubled (up to
+# the maximal search result duration) only while a search result at the edge of the searched window might be cut off.
+minimal_margin = client.time.timedelta("1h")
+
 # ---- CODE EXECUTION -----
 
 # Received index interval
@@ -46,68 +59,35 @@ index_interval = client.time.interval(
     os.environ["END_TIMESTAMP"],
 )
 
-# Widen interval
-search_interval = client.time.interval(
-    index_interval.start - maximal_duration,
-    index_interval.end + maximal_duration,
+# Get the base search results, widening the searched window only as far as needed for complete results at its
+# edges
+intervals, search_interval = widened_results(
+    client,
+    search.get_results,
+    index_interval,
+    margin=minimal_margin,
+    cap=maximal_duration,
+    min_duration=search_duration,
 )
 
-# Get base search results
-intervals = search.get_results(search_interval)
+# Get the event results over the same window
+results = event_search.get_results(search_interval)
 
 # Remove open-ended result
 if (len(intervals) > 0) and ((search_interval.end - intervals[-1].end) < client.resolution):
     intervals.pop(-1)
 
-# Get event restults
-results = event_search.get_results(search_interval)
-
-# Generate a dataframe per base search result
-ser_list = []
-for interval in intervals:
-
-    interval_results = [
-        result for result in results
-        if (interval.start <= result.start)
-           and (result.start < interval.end)
-    ]
-
-    interval_ser = pd.Series(
-        index=[result.start for result in interval_results],
-        data=1,
-    ).cumsum()
-
-    # start at 0 unless first result starts at interval start
-    if (len(interval_results) == 0) or (interval_results[0].start != interval.start):
-        interval_ser = pd.concat(
-            [
-                pd.Series(
-                    index=[interval.start],
-                    data=[0],
-                ),
-                interval_ser,
-            ]
-        )
-
-    # Reset to default value after the event
-    interval_ser = pd.concat(
-        [
-            interval_ser,
-            pd.Series(
-                index=[interval.end],
-                data=[default_value],
-            )
-        ]
-    )
-
-    ser_list.append(interval_ser)
-
-# only proceed if the list is not empty
-if ser_list:
-    # Concatenate the series
-    ser = pd.concat(ser_list)
-    ser.name = "value"
+# Build the counter for all base search results at once; it starts at 0, increments at the start of every event
+# result and resets to the default value after the base search result
+ser = incrementing_counter(
+    *interval_arrays(intervals),
+    interval_arrays(results)[0],
+    tz=client.tz,
+    default_value=default_value,
+)
 
+# only proceed if there are base search results
+if not ser.empty:
     # Filter for timestamps and NaN values
     ser = (
         ser
@@ -117,6 +97,7 @@ if ser_list:
     )
 
     # To file
-    ser.to_csv(
+    write_csv(
+        ser,
         os.environ["OUTPUT_FILE"]
     )
\ No newline at end of file
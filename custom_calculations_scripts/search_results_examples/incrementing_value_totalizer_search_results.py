@@ -1,10 +1,12 @@
 import os
 import pandas as pd
-import numpy as np
-from datetime import timedelta
-from scipy.integrate import cumulative_trapezoid
 from trendminer import TrendMinerClient
 from trendminer.sdk.search import ValueBasedSearchOperators
+from custom_calculations.instrumentation import instrument
+from custom_calculations.output import write_csv
+from custom_calculations.timestamps import interval_arrays
+from custom_calculations.totalizers import get_adaptive_data, value_totalizer
+from custom_calculations.widening import widened_results
 
 # ---- PARAMETERS -----
 
@@ -14,6 +16,9 @@ client = TrendMinerClient.from_token(
     tz="Europe/Brussels",  # <--- SET TIMEZONE
 )
 
+# Record the time, API calls and memory use per stage when CUSTOM_CALCULATIONS_PROFILE is set
+client = instrument(client)
+
 # default value to return to between results
 default_value = 0
 
@@ -25,17 +30,27 @@ tag_to_totalize = client.tag.get_by_name("[CS]BA:CONC.1")
 # Time unit the tag is expressed in; required to get correct totalizer values
 time_unit = client.time.timedelta("1h")  # here expressed in 'per hour'
 
+# Maximal integration error of the totals, in units of the tag times the time unit. When set, the data is first
+# fetched at a coarse resolution, and only refined to the 1m resolution where needed to stay within this error, which
+# transfers far fewer points for slowly changing signals. None fetches all data at 1m.
+max_error = None  # <-- e.g. 1.0
+
 # Base search definition
+search_duration = client.time.timedelta("2m")
 search = client.search.value(
     queries=[
         (tag1, ValueBasedSearchOperators.IN_SET, ["Monday", "Wednesday", "Friday"])
     ],
-    duration="2m",
+    duration=search_duration,
 )
 
 # maximal search result duration
 maximal_duration = client.time.timedelta("25h")
 
+# Margin around the index interval for the search, at least the minimal search result duration. It is doubled (up to
+# the maximal search result duration) only while a search result at the edge of the searched window might be cut off.
+minimal_margin = client.time.timedelta("1h")
+
 # ---- CODE EXECUTION -----
 
 # Received index interval
@@ -44,48 +59,38 @@ index_interval = client.time.interval(
     os.environ["END_TIMESTAMP"],
 )
 
-# Widen interval
-search_interval = client.time.interval(
-    index_interval.start - maximal_duration,
-    index_interval.end + maximal_duration,
+# Get search results, widening the searched window only as far as needed for complete results at its edges
+intervals, search_interval = widened_results(
+    client,
+    search.get_results,
+    index_interval,
+    margin=minimal_margin,
+    cap=maximal_duration,
+    min_duration=search_duration,
 )
 
-# Get search results
-intervals = search.get_results(search_interval)
-
-# Generate a dataframe per interval
-ser_list = []
-for interval in intervals:
-    tag_data = tag_to_totalize.get_data(interval, resolution="1m")
-    if len(tag_data) <= 1:
-        continue
-    relative_index = tag_data.index - tag_data.index[0]
-    x_coordinate = relative_index.total_seconds() / time_unit.total_seconds()
-    total_values = cumulative_trapezoid(y=tag_data, x=x_coordinate)
-    total_values = np.insert(total_values, 0, 0)  # start values at 0
-
-    # Add 1ms to avoid duplicate timestamps
-    totals = pd.Series(
-        index=[tag_data.index[0] + timedelta(seconds=0.001)] + tag_data.index[1:].tolist(),
-        data=total_values,
+# only proceed if there are search results
+if len(intervals) > 0:
+    # Get the data for all search results at once
+    tag_data = get_adaptive_data(
+        client,
+        tag_to_totalize,
+        start=intervals[0].start,
+        end=intervals[-1].end,
+        resolution="1m",
+        tolerance=max_error,
+        time_unit=time_unit,
+        breakpoints=interval_arrays(intervals),  # the totalizer restarts at every search result
     )
 
-    # Return to default value in between search results; only for completed results
-    if (default_value is not None) and (interval.end < index_interval.end):
-        totals = pd.concat(
-            [
-                totals,
-                pd.Series(index=[interval.end + timedelta(seconds=0.001)], data=[default_value])
-            ]
-        )
-
-    ser_list.append(totals)
-
-# only proceed if the list is not empty
-if ser_list:
-    # Concatenate the series
-    ser = pd.concat(ser_list)
-    ser.name = "value"
+    # Integrate per search result, starting from 0 at the start of every search result
+    ser = value_totalizer(
+        tag_data,
+        *interval_arrays(intervals),
+        tz=client.tz,
+        time_unit=time_unit,
+        default_value=default_value,  # return to default value after completed search results
+    )
 
     # Filter for timestamps and NaN values
     ser = (
@@ -95,7 +100,11 @@ if ser_list:
         .dropna()
     )
 
-    # To file
-    ser.to_csv(
-        os.environ["OUTPUT_FILE"]
-    )
\ No newline at end of file
+else:
+    ser = pd.Series(index=pd.DatetimeIndex([], tz=client.tz), dtype=float, name="value")
+
+# To file; an index interval without totals gives a file with only the header
+write_csv(
+    ser,
+    os.environ["OUTPUT_FILE"]
+)